@@ -1,11 +1,19 @@
 import streamlit as st
-import pandas as pd
 from datetime import datetime
 import os
+import json
+import functools
 import database as db
-import ocr_helper
 from styles import apply_custom_styles, render_metric_card
 
+# Heavy modules are imported where they are first needed so the login page
+# (every new session's first paint) never loads them:
+#   pandas     -> after login
+#   forecast   -> dashboard (NumPy)
+#   ocr_worker -> when OCR runs inside the page (PIL, google-genai)
+#   io/openpyxl -> data management page
+# bench_startup.py enforces the cold-start budget.
+
 st.set_page_config(
     page_title="MyCatalog - 스마트 물품 관리",
     page_icon="📦",
@@ -13,8 +21,8 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Initialize database
-db.init_db()
+# Initialize the auth database (the tenant DB is opened after login)
+db.ensure_db(db.auth_db_path())
 os.makedirs("uploads", exist_ok=True)
 
 # Apply Custom CSS
@@ -27,16 +35,29 @@ if 'user_id' not in st.session_state:
     st.session_state.user_id = None
 if 'username' not in st.session_state:
     st.session_state.username = None
+if 'db_path' not in st.session_state:
+    st.session_state.db_path = None
+
+def clear_session():
+    # Everything else in session_state belongs to the household that was logged
+    # in (grid snapshots, OCR jobs, image hashes, form values): none of it may
+    # reach the next user's pages or be saved into their DB
+    for key in list(st.session_state.keys()):
+        del st.session_state[key]
 
-def login_user(id, username):
+def login_user(user):
+    clear_session()
     st.session_state.logged_in = True
-    st.session_state.user_id = id
-    st.session_state.username = username
+    st.session_state.user_id = user.id
+    st.session_state.username = user.username
+    st.session_state.db_path = db.user_db_path(user)
 
 def logout_user():
+    clear_session()
     st.session_state.logged_in = False
     st.session_state.user_id = None
     st.session_state.username = None
+    st.session_state.db_path = None
     st.rerun()
 
 # 🔑 Auth Screen
@@ -57,84 +78,172 @@ if not st.session_state.logged_in:
             if st.form_submit_button("로그인"):
                 user = db.authenticate_user(login_un, login_pw)
                 if user:
-                    login_user(user[0], user[1])
-                    st.success(f"{user[1]}님, 환영합니다!")
+                    login_user(user)
+                    st.success(f"{user.username}님, 환영합니다!")
                     st.rerun()
                 else:
                     st.error("아이디 또는 비밀번호가 일치하지 않습니다.")
     st.stop()
 
 # --- Main Application Area (Authenticated) ---
+# Route every db call of this rerun to the household's database
+if st.session_state.db_path is None:
+    logout_user()  # session from before per-household databases
+db.set_current_db(st.session_state.db_path)
+db.ensure_db()
+import pandas as pd
+
 # Sidebar Navigation
 st.sidebar.title(f"👤 {st.session_state.username}님")
 if st.sidebar.button("로그아웃"):
     logout_user()
 
 st.sidebar.divider()
-menu_options = ["대시보드", "물품 관리", "카테고리 설정", "영수증 관리", "알림 센터"]
+menu_options = ["대시보드", "물품 관리", "카테고리 설정", "영수증 관리", "지출 분석", "알림 센터"]
 if st.session_state.username == "skpark":
     menu_options.append("회원 관리")
     menu_options.append("데이터 관리")
+    menu_options.append("OCR 사용량")
+    menu_options.append("DB 상태")
 
 menu = st.sidebar.selectbox("메뉴 선택", menu_options)
 
 # Helper: Get all items with location info
 def get_all_items_with_info():
-    items = db.get_items()
-    locations = {loc[0]: (loc[1], loc[2]) for loc in db.get_locations()} # id: (name, cat)
-    data = []
-    for itm in items:
-        # User requirement: If location is None/deleted, show "없음(대분류 최상위)"
-        loc_id = itm[6]
-        if loc_id and loc_id in locations:
-            loc_info = locations[loc_id]
-        else:
-            loc_info = ("없음(대분류 최상위)", "기타")
-            
-        data.append({
-            "id": itm[0],
-            "name": itm[1],
-            "purchase_date": itm[2],
-            "expiry_date": itm[3],
-            "quantity": itm[4],
-            "notes": itm[5],
-            "location_id": itm[6], # Added this line
-            "location_name": loc_info[0],
-            "category": loc_info[1]
-        })
-    return pd.DataFrame(data)
+    # Columnar fetch straight into a DataFrame; location info is mapped per column
+    df = pd.DataFrame(db.get_items_columnar())
+    if df.empty:
+        return df
+    locations = db.get_locations()
+    # User requirement: If location is None/deleted, show "없음(대분류 최상위)"
+    df["location_name"] = df["location_id"].map({loc.id: loc.name for loc in locations}).fillna("없음(대분류 최상위)")
+    df["category"] = df["location_id"].map({loc.id: loc.category for loc in locations}).fillna("기타")
+    return df
+
+# Helper: Diff an edited grid against the snapshot it was loaded from
+def diff_grid(original_df, edited_df, columns):
+    """
+    Compares rows by id and returns a list of update dicts holding only the
+    changed columns plus 'id' and the snapshot 'version'.
+    """
+    def norm(v):
+        return None if pd.isna(v) else v
+
+    original = original_df.set_index('id')
+    updates = []
+    for _, row in edited_df.iterrows():
+        before = original.loc[row['id']]
+        changed = {c: norm(row[c]) for c in columns if norm(row[c]) != norm(before[c])}
+        if changed:
+            changed['id'] = int(row['id'])
+            changed['version'] = int(before['version'])
+            updates.append(changed)
+    return updates
+
+def reset_grid(key):
+    # Drop the snapshot so the next rerun reloads fresh rows into the editor
+    st.session_state.pop(f"{key}_snapshot", None)
+    st.session_state[f"{key}_gen"] = st.session_state.get(f"{key}_gen", 0) + 1
+
+def finish_grid_save(key, ok, message):
+    # Committed or not, the grid reloads: after a conflict it shows the other
+    # session's rows instead of the stale versions that cannot be saved
+    reset_grid(key)
+    st.session_state[f"{key}_result"] = (ok, message)
+    st.rerun()
+
+def show_grid_result(key):
+    ok, message = st.session_state.pop(f"{key}_result", (True, None))
+    if message:
+        (st.success if ok else st.error)(message)
+
+def coerce_grid_dates(df, columns):
+    """
+    Parses the date `columns` with errors='coerce'. Returns (df with dates,
+    ids of the rows holding a value that is not a date); those cells are empty.
+    """
+    df = df.copy()
+    bad = set()
+    for c in columns:
+        parsed = pd.to_datetime(df[c], errors='coerce', format='mixed')
+        given = df[c].notna() & (df[c].astype(str).str.strip() != '')
+        bad.update(int(i) for i in df.loc[given & parsed.isna(), 'id'])
+        df[c] = parsed.dt.date
+    return df, sorted(bad)
+
+# Helper: partial reruns. A widget inside a fragment reruns only that function,
+# so each panel loads its own data instead of relying on the page's queries.
+def fragment(fn=None, *, run_every=None):
+    if fn is None:
+        return functools.partial(fragment, run_every=run_every)
+    @functools.wraps(fn)
+    def routed(*args, **kwargs):
+        # A fragment rerun skips the top of the script, where db calls are routed
+        db.set_current_db(st.session_state.db_path)
+        return fn(*args, **kwargs)
+    return st.fragment(routed, run_every=run_every)
+
+def rerun_with_message(message, balloons=False):
+    # Writes inside a fragment rerun the whole page so the other panels see them;
+    # the message is shown by show_message() after that rerun
+    st.session_state['flash_message'] = (message, balloons)
+    st.rerun()
+
+def show_message():
+    message, balloons = st.session_state.pop('flash_message', (None, False))
+    if message:
+        st.success(message)
+        if balloons:
+            st.balloons()
+
+# Helper: OCR runs as a job in ocr_jobs (see ocr_worker.py); the receipt form
+# reads its results from these session keys
+OCR_KEYS = ['ocr_text', 'ocr_store', 'ocr_address', 'ocr_amount', 'ocr_sales', 'ocr_date', 'ocr_card',
+            'ocr_card_num', 'ocr_vat', 'ocr_lines', 'ocr_job_id', 'ocr_result_job', 'ocr_image_path']
+OCR_POLL_SECONDS = 2
+OCR_WORKER_HINT_SECONDS = 10  # queued this long: probably no worker is running
+
+def load_ocr_result(job):
+    result = json.loads(job.result)
+    info = result['info']
+    st.session_state['ocr_text'] = result['text']
+    st.session_state['ocr_store'] = info.get('store_name', '')
+    st.session_state['ocr_address'] = info.get('store_address', '')
+    st.session_state['ocr_amount'] = info.get('total_amount', 0.0)
+    st.session_state['ocr_sales'] = info.get('sales_amount', 0.0)
+    st.session_state['ocr_date'] = info.get('use_date')
+    st.session_state['ocr_card'] = info.get('card_type', '')
+    st.session_state['ocr_card_num'] = info.get('card_number', '')
+    st.session_state['ocr_vat'] = info.get('vat', 0.0)
+    st.session_state['ocr_lines'] = info.get('lines', [])
+    st.session_state['ocr_result_job'] = job.id
+    st.session_state['ocr_image_path'] = job.image_path
+
+# Helper: free-text name input with autocomplete (most used names first).
+# The selectbox filters the suggestions as the user types and accepts new names.
+AUTOCOMPLETE_LIMIT = 200
+
+def name_input(label, kind, value=None, key=None):
+    options = db.suggest_names(kind, limit=AUTOCOMPLETE_LIMIT)
+    if value:
+        # Known spellings of a prefilled (OCR) value come first
+        similar = db.suggest_names(kind, value)
+        options = list(dict.fromkeys([value] + similar + options))
+    # Without a key the widget identity includes the options, so a name typed
+    # after the suggestions changed (another member added one) would be dropped.
+    # A new prefill value still starts a fresh widget.
+    key = key or f"name_input_{kind}_{value or ''}"
+    return st.selectbox(label, options=options, index=0 if value else None, key=key,
+                        accept_new_options=True, placeholder="입력하거나 목록에서 선택")
 
 if menu == "대시보드":
     st.title("🏡 My Home Dashboard")
     st.write(f"오늘 날짜: {datetime.now().strftime('%Y-%m-%d')}")
     
-    df = get_all_items_with_info()
-    
-    if not df.empty:
-        today = datetime.now().date()
-        df['expiry_date'] = pd.to_datetime(df['expiry_date']).dt.date
-        
     st.title("📊 대시보드")
     
-    # ... (Rest of Dashboard code remains mostly same, just ensuring data consistency)
-    items = get_all_items_with_info() 
-    # Use the local function
-    
-    total_items = len(items)
-    
-    # Calculate expiry statuses
-    today = datetime.now().date()
-    expired_count = 0
-    imminent_count = 0
-    
-    if not items.empty:
-        for index, row in items.iterrows():
-            exp_date = datetime.strptime(row['expiry_date'], '%Y-%m-%d').date()
-            diff = (exp_date - today).days
-            if diff < 0:
-                expired_count += 1
-            elif diff <= 7:
-                imminent_count += 1
+    # Counts come from index range scans on items.expiry_day; no per-row date parsing
+    total_items, expired_count, imminent_count = db.get_expiry_counts(days=7)
     
     col1, col2, col3 = st.columns(3)
     with col1:
@@ -146,145 +255,290 @@ if menu == "대시보드":
     
     st.divider()
     
-    if not items.empty:
+    if total_items:
         st.subheader("📦 카테고리별 현황")
-        cat_counts = items['category'].value_counts()
+        cat_counts = pd.Series(dict(db.get_category_counts()), name="count")
         st.bar_chart(cat_counts)
 
         # List of imminent/expired items
         st.subheader("🔔 주의가 필요한 물품")
-        items['expiry_date_dt'] = pd.to_datetime(items['expiry_date']).dt.date
-        expired_df = items[items['expiry_date_dt'] < today]
-        imminent_df = items[(items['expiry_date_dt'] >= today) & (items['expiry_date_dt'] <= today + pd.Timedelta(days=7))]
+        alert_items = db.get_items_expiring(days=7)
         
-        if not imminent_df.empty or not expired_df.empty:
-            alert_df = pd.concat([expired_df, imminent_df])
-            st.dataframe(alert_df[["name", "expiry_date", "location_name", "category"]].sort_values("expiry_date"), use_container_width=True)
+        if alert_items:
+            locations = {loc.id: loc for loc in db.get_locations()}
+            alert_df = pd.DataFrame([{
+                "name": itm.name,
+                "expiry_date": itm.expiry_date,
+                "location_name": locations[itm.location_id].name if itm.location_id in locations else "없음(대분류 최상위)",
+                "category": locations[itm.location_id].category if itm.location_id in locations else "기타"
+            } for itm in alert_items])
+            st.dataframe(alert_df, use_container_width=True)
         else:
             st.info("유통기한이 임박하거나 만료된 물품이 없습니다.")
+
+        # Projected from the consumption history; the forecast state stays in memory between reruns
+        st.subheader("🛒 곧 떨어질 물품")
+        import forecast
+        run_outs = forecast.run_out_soon(days=14, limit=20)
+        if run_outs is None:
+            st.caption("소비 기록을 분석하는 중입니다. 잠시 후 다시 확인해 주세요.")
+        elif run_outs:
+            locations = {loc.id: loc for loc in db.get_locations()}
+            st.dataframe(pd.DataFrame([{
+                "name": r.name,
+                "quantity": r.quantity,
+                "주당 사용량": round(r.daily_rate * 7, 1),
+                "예상 소진일": r.run_out_date,
+                "location_name": locations[r.location_id].name if r.location_id in locations else "없음(대분류 최상위)",
+            } for r in run_outs]), use_container_width=True)
+        else:
+            st.info("2주 안에 떨어질 것으로 예상되는 물품이 없습니다.")
     else:
         st.info("등록된 물품이 없습니다. '물품 관리' 메뉴에서 물품을 등록해 보세요!")
 
 elif menu == "물품 관리":
     st.title("📦 물품 등록 및 관리")
     
-    tab1, tab2 = st.tabs(["물품 등록", "전체 목록 및 수정"])
+    tab1, tab2, tab3 = st.tabs(["물품 등록", "전체 목록 및 수정", "표 편집 (일괄 수정)"])
     
     with tab1:
-        st.subheader("새 물품 등록")
+        @fragment
+        def add_item_panel():
+            st.subheader("새 물품 등록")
+            show_message()
         
-        # Location Selection Moved OUTSIDE the form to trigger rerun
-        locations = db.get_locations()
-        if locations:
-            # loc tuple: (id, name, category, parent_id, is_food)
-            loc_options = {f"[{loc[2]}] {loc[1]} {'🍎' if len(loc)>4 and loc[4] else ''}": loc for loc in locations}
-            selected_loc_label = st.selectbox("카테고리 선택", list(loc_options.keys()))
-            selected_loc = loc_options[selected_loc_label]
-            location_id = selected_loc[0]
-            is_food_loc = selected_loc[4] if len(selected_loc) > 4 else 0
-        else:
-            st.warning("등록된 카테고리가 없습니다. '카테고리 설정'에서 카테고리를 먼저 등록해 주세요.")
-            location_id = None
-            is_food_loc = 0
-
-        # Dynamic Default Expiry Calculation
-        if is_food_loc:
-            default_expiry = datetime.today() + pd.DateOffset(days=15)
-            help_text = "식료품 카테고리이므로 기본값이 15일 후로 설정되었습니다."
-        else:
-            default_expiry = datetime.today() + pd.DateOffset(years=10)
-            help_text = "일반 카테고리이므로 기본값이 10년 후로 설정되었습니다."
+            # Location Selection Moved OUTSIDE the form to trigger rerun
+            locations = db.get_locations()
+            if locations:
+                loc_options = {f"[{loc.category}] {loc.name} {'🍎' if loc.is_food else ''}": loc for loc in locations}
+                selected_loc_label = st.selectbox("카테고리 선택", list(loc_options.keys()))
+                selected_loc = loc_options[selected_loc_label]
+                location_id = selected_loc.id
+                is_food_loc = selected_loc.is_food
+            else:
+                st.warning("등록된 카테고리가 없습니다. '카테고리 설정'에서 카테고리를 먼저 등록해 주세요.")
+                location_id = None
+                is_food_loc = 0
 
-        with st.form("add_item_form"):
-            name = st.text_input("📦 품목명")
+            # Dynamic Default Expiry Calculation
+            if is_food_loc:
+                default_expiry = datetime.today() + pd.DateOffset(days=15)
+                help_text = "식료품 카테고리이므로 기본값이 15일 후로 설정되었습니다."
+            else:
+                default_expiry = datetime.today() + pd.DateOffset(years=10)
+                help_text = "일반 카테고리이므로 기본값이 10년 후로 설정되었습니다."
+
+            with st.form("add_item_form"):
+                name = name_input("📦 품목명", 'item')
             
-            col1, col2 = st.columns(2)
-            with col1:
-                quantity = st.number_input("수량", min_value=1.0, step=0.5, value=1.0)
-                purchase_date = st.date_input("구매 일자", value=datetime.today())
-            with col2:
-                # Use key to force re-render when location changes
-                # But we also need to allow user to change it manually without it resetting on every slight interaction if we used a random key.
-                # Using location_id in key means it only resets when location changes. Perfect.
-                expiry_date = st.date_input("유통기한", value=default_expiry, help=help_text, key=f"expiry_input_{location_id}")
-            
-            notes = st.text_area("참고사항")
-            
-            if st.form_submit_button("등록"):
-                if name:
-                    if location_id:
-                        db.add_item(name, purchase_date.isoformat(), expiry_date.isoformat(), quantity, notes, location_id)
-                        st.success(f"'{name}' 등록 완료!")
-                        st.balloons()
+                col1, col2 = st.columns(2)
+                with col1:
+                    quantity = st.number_input("수량", min_value=1.0, step=0.5, value=1.0)
+                    purchase_date = st.date_input("구매 일자", value=datetime.today())
+                with col2:
+                    # Use key to force re-render when location changes
+                    # But we also need to allow user to change it manually without it resetting on every slight interaction if we used a random key.
+                    # Using location_id in key means it only resets when location changes. Perfect.
+                    expiry_date = st.date_input("유통기한", value=default_expiry, help=help_text, key=f"expiry_input_{location_id}")
+            
+                notes = st.text_area("참고사항")
+            
+                if st.form_submit_button("등록"):
+                    if name:
+                        if location_id:
+                            db.add_item(name, purchase_date.isoformat(), expiry_date.isoformat(), quantity, notes, location_id)
+                            rerun_with_message(f"'{name}' 등록 완료!", balloons=True)
+                        else:
+                            st.error("카테고리를 선택해 주세요.")
                     else:
-                        st.error("카테고리를 선택해 주세요.")
-                else:
-                    st.error("품목명을 입력해 주세요.")
+                        st.error("품목명을 입력해 주세요.")
+        add_item_panel()
 
     with tab2:
-        df = get_all_items_with_info()
-        if not df.empty:
-            # 1. Category Filter at the top
-            st.subheader("🕵️ 카테고리별 필터링")
-            categories = sorted(df['category'].unique())
-            default_cat_idx = categories.index("기타") if "기타" in categories else 0
-            selected_cat = st.selectbox("조회할 대분류 선택", options=categories, index=default_cat_idx)
-            
-            # 2. Show Filtered List
-            filtered_df = df[df['category'] == selected_cat]
-            st.markdown(f"**'{selected_cat}'** 카테고리에 총 {len(filtered_df)}개의 물품이 있습니다.")
-            st.dataframe(filtered_df.drop(columns=['id', 'location_id']), use_container_width=True)
-            
-            st.markdown("---")
+        @fragment
+        def item_editor(item_labels):
+            # Reruns on its own when another item is picked; loads just that item
+            st.subheader("📝 물품 수정 및 삭제")
+            selected_item_id = st.selectbox(
+                "수정 또는 삭제할 물품을 선택하세요", 
+                options=list(item_labels), 
+                format_func=item_labels.get
+            )
+            item_data = db.get_item(selected_item_id)
+            if item_data is None:
+                st.warning("다른 사용자가 삭제한 물품입니다.")
+                return
             
-            # 3. Item Selection for Edit/Delete
-            if not filtered_df.empty:
-                st.subheader("📝 물품 수정 및 삭제")
-                selected_item_id = st.selectbox(
-                    "수정 또는 삭제할 물품을 선택하세요", 
-                    options=filtered_df['id'].tolist(), 
-                    format_func=lambda x: f"{filtered_df[filtered_df['id']==x]['name'].iloc[0]} ({filtered_df[filtered_df['id']==x]['location_name'].iloc[0]})"
+            with st.form(f"edit_form_{selected_item_id}"):
+                u_name = st.text_input("품목명", value=item_data.name)
+                
+                # Update Location options in Edit
+                locs_edit = db.get_locations()
+                loc_edit_options = {f"[{l.category}] {l.name}": l.id for l in locs_edit}
+                
+                current_loc_label = next((k for k, v in loc_edit_options.items() if v == item_data.location_id), None)
+                u_loc_label = st.selectbox(
+                    "카테고리 변경", 
+                    options=list(loc_edit_options.keys()), 
+                    index=list(loc_edit_options.keys()).index(current_loc_label) if current_loc_label and current_loc_label in loc_edit_options else 0
                 )
-                item_data = filtered_df[filtered_df['id'] == selected_item_id].iloc[0]
+                u_loc_id = loc_edit_options[u_loc_label] if loc_edit_options else None
                 
-                with st.form(f"edit_form_{selected_item_id}"):
-                    u_name = st.text_input("품목명", value=item_data['name'])
-                    
-                    # Update Location options in Edit
-                    locs_edit = db.get_locations()
-                    loc_edit_options = {f"[{l[2]}] {l[1]}": l[0] for l in locs_edit}
-                    
-                    current_loc_label = next((k for k, v in loc_edit_options.items() if v == item_data['location_id']), None)
-                    u_loc_label = st.selectbox(
-                        "카테고리 변경", 
-                        options=list(loc_edit_options.keys()), 
-                        index=list(loc_edit_options.keys()).index(current_loc_label) if current_loc_label and current_loc_label in loc_edit_options else 0
-                    )
-                    u_loc_id = loc_edit_options[u_loc_label] if loc_edit_options else None
-                    
-                    col1, col2 = st.columns(2)
-                    with col1:
-                        u_qty = st.number_input("수량", value=float(item_data['quantity']), step=0.5)
-                    with col2:
-                        u_expiry = st.date_input("유통기한", value=pd.to_datetime(item_data['expiry_date']).date())
-                    
-                    u_notes = st.text_area("참고사항", value=item_data['notes'])
-                    
-                    c1, c2, _ = st.columns([1, 1, 2])
-                    with c1:
-                        if st.form_submit_button("💾 수정 사항 저장"):
-                            db.update_item(selected_item_id, u_name, item_data['purchase_date'], u_expiry.isoformat(), u_qty, u_notes, u_loc_id)
-                            st.success("수정되었습니다!")
-                            st.rerun()
-                    with c2:
-                        if st.form_submit_button("🗑️ 물품 삭제"):
-                            db.delete_item(selected_item_id)
-                            st.warning("삭제되었습니다.")
-                            st.rerun()
+                col1, col2 = st.columns(2)
+                with col1:
+                    u_qty = st.number_input("수량", value=float(item_data.quantity or 0), step=0.5)
+                with col2:
+                    u_expiry = st.date_input("유통기한", value=pd.to_datetime(item_data.expiry_date).date())
+                
+                u_notes = st.text_area("참고사항", value=item_data.notes)
+                
+                c1, c2, _ = st.columns([1, 1, 2])
+                with c1:
+                    if st.form_submit_button("💾 수정 사항 저장"):
+                        db.update_item(selected_item_id, u_name, item_data.purchase_date, u_expiry.isoformat(), u_qty, u_notes, u_loc_id)
+                        st.success("수정되었습니다!")
+                        st.rerun()
+                with c2:
+                    if st.form_submit_button("🗑️ 물품 삭제"):
+                        db.delete_item(selected_item_id)
+                        st.warning("삭제되었습니다.")
+                        st.rerun()
+
+            # Logged as consumption, which the run-out forecast learns from
+            if st.button("➖ 1개 사용", key=f"consume_{selected_item_id}", disabled=not item_data.quantity):
+                db.consume_item(selected_item_id)
+                st.rerun()
+            with st.expander("수량 변경 기록"):
+                history = db.get_quantity_events(selected_item_id)
+                st.dataframe(pd.DataFrame(history, columns=["일시(UTC)", "변화량", "수량"]), use_container_width=True)
+
+        @fragment
+        def item_browser():
+            df = get_all_items_with_info()
+            if not df.empty:
+                # 1. Category Filter at the top
+                st.subheader("🕵️ 카테고리별 필터링")
+                categories = sorted(df['category'].unique())
+                default_cat_idx = categories.index("기타") if "기타" in categories else 0
+                selected_cat = st.selectbox("조회할 대분류 선택", options=categories, index=default_cat_idx)
+                
+                # 2. Show Filtered List
+                filtered_df = df[df['category'] == selected_cat]
+                st.markdown(f"**'{selected_cat}'** 카테고리에 총 {len(filtered_df)}개의 물품이 있습니다.")
+                st.dataframe(filtered_df.drop(columns=['id', 'location_id', 'version']), use_container_width=True)
+                
+                st.markdown("---")
+                
+                # 3. Item Selection for Edit/Delete
+                if not filtered_df.empty:
+                    item_editor(dict(zip(filtered_df['id'].tolist(), (filtered_df['name'] + " (" + filtered_df['location_name'] + ")").tolist())))
+                else:
+                    st.info(f"'{selected_cat}' 카테고리에 등록된 물품이 없습니다.")
             else:
-                st.info(f"'{selected_cat}' 카테고리에 등록된 물품이 없습니다.")
-        else:
-            st.write("목록이 비어 있습니다.")
+                st.write("목록이 비어 있습니다.")
+        item_browser()
+
+    with tab3:
+        @fragment
+        def item_grid_panel():
+            st.subheader("🧮 표에서 바로 수정하기")
+            st.caption("수정, 이동, 삭제를 표에 모아 두었다가 저장하면 하나의 트랜잭션으로 반영됩니다. 다른 사용자가 먼저 수정한 물품이 있으면 아무것도 저장되지 않습니다.")
+            show_grid_result("item_grid")
+
+            locs_grid = db.get_locations()
+            loc_labels = {l.id: f"[{l.category}] {l.name}" for l in locs_grid}
+            label_to_loc = {v: k for k, v in loc_labels.items()}
+
+            if "item_grid_snapshot" not in st.session_state:
+                grid_src = get_all_items_with_info()
+                unreadable = []
+                if not grid_src.empty:
+                    grid_src, unreadable = coerce_grid_dates(grid_src, ["purchase_date", "expiry_date"])
+                    grid_src = pd.DataFrame({
+                        "선택": False,
+                        "id": grid_src["id"],
+                        "name": grid_src["name"],
+                        "location": grid_src["location_id"].map(loc_labels),
+                        "purchase_date": grid_src["purchase_date"],
+                        "expiry_date": grid_src["expiry_date"],
+                        "quantity": grid_src["quantity"].astype(float),
+                        "notes": grid_src["notes"],
+                        "version": grid_src["version"],
+                    })
+                st.session_state["item_grid_snapshot"] = grid_src
+                st.session_state["item_grid_unreadable"] = unreadable
+            grid_df = st.session_state["item_grid_snapshot"]
+            if st.session_state.get("item_grid_unreadable"):
+                st.warning(f"날짜를 읽을 수 없는 물품이 있어 빈 칸으로 표시합니다. (id: {st.session_state['item_grid_unreadable']}) 고치지 않으면 저장된 값이 그대로 유지됩니다.")
+
+            if grid_df.empty:
+                st.write("목록이 비어 있습니다.")
+            else:
+                edited_df = st.data_editor(
+                    grid_df,
+                    key=f"item_grid_{st.session_state.get('item_grid_gen', 0)}",
+                    hide_index=True,
+                    num_rows="fixed",
+                    disabled=["id", "version"],
+                    column_order=["선택", "name", "location", "purchase_date", "expiry_date", "quantity", "notes"],
+                    column_config={
+                        "선택": st.column_config.CheckboxColumn("선택"),
+                        "name": st.column_config.TextColumn("품목명", required=True),
+                        "location": st.column_config.SelectboxColumn("카테고리", options=list(label_to_loc.keys())),
+                        "purchase_date": st.column_config.DateColumn("구매 일자"),
+                        "expiry_date": st.column_config.DateColumn("유통기한"),
+                        "quantity": st.column_config.NumberColumn("수량", min_value=0.0, step=0.5),
+                        "notes": st.column_config.TextColumn("참고사항"),
+                    },
+                    use_container_width=True,
+                )
+
+                edited_df, bad_dates = coerce_grid_dates(edited_df, ["purchase_date", "expiry_date"])
+                if bad_dates:
+                    st.error(f"날짜 형식이 올바르지 않은 행은 저장하지 않습니다. (id: {bad_dates})")
+                updates = [u for u in diff_grid(grid_df, edited_df, ["name", "location", "purchase_date", "expiry_date", "quantity", "notes"])
+                           if u["id"] not in bad_dates]
+                for u in updates:
+                    if "location" in u:
+                        u["location_id"] = label_to_loc.get(u.pop("location"))
+                    for c in ("purchase_date", "expiry_date"):
+                        if u.get(c) is not None:
+                            u[c] = u[c].isoformat()
+                selected = edited_df[edited_df["선택"]]
+                selected_versions = {int(r["id"]): int(r["version"]) for _, r in selected.iterrows()}
+
+                # Moves and deletes of the selected rows join the cell edits in one batch
+                g1, g2 = st.columns([1, 2])
+                with g1:
+                    action = st.radio("선택 항목", ["그대로", "이동", "삭제"], horizontal=True, key=f"item_grid_action_{st.session_state.get('item_grid_gen', 0)}")
+                with g2:
+                    move_target = st.selectbox("이동할 카테고리", options=list(label_to_loc.keys()), key="item_grid_move_target",
+                                               disabled=action != "이동")
+                deletes = []
+                moved = 0
+                if action == "삭제":
+                    deletes = list(selected_versions.items())
+                    updates = [u for u in updates if u["id"] not in selected_versions]
+                edited = len(updates)
+                if action == "이동" and move_target:
+                    by_id = {u["id"]: u for u in updates}
+                    for item_id, version in selected_versions.items():
+                        by_id.setdefault(item_id, {"id": item_id, "version": version})["location_id"] = label_to_loc[move_target]
+                    updates = list(by_id.values())
+                    moved = len(selected_versions)
+
+                summary = f"수정 {edited}건 · 이동 {moved}건 · 삭제 {len(deletes)}건"
+                if st.button(f"💾 변경 사항 저장 ({summary})", disabled=not (updates or deletes)):
+                    ok, conflicts = db.apply_item_changes(updates, deletes)
+                    if ok:
+                        finish_grid_save("item_grid", True, f"저장되었습니다! ({summary})")
+                    else:
+                        finish_grid_save("item_grid", False, f"다른 사용자가 먼저 수정한 물품이 있어 아무것도 저장하지 않았습니다. (id: {conflicts}) 최신 내용을 다시 불러왔으니 확인 후 다시 시도해 주세요.")
+
+            if st.button("🔄 새로고침", key="item_grid_refresh"):
+                reset_grid("item_grid")
+                st.rerun()
+        item_grid_panel()
 
 elif menu == "카테고리 설정":
     st.title("⚙️ 카테고리 관리")
@@ -298,7 +552,7 @@ elif menu == "카테고리 설정":
             
             # Get unique existing categories
             locs_raw = db.get_locations()
-            existing_categories = sorted(list(set([loc[2] for loc in locs_raw])))
+            existing_categories = sorted(list(set([loc.category for loc in locs_raw])))
             
             cat_options = ["(카테고리 이름과 동일)"] + existing_categories + ["직접 입력"]
             selected_cat = st.selectbox("대분류 선택", cat_options)
@@ -307,6 +561,12 @@ elif menu == "카테고리 설정":
             if selected_cat == "직접 입력":
                 custom_cat = st.text_input("새 대분류명 입력")
             
+            loc_paths = db.get_location_paths()
+            parent_options = [None] + sorted(loc_paths, key=lambda k: loc_paths[k])
+            new_parent_id = st.selectbox("상위 카테고리", parent_options,
+                                         format_func=lambda x: "(최상위)" if x is None else loc_paths[x],
+                                         help="예: 집 → 주방 → 냉장고 → 윗칸 처럼 중첩해서 관리할 수 있습니다.")
+            
             is_food_check = st.checkbox("식료품 카테고리인가요?", help="체크 시 이 카테고리에 물품 등록 시 유통기한 기본값이 15일로 설정됩니다.")
             
             if st.form_submit_button("카테고리 등록"):
@@ -317,50 +577,54 @@ elif menu == "카테고리 설정":
                     elif selected_cat != "(카테고리 이름과 동일)":
                         final_cat = selected_cat
                     
-                    db.add_location(new_loc_name, final_cat, None, is_food_check)
+                    db.add_location(new_loc_name, final_cat, new_parent_id, is_food_check)
                     st.success(f"'{new_loc_name}' ({final_cat}) 등록 완료!")
                     st.rerun()
                 else:
                     st.error("카테고리 이름을 입력해 주세요.")
     
     with tab_loc2:
-        st.subheader("등록된 카테고리 관리")
-        locs = db.get_locations()
-        if locs:
-            # Prepare DataFrame
-            # loc: id, name, category, parent_id, is_food
-            loc_data = []
-            for l in locs:
-                is_food_val = l[4] if len(l) > 4 else 0
-                loc_data.append({
-                    "id": l[0],
-                    "name": l[1],
-                    "category": l[2],
-                    "is_food": "✅" if is_food_val else "-"
-                })
-            
-            loc_df = pd.DataFrame(loc_data)
-            st.dataframe(loc_df[['category', 'name', 'is_food']], use_container_width=True)
-            
-            st.divider()
-            
-            # Edit/Delete Section
-            selected_loc_id = st.selectbox("관리할 카테고리 선택", options=loc_df['id'].tolist(), 
-                                      format_func=lambda x: f"[{loc_df[loc_df['id']==x]['category'].iloc[0]}] {loc_df[loc_df['id']==x]['name'].iloc[0]}")
+        @fragment
+        def location_editor(loc_labels, loc_paths):
+            # Edit/Delete Section; reruns on its own when another category is picked
+            selected_loc_id = st.selectbox("관리할 카테고리 선택", options=list(loc_labels), format_func=loc_labels.get)
             
             loc_to_edit = db.get_location_by_id(selected_loc_id)
-            # loc_to_edit: tuple (id, name, cat, parent, is_food)
+            if loc_to_edit is None:
+                st.warning("다른 사용자가 삭제한 카테고리입니다.")
+                return
+            
+            with st.expander("📂 하위 카테고리 포함 물품 보기"):
+                subtree_items = db.get_subtree_items(selected_loc_id)
+                if subtree_items:
+                    st.dataframe(pd.DataFrame([{
+                        "name": itm.name,
+                        "expiry_date": itm.expiry_date,
+                        "quantity": itm.quantity,
+                        "location": loc_paths.get(itm.location_id)
+                    } for itm in subtree_items]), use_container_width=True)
+                else:
+                    st.write("물품이 없습니다.")
             
             with st.form("edit_loc_form"):
-                st.markdown(f"**'{loc_to_edit[1]}'** 수정 중")
-                u_loc_name = st.text_input("카테고리 이름", value=loc_to_edit[1])
-                u_loc_cat = st.text_input("대분류", value=loc_to_edit[2]) 
-                u_is_food = st.checkbox("식료품 카테고리", value=bool(loc_to_edit[4]) if len(loc_to_edit)>4 else False)
+                st.markdown(f"**'{loc_to_edit.name}'** 수정 중")
+                u_loc_name = st.text_input("카테고리 이름", value=loc_to_edit.name)
+                u_loc_cat = st.text_input("대분류", value=loc_to_edit.category) 
+                parent_options = [None] + [k for k in sorted(loc_paths, key=lambda k: loc_paths[k]) if k != selected_loc_id]
+                u_parent_id = st.selectbox("상위 카테고리 (하위 카테고리와 함께 이동)", parent_options,
+                                           index=parent_options.index(loc_to_edit.parent_id) if loc_to_edit.parent_id in parent_options else 0,
+                                           format_func=lambda x: "(최상위)" if x is None else loc_paths[x])
+                u_is_food = st.checkbox("식료품 카테고리", value=bool(loc_to_edit.is_food))
                 
                 c1, c2 = st.columns(2)
                 with c1:
                     if st.form_submit_button("수정 저장"):
                         db.update_location(selected_loc_id, u_loc_name, u_loc_cat, u_is_food)
+                        if u_parent_id != loc_to_edit.parent_id:
+                            moved, msg = db.move_location(selected_loc_id, u_parent_id)
+                            if not moved:
+                                st.error(msg)
+                                return
                         st.success("카테고리 정보가 수정되었습니다.")
                         st.rerun()
                 with c2:
@@ -368,224 +632,605 @@ elif menu == "카테고리 설정":
                         db.delete_location_safely(selected_loc_id)
                         st.warning("카테고리가 삭제되었습니다.")
                         st.rerun()
+
+        st.subheader("등록된 카테고리 관리")
+        locs = db.get_locations()
+        if locs:
+            # Prepare DataFrame
+            # loc: id, name, category, parent_id, is_food
+            loc_paths = db.get_location_paths()
+            # Stats cover each location's whole subtree
+            subtree_stats = {row.location_id: row for row in db.get_subtree_stats()}
+            loc_data = []
+            for l in locs:
+                stats = subtree_stats.get(l.id)
+                loc_data.append({
+                    "id": l.id,
+                    "name": l.name,
+                    "category": l.category,
+                    "path": loc_paths.get(l.id, l.name),
+                    "is_food": "✅" if l.is_food else "-",
+                    "items": stats.item_count if stats else 0,
+                    "expired": stats.expired if stats else 0,
+                    "expiring": stats.expiring_7d if stats else 0,
+                    "next_expiry": stats.next_expiry if stats else None
+                })
+            
+            loc_df = pd.DataFrame(loc_data).sort_values('path')
+            st.dataframe(
+                loc_df[['category', 'path', 'is_food', 'items', 'expired', 'expiring', 'next_expiry']].rename(columns={
+                    'path': '경로', 'items': '물품 수 (하위 포함)', 'expired': '만료', 'expiring': '7일 이내', 'next_expiry': '가장 빠른 유통기한'
+                }),
+                use_container_width=True
+            )
+            
+            st.divider()
+            
+            location_editor({row.id: f"[{row.category}] {loc_paths.get(row.id)}" for row in loc_df.itertuples()}, loc_paths)
         else:
             st.info("등록된 카테고리가 없습니다.")
 
 elif menu == "영수증 관리":
     st.title("🧾 영수증 관리")
     
-    tab_receipt1, tab_receipt2 = st.tabs(["영수증 등록", "영수증 목록 및 관리"])
+    tab_receipt1, tab_receipt2, tab_receipt3, tab_receipt4 = st.tabs(["영수증 등록", "영수증 목록 및 관리", "표 편집 (일괄 수정)", "품목 → 물품 등록"])
+    import receipt_items
     
     with tab_receipt1:
-        st.subheader("새 영수증 등록")
+        @fragment(run_every=OCR_POLL_SECONDS)
+        def ocr_job_status(job_id):
+            # Polls the queue on its own timer; the upload and form stay as they are
+            job = db.get_ocr_job(job_id)
+            if job is None or job.status == 'failed':
+                st.session_state.pop('ocr_job_id', None)
+                st.error(f"OCR 분석에 실패했습니다. {job.error if job else ''}")
+                return
+            if job.status == 'done':
+                st.session_state.pop('ocr_job_id', None)
+                load_ocr_result(job)
+                st.rerun()
+            state = "분석 중" if job.status == 'running' else "대기 중"
+            st.info(f"⏳ OCR {state}입니다 (#{job.id}, 시도 {job.attempts}회). 새로고침해도 결과는 저장됩니다.")
+            import ocr_metrics
+            budget_message = ocr_metrics.over_budget() if job.status == 'queued' else None
+            waited = (datetime.now() - datetime.fromisoformat(job.created_at)).total_seconds()
+            if budget_message:
+                st.warning(budget_message)
+            elif job.status == 'queued' and waited > OCR_WORKER_HINT_SECONDS:
+                st.caption("OCR 워커가 실행 중이 아닌 것 같습니다: `python ocr_worker.py`")
+                if st.button("이 창에서 바로 분석", key="ocr_run_here"):
+                    import ocr_worker
+                    with st.spinner("이미지를 분석하고 있습니다..."):
+                        ocr_worker.run_pending(ocr_worker.worker_name(), limit=1)
+
+        @fragment
+        def receipt_capture_panel():
+            st.subheader("새 영수증 등록")
+            show_message()
         
-        # Category Selection Moved OUTSIDE the form to trigger rerun
-        locations = db.get_locations()
-        if locations:
-            loc_options = {f"[{loc[2]}] {loc[1]}": loc for loc in locations}
-            selected_loc_label = st.selectbox("카테고리 선택", list(loc_options.keys()), key="receipt_cat")
-            selected_loc = loc_options[selected_loc_label]
-            category_id = selected_loc[0]
-        else:
-            st.warning("등록된 카테고리가 없습니다. '카테고리 설정'에서 카테고리를 먼저 등록해 주세요.")
-            category_id = None
+            # Category Selection Moved OUTSIDE the form to trigger rerun
+            locations = db.get_locations()
+            if locations:
+                loc_options = {f"[{loc.category}] {loc.name}": loc for loc in locations}
+                selected_loc_label = st.selectbox("카테고리 선택", list(loc_options.keys()), key="receipt_cat")
+                selected_loc = loc_options[selected_loc_label]
+                category_id = selected_loc.id
+            else:
+                st.warning("등록된 카테고리가 없습니다. '카테고리 설정'에서 카테고리를 먼저 등록해 주세요.")
+                category_id = None
             
-        st.markdown("---")
-        st.write("이미지를 업로드하거나 직접 촬영하여 등록할 수 있습니다.")
+            st.markdown("---")
+            st.write("이미지를 업로드하거나 직접 촬영하여 등록할 수 있습니다.")
         
-        input_tab1, input_tab2 = st.tabs(["📁 파일 업로드", "📷 카메라 촬영"])
+            input_tab1, input_tab2 = st.tabs(["📁 파일 업로드", "📷 카메라 촬영"])
         
-        with input_tab1:
-            uploaded_file = st.file_uploader("영수증 이미지 (JPG)", type=['jpg', 'jpeg'], key="receipt_upload_file")
+            with input_tab1:
+                uploaded_file = st.file_uploader("영수증 이미지 (JPG)", type=['jpg', 'jpeg'], key="receipt_upload_file")
         
-        with input_tab2:
-            camera_file = st.camera_input("영수증 촬영", key="receipt_camera_input")
+            with input_tab2:
+                camera_file = st.camera_input("영수증 촬영", key="receipt_camera_input")
             
-        # Combine inputs: Prefer camera if both exist, or use whichever is provided
-        uploaded_image = camera_file if camera_file is not None else uploaded_file
+            # Combine inputs: Prefer camera if both exist, or use whichever is provided
+            uploaded_image = camera_file if camera_file is not None else uploaded_file
         
-        image_path = None
-        if uploaded_image is not None:
-            st.image(uploaded_image, caption="선택된 영수증 이미지", use_container_width=True)
-            # Save the image
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"receipt_{timestamp}.jpg"
-            image_path = os.path.join("uploads", filename)
-            
-            if st.button("🖼️ 이미지 분석 (OCR) 실행"):
-                with st.spinner("이미지를 분석하고 있습니다..."):
+            image_path = None
+            if uploaded_image is not None:
+                st.image(uploaded_image, caption="선택된 영수증 이미지", use_container_width=True)
+                # Save the image
+                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                filename = f"receipt_{timestamp}.jpg"
+                image_path = os.path.join("uploads", filename)
+            
+                # Near-duplicate check against registered receipts (hash once per upload)
+                import image_hash
+                file_key = getattr(uploaded_image, 'file_id', uploaded_image.name)
+                if st.session_state.get('receipt_hash_key') != file_key:
+                    st.session_state['receipt_hash_key'] = file_key
+                    st.session_state['receipt_hash'] = image_hash.dhash(uploaded_image)
+                    # A new image: results loaded for an earlier one no longer apply
+                    for k in ('ocr_job_id', 'ocr_result_job', 'ocr_image_path'):
+                        st.session_state.pop(k, None)
+                duplicates = db.find_similar_receipts(st.session_state['receipt_hash'])
+                run_ocr_anyway = True
+                if duplicates:
+                    st.warning("⚠️ 이미 등록된 영수증과 비슷한 이미지입니다. 중복 등록이 아닌지 확인해 주세요.")
+                    for distance, dup in duplicates[:5]:
+                        st.write(f"- #{dup.id} {dup.use_date} {dup.store_name} {dup.total_amount:,.0f}원 (차이 {distance}비트)")
+                    run_ocr_anyway = st.checkbox("중복이 아닙니다 (OCR 실행 허용)", key="receipt_dup_override")
+            
+                if st.button("🖼️ 이미지 분석 (OCR) 실행", disabled=not run_ocr_anyway or 'ocr_job_id' in st.session_state):
+                    # Queued for ocr_worker.py; the status panel below picks the result up
                     with open(image_path, "wb") as f:
                         f.write(uploaded_image.getbuffer())
-                    
-                    text, info = ocr_helper.extract_receipt_info(image_path)
-                    st.session_state['ocr_text'] = text
-                    st.session_state['ocr_store'] = info.get('store_name', '')
-                    st.session_state['ocr_address'] = info.get('store_address', '')
-                    st.session_state['ocr_amount'] = info.get('total_amount', 0.0)
-                    st.session_state['ocr_sales'] = info.get('sales_amount', 0.0)
-                    st.session_state['ocr_date'] = info.get('use_date')
-                    st.session_state['ocr_card'] = info.get('card_type', '')
-                    st.session_state['ocr_card_num'] = info.get('card_number', '')
-                    st.session_state['ocr_vat'] = info.get('vat', 0.0)
-                    st.rerun()
+                    st.session_state['ocr_job_id'] = db.enqueue_ocr_job(image_path)
+                    st.session_state['ocr_image_path'] = image_path
 
-        with st.form("add_receipt_form"):
-            col1, col2 = st.columns(2)
-            with col1:
-                store_name = st.text_input("사용처 (필수)", value=st.session_state.get('ocr_store', ''))
-                card_type = st.text_input("카드종류 (예: 신한카드, 현대카드 등)", value=st.session_state.get('ocr_card', ''))
+            if 'ocr_job_id' in st.session_state:
+                ocr_job_status(st.session_state['ocr_job_id'])
+
+            # Results outlive the session: finished jobs stay here until a receipt is registered
+            unused = db.get_unused_ocr_results()
+            if unused and 'ocr_job_id' not in st.session_state:
+                with st.expander(f"📥 분석이 끝난 영수증 불러오기 ({len(unused)}건)"):
+                    jobs = {job.id: job for job in unused}
+                    picked = st.selectbox("OCR 결과", list(jobs), key="ocr_result_pick",
+                                          format_func=lambda i: f"#{i} {jobs[i].finished_at} {json.loads(jobs[i].result)['info'].get('store_name') or '(상호 없음)'}")
+                    if st.button("불러오기", key="ocr_result_load"):
+                        # No rerun: the form below is drawn after this and picks the results up
+                        load_ocr_result(jobs[picked])
+            if uploaded_image is None and st.session_state.get('ocr_image_path'):
+                if os.path.exists(st.session_state['ocr_image_path']):
+                    st.image(st.session_state['ocr_image_path'], caption="불러온 OCR 결과의 영수증 이미지", width=300)
+
+            with st.form("add_receipt_form"):
+                col1, col2 = st.columns(2)
+                with col1:
+                    store_name = name_input("사용처 (필수)", 'store', st.session_state.get('ocr_store', ''))
+                    card_type = name_input("카드종류 (예: 신한카드, 현대카드 등)", 'card', st.session_state.get('ocr_card', ''))
                 
-                default_date = datetime.today()
-                ocr_date_str = st.session_state.get('ocr_date')
-                if ocr_date_str:
-                    try:
-                        default_date = pd.to_datetime(ocr_date_str).date()
-                    except:
-                        pass
-                use_date = st.date_input("사용일시", value=default_date)
+                    default_date = datetime.today()
+                    ocr_date_str = st.session_state.get('ocr_date')
+                    if ocr_date_str:
+                        try:
+                            default_date = pd.to_datetime(ocr_date_str).date()
+                        except:
+                            pass
+                    use_date = st.date_input("사용일시", value=default_date)
                 
-                default_sales = float(st.session_state.get('ocr_sales', 0.0))
-                sales_amount = st.number_input("판매금액", min_value=0.0, step=100.0, value=default_sales)
-            with col2:
-                store_address = st.text_input("사용처주소", value=st.session_state.get('ocr_address', ''))
-                card_number = st.text_input("카드번호 (예: 1234-****-****-****)", value=st.session_state.get('ocr_card_num', ''))
+                    default_sales = float(st.session_state.get('ocr_sales', 0.0))
+                    sales_amount = st.number_input("판매금액", min_value=0.0, step=100.0, value=default_sales)
+                with col2:
+                    store_address = st.text_input("사용처주소", value=st.session_state.get('ocr_address', ''))
+                    card_number = st.text_input("카드번호 (예: 1234-****-****-****)", value=st.session_state.get('ocr_card_num', ''))
                 
-                default_vat = float(st.session_state.get('ocr_vat', 0.0))
-                vat = st.number_input("부가세", min_value=0.0, step=10.0, value=default_vat)
+                    default_vat = float(st.session_state.get('ocr_vat', 0.0))
+                    vat = st.number_input("부가세", min_value=0.0, step=10.0, value=default_vat)
                 
-                default_amount = float(st.session_state.get('ocr_amount', 0.0))
-                total_amount = st.number_input("합계금액", min_value=0.0, step=100.0, value=default_amount)
-            
-            notes = st.text_area("참고사항 (OCR 결과가 여기에 표시됩니다)", value=st.session_state.get('ocr_text', ''))
-            
-            if st.form_submit_button("영수증 등록"):
-                if store_name:
-                    if category_id:
-                        final_image_path = ""
-                        if uploaded_image is not None and image_path:
-                            if not os.path.exists(image_path):
-                                with open(image_path, "wb") as f:
-                                    f.write(uploaded_image.getbuffer())
-                            final_image_path = image_path
+                    default_amount = float(st.session_state.get('ocr_amount', 0.0))
+                    total_amount = st.number_input("합계금액", min_value=0.0, step=100.0, value=default_amount)
+            
+                notes = st.text_area("참고사항 (OCR 결과가 여기에 표시됩니다)", value=st.session_state.get('ocr_text', ''))
+                if st.session_state.get('ocr_lines'):
+                    st.caption(f"인식된 품목 {len(st.session_state['ocr_lines'])}개는 등록 후 '품목 → 물품 등록' 탭에서 물품으로 추가할 수 있습니다.")
+            
+                if st.form_submit_button("영수증 등록"):
+                    if store_name:
+                        if category_id:
+                            final_image_path = ""
+                            ocr_image_path = st.session_state.get('ocr_image_path')
+                            if ocr_image_path and os.path.exists(ocr_image_path):
+                                # Saved when the OCR job was queued
+                                final_image_path = ocr_image_path
+                                if uploaded_image is not None:
+                                    db.save_image_hash(final_image_path, st.session_state['receipt_hash'])
+                                else:
+                                    import image_hash
+                                    db.save_image_hash(final_image_path, image_hash.dhash(final_image_path))
+                            elif uploaded_image is not None and image_path:
+                                if not os.path.exists(image_path):
+                                    with open(image_path, "wb") as f:
+                                        f.write(uploaded_image.getbuffer())
+                                final_image_path = image_path
+                                db.save_image_hash(image_path, st.session_state['receipt_hash'])
                             
-                        db.add_receipt(category_id, store_name, store_address, card_type, card_number, use_date.isoformat(), sales_amount, vat, total_amount, notes, final_image_path)
-                        st.success("영수증이 등록되었습니다!")
-                        st.balloons()
+                            db.add_receipt(category_id, store_name, store_address, card_type, card_number, use_date.isoformat(), sales_amount, vat, total_amount, notes, final_image_path,
+                                           ocr_job_id=st.session_state.get('ocr_result_job'),
+                                           lines=receipt_items.line_rows(st.session_state.get('ocr_lines')))
                         
-                        # Clear OCR session state
-                        for k in ['ocr_text', 'ocr_store', 'ocr_address', 'ocr_amount', 'ocr_sales', 'ocr_date', 'ocr_card', 'ocr_card_num', 'ocr_vat']:
-                            if k in st.session_state:
-                                del st.session_state[k]
+                            # Clear OCR session state
+                            for k in OCR_KEYS:
+                                if k in st.session_state:
+                                    del st.session_state[k]
+                            rerun_with_message("영수증이 등록되었습니다!", balloons=True)
+                        else:
+                            st.error("카테고리를 선택해 주세요.")
                     else:
-                        st.error("카테고리를 선택해 주세요.")
-                else:
-                    st.error("사용처를 입력해 주세요.")
+                        st.error("사용처를 입력해 주세요.")
+        receipt_capture_panel()
                     
     with tab_receipt2:
-        st.subheader("영수증 목록 및 관리")
-        
-        locations_dict = {loc[0]: f"[{loc[2]}] {loc[1]}" for loc in db.get_locations()}
-        receipts = db.get_receipts()
-        
-        if receipts:
-            # Prepare DataFrame
-            data = []
-            for r in receipts:
-                # r: id(0), cat_id(1), store_name(2), addr(3), card_type(4), card_number(5), use_date(6), 
-                # sales_amt(7), vat(8), total_amt(9), notes(10), img_path(11)
-                data.append({
-                    "id": r[0],
-                    "카테고리": locations_dict.get(r[1], "알 수 없음"),
-                    "사용처": r[2],
-                    "사용일시": r[6],
-                    "합계금액": f"{r[9]:,.0f}원",
-                    "카드종류": r[4],
-                    "category_id": r[1]
-                })
-            df = pd.DataFrame(data)
+        @fragment
+        def receipt_editor(receipt_labels, locations_dict):
+            # Reruns on its own when another receipt is picked; loads just that receipt
+            st.write("📝 영수증 상세/수정 및 삭제")
             
-            # 카테고리 필터링
-            all_cats = ["전체"] + sorted(list(set(df["카테고리"].tolist())))
-            filter_cat = st.selectbox("카테고리로 필터링", all_cats)
+            selected_receipt_id = st.selectbox(
+                "관리할 영수증 선택", 
+                options=list(receipt_labels),
+                format_func=receipt_labels.get
+            )
             
-            if filter_cat != "전체":
-                filtered_df = df[df["카테고리"] == filter_cat]
-            else:
-                filtered_df = df
-                
-            st.dataframe(filtered_df.drop(columns=['id', 'category_id']), use_container_width=True)
+            # Fetch detailed data
+            item_data = db.get_receipt(selected_receipt_id)
+            if item_data is None:
+                st.warning("다른 사용자가 삭제한 영수증입니다.")
+                return
+            archived = db.receipt_is_archived(selected_receipt_id)
+            if archived:
+                st.info("보관된 영수증입니다. 수정하거나 삭제하려면 먼저 보관을 해제하세요.")
             
-            st.divider()
+            if item_data.image_path and os.path.exists(item_data.image_path):
+                st.image(item_data.image_path, caption=f"이미지: {item_data.image_path}", width=300)
             
-            if not filtered_df.empty:
-                st.write("📝 영수증 상세/수정 및 삭제")
+            with st.form(f"edit_receipt_form_{selected_receipt_id}"):
+                # Update Location options in Edit
+                loc_edit_keys = list(locations_dict.values())
+                current_loc_val = locations_dict.get(item_data.category_id)
+                u_cat_idx = loc_edit_keys.index(current_loc_val) if current_loc_val in loc_edit_keys else 0
                 
-                selected_receipt_id = st.selectbox(
-                    "관리할 영수증 선택", 
-                    options=filtered_df['id'].tolist(),
-                    format_func=lambda x: f"{filtered_df[filtered_df['id']==x]['사용처'].iloc[0]} ({filtered_df[filtered_df['id']==x]['사용일시'].iloc[0]})"
-                )
+                u_cat_label = st.selectbox("카테고리 변경", options=loc_edit_keys, index=u_cat_idx)
+                u_cat_id = next((k for k, v in locations_dict.items() if v == u_cat_label), item_data.category_id)
+                
+                c1, c2 = st.columns(2)
+                with c1:
+                    u_store = st.text_input("사용처", value=item_data.store_name)
+                    u_card_type = st.text_input("카드종류", value=item_data.card_type or "")
+                    u_date = st.date_input("사용일시", value=pd.to_datetime(item_data.use_date).date())
+                    u_sales = st.number_input("판매금액", value=float(item_data.sales_amount), step=100.0)
+                with c2:
+                    u_addr = st.text_input("사용처주소", value=item_data.store_address or "")
+                    u_card_num = st.text_input("카드번호", value=item_data.card_number or "")
+                    u_vat = st.number_input("부가세", value=float(item_data.vat), step=10.0)
+                    u_total = st.number_input("합계금액", value=float(item_data.total_amount), step=100.0)
+                    
+                u_notes = st.text_area("참고사항", value=item_data.notes or "")
                 
-                # Fetch detailed data
-                r_idx = next(i for i, r in enumerate(receipts) if r[0] == selected_receipt_id)
-                item_data = receipts[r_idx]
+                btn1, btn2, _ = st.columns([1, 1, 2])
+                with btn1:
+                    if st.form_submit_button("💾 수정 사항 저장", disabled=archived):
+                        db.update_receipt(selected_receipt_id, u_cat_id, u_store, u_addr, u_card_type, u_card_num, u_date.isoformat(), u_sales, u_vat, u_total, u_notes, item_data.image_path)
+                        st.success("영수증이 수정되었습니다!")
+                        st.rerun()
+                with btn2:
+                    if st.form_submit_button("🗑️ 영수증 삭제", disabled=archived):
+                        # Optionally delete the file as well
+                        if item_data.image_path and os.path.exists(item_data.image_path):
+                            try:
+                                os.remove(item_data.image_path)
+                            except:
+                                pass
+                        db.delete_receipt(selected_receipt_id)
+                        st.warning("삭제되었습니다.")
+                        st.rerun()
+
+        @fragment
+        def receipt_browser():
+            st.subheader("영수증 목록 및 관리")
+            
+            locations_dict = {loc.id: f"[{loc.category}] {loc.name}" for loc in db.get_locations()}
+            if st.checkbox("기간으로 조회", key="receipt_range_filter"):
+                range_val = st.date_input("사용일시 기간", value=(datetime.today().replace(day=1), datetime.today()), key="receipt_range")
+                if isinstance(range_val, (list, tuple)) and len(range_val) == 2:
+                    receipts = db.get_receipts_between(range_val[0], range_val[1])
+                else:
+                    receipts = []
+            else:
+                receipts = db.get_receipts()
+                archived_years = db.archived_receipt_years()
+                if archived_years:
+                    st.caption(f"{archived_years[-1] + 1}년 이전 영수증은 연도별 보관 파일에 있습니다. 기간으로 조회하면 함께 표시됩니다.")
+            
+            if receipts:
+                # Prepare DataFrame
+                data = []
+                for r in receipts:
+                    data.append({
+                        "id": r.id,
+                        "카테고리": locations_dict.get(r.category_id, "알 수 없음"),
+                        "사용처": r.store_name,
+                        "사용일시": r.use_date,
+                        "합계금액": r.total_amount,
+                        "카드종류": r.card_type,
+                        "category_id": r.category_id
+                    })
+                df = pd.DataFrame(data)
                 
-                if item_data[11] and os.path.exists(item_data[11]):
-                    st.image(item_data[11], caption=f"이미지: {item_data[11]}", width=300)
+                # 카테고리 필터링
+                all_cats = ["전체"] + sorted(list(set(df["카테고리"].tolist())))
+                filter_cat = st.selectbox("카테고리로 필터링", all_cats)
                 
-                with st.form(f"edit_receipt_form_{selected_receipt_id}"):
-                    # Update Location options in Edit
-                    loc_edit_keys = list(locations_dict.values())
-                    current_loc_val = locations_dict.get(item_data[1])
-                    u_cat_idx = loc_edit_keys.index(current_loc_val) if current_loc_val in loc_edit_keys else 0
-                    
-                    u_cat_label = st.selectbox("카테고리 변경", options=loc_edit_keys, index=u_cat_idx)
-                    u_cat_id = next((k for k, v in locations_dict.items() if v == u_cat_label), item_data[1])
-                    
-                    c1, c2 = st.columns(2)
-                    with c1:
-                        u_store = st.text_input("사용처", value=item_data[2])
-                        u_card_type = st.text_input("카드종류", value=item_data[4] or "")
-                        u_date = st.date_input("사용일시", value=pd.to_datetime(item_data[6]).date())
-                        u_sales = st.number_input("판매금액", value=float(item_data[7]), step=100.0)
-                    with c2:
-                        u_addr = st.text_input("사용처주소", value=item_data[3] or "")
-                        u_card_num = st.text_input("카드번호", value=item_data[5] or "")
-                        u_vat = st.number_input("부가세", value=float(item_data[8]), step=10.0)
-                        u_total = st.number_input("합계금액", value=float(item_data[9]), step=100.0)
-                        
-                    u_notes = st.text_area("참고사항", value=item_data[10] or "")
+                if filter_cat != "전체":
+                    filtered_df = df[df["카테고리"] == filter_cat]
+                else:
+                    filtered_df = df
                     
-                    btn1, btn2, _ = st.columns([1, 1, 2])
-                    with btn1:
-                        if st.form_submit_button("💾 수정 사항 저장"):
-                            db.update_receipt(selected_receipt_id, u_cat_id, u_store, u_addr, u_card_type, u_card_num, u_date.isoformat(), u_sales, u_vat, u_total, u_notes, item_data[11])
-                            st.success("영수증이 수정되었습니다!")
-                            st.rerun()
-                    with btn2:
-                        if st.form_submit_button("🗑️ 영수증 삭제"):
-                            # Optionally delete the file as well
-                            if item_data[11] and os.path.exists(item_data[11]):
+                st.dataframe(filtered_df.drop(columns=['id', 'category_id']), use_container_width=True,
+                             column_config={"합계금액": st.column_config.NumberColumn(format="%,.0f원")})
+                
+                st.divider()
+                
+                if not filtered_df.empty:
+                    receipt_editor(dict(zip(filtered_df['id'].tolist(), (filtered_df['사용처'] + " (" + filtered_df['사용일시'].astype(str) + ")").tolist())),
+                                   locations_dict)
+            else:
+                st.info("등록된 영수증이 없습니다.")
+        receipt_browser()
+
+    with tab_receipt3:
+        @fragment
+        def receipt_grid_panel():
+            st.subheader("🧮 표에서 바로 수정하기")
+            st.caption("수정과 삭제를 표에 모아 두었다가 저장하면 하나의 트랜잭션으로 반영됩니다. 다른 사용자가 먼저 수정한 영수증이 있으면 아무것도 저장되지 않습니다.")
+            show_grid_result("receipt_grid")
+
+            cat_labels = {loc.id: f"[{loc.category}] {loc.name}" for loc in db.get_locations()}
+            label_to_cat = {v: k for k, v in cat_labels.items()}
+
+            if "receipt_grid_snapshot" not in st.session_state:
+                grid_rows = [{
+                    "선택": False,
+                    "id": r.id,
+                    "category": cat_labels.get(r.category_id),
+                    "store_name": r.store_name,
+                    "use_date": r.use_date,
+                    "card_type": r.card_type,
+                    "sales_amount": float(r.sales_amount or 0),
+                    "vat": float(r.vat or 0),
+                    "total_amount": float(r.total_amount or 0),
+                    "image_path": r.image_path,
+                    "version": r.version,
+                } for r in db.get_receipts()]
+                unreadable = []
+                grid_src = pd.DataFrame(grid_rows)
+                if not grid_src.empty:
+                    grid_src, unreadable = coerce_grid_dates(grid_src, ["use_date"])
+                st.session_state["receipt_grid_snapshot"] = grid_src
+                st.session_state["receipt_grid_unreadable"] = unreadable
+            grid_df = st.session_state["receipt_grid_snapshot"]
+            if st.session_state.get("receipt_grid_unreadable"):
+                st.warning(f"사용일시를 읽을 수 없는 영수증이 있어 빈 칸으로 표시합니다. (id: {st.session_state['receipt_grid_unreadable']}) 고치지 않으면 저장된 값이 그대로 유지됩니다.")
+
+            if grid_df.empty:
+                st.info("등록된 영수증이 없습니다.")
+            else:
+                edited_df = st.data_editor(
+                    grid_df,
+                    key=f"receipt_grid_{st.session_state.get('receipt_grid_gen', 0)}",
+                    hide_index=True,
+                    num_rows="fixed",
+                    disabled=["id", "version", "image_path"],
+                    column_order=["선택", "category", "store_name", "use_date", "card_type", "sales_amount", "vat", "total_amount"],
+                    column_config={
+                        "선택": st.column_config.CheckboxColumn("선택"),
+                        "category": st.column_config.SelectboxColumn("카테고리", options=list(label_to_cat.keys())),
+                        "store_name": st.column_config.TextColumn("사용처", required=True),
+                        "use_date": st.column_config.DateColumn("사용일시"),
+                        "card_type": st.column_config.TextColumn("카드종류"),
+                        "sales_amount": st.column_config.NumberColumn("판매금액", min_value=0.0, format="%,.0f"),
+                        "vat": st.column_config.NumberColumn("부가세", min_value=0.0, format="%,.0f"),
+                        "total_amount": st.column_config.NumberColumn("합계금액", min_value=0.0, format="%,.0f"),
+                    },
+                    use_container_width=True,
+                )
+
+                edited_df, bad_dates = coerce_grid_dates(edited_df, ["use_date"])
+                if bad_dates:
+                    st.error(f"날짜 형식이 올바르지 않은 행은 저장하지 않습니다. (id: {bad_dates})")
+                selected = edited_df[edited_df["선택"]]
+                # Deletes of the selected rows join the cell edits in one batch
+                delete_selected = st.checkbox(f"선택 항목 삭제 ({len(selected)}건)", key=f"receipt_grid_delete_{st.session_state.get('receipt_grid_gen', 0)}", disabled=selected.empty)
+                deletes = [(int(r["id"]), int(r["version"])) for _, r in selected.iterrows()] if delete_selected else []
+                deleted_ids = {i for i, _ in deletes}
+                updates = [u for u in diff_grid(grid_df, edited_df, ["category", "store_name", "use_date", "card_type", "sales_amount", "vat", "total_amount"])
+                           if u["id"] not in bad_dates and u["id"] not in deleted_ids]
+                for u in updates:
+                    if "category" in u:
+                        u["category_id"] = label_to_cat.get(u.pop("category"))
+                    if u.get("use_date") is not None:
+                        u["use_date"] = u["use_date"].isoformat()
+
+                summary = f"수정 {len(updates)}건 · 삭제 {len(deletes)}건"
+                if st.button(f"💾 변경 사항 저장 ({summary})", disabled=not (updates or deletes), key="receipt_grid_save"):
+                    ok, conflicts = db.apply_receipt_changes(updates, deletes)
+                    if ok:
+                        for img in selected.loc[selected["id"].isin(deleted_ids), "image_path"]:
+                            if img and os.path.exists(img):
                                 try:
-                                    os.remove(item_data[11])
+                                    os.remove(img)
                                 except:
                                     pass
-                            db.delete_receipt(selected_receipt_id)
-                            st.warning("삭제되었습니다.")
-                            st.rerun()
-        else:
-            st.info("등록된 영수증이 없습니다.")
+                        finish_grid_save("receipt_grid", True, f"저장되었습니다! ({summary})")
+                    else:
+                        finish_grid_save("receipt_grid", False, f"다른 사용자가 먼저 수정한 영수증이 있어 아무것도 저장하지 않았습니다. (id: {conflicts}) 최신 내용을 다시 불러왔으니 확인 후 다시 시도해 주세요.")
+
+            if st.button("🔄 새로고침", key="receipt_grid_refresh"):
+                reset_grid("receipt_grid")
+                st.rerun()
+        receipt_grid_panel()
+
+    with tab_receipt4:
+        @fragment
+        def receipt_lines_panel():
+            st.subheader("🛒 영수증 품목을 물품으로 등록")
+            st.caption("OCR로 인식된 품목마다 예전에 같은 상품을 등록했을 때의 이름, 카테고리, 유통기한을 제안합니다. 선택한 품목은 물품으로 등록되고 나머지는 건너뜁니다.")
+            show_message()
+
+            pending = receipt_items.receipts_with_pending_lines()
+            if not pending:
+                st.info("물품으로 등록할 품목이 남은 영수증이 없습니다.")
+                return
+            receipts = {row[0]: row for row in pending}
+            receipt_id = st.selectbox("영수증 선택", list(receipts), key="receipt_lines_pick",
+                                      format_func=lambda i: f"#{i} {receipts[i][1][:10]} {receipts[i][2]} (품목 {receipts[i][3]}개)")
+            use_date = pd.to_datetime(receipts[receipt_id][1]).date() if receipts[receipt_id][1] else None
+
+            locations = db.get_locations()
+            loc_labels = {loc.id: f"[{loc.category}] {loc.name}" for loc in locations}
+            label_to_loc = {v: k for k, v in loc_labels.items()}
+            rows = receipt_items.proposals(receipt_id, use_date)
+            grid_df = pd.DataFrame([{
+                "선택": True,
+                "line_id": row['line_id'],
+                "name": row['name'],
+                "quantity": int(max(1, round(row['quantity']))),
+                "location": loc_labels.get(row['location_id']),
+                "purchase_date": pd.to_datetime(row['purchase_date']).date() if row['purchase_date'] else None,
+                "expiry_date": pd.to_datetime(row['expiry_date']).date() if row['expiry_date'] else None,
+                "amount": float(row['amount'] or 0),
+                "uses": row['uses'],
+            } for row in rows])
+            edited_df = st.data_editor(
+                grid_df,
+                key=f"receipt_lines_grid_{receipt_id}",
+                hide_index=True,
+                num_rows="fixed",
+                disabled=["line_id", "amount", "uses"],
+                column_order=["선택", "name", "quantity", "location", "purchase_date", "expiry_date", "amount", "uses"],
+                column_config={
+                    "선택": st.column_config.CheckboxColumn("선택"),
+                    "name": st.column_config.TextColumn("품명", required=True),
+                    "quantity": st.column_config.NumberColumn("수량", min_value=1, step=1),
+                    "location": st.column_config.SelectboxColumn("카테고리", options=list(label_to_loc.keys())),
+                    "purchase_date": st.column_config.DateColumn("구매일"),
+                    "expiry_date": st.column_config.DateColumn("유통기한"),
+                    "amount": st.column_config.NumberColumn("금액", format="%,.0f"),
+                    "uses": st.column_config.NumberColumn("이전 등록", help="같은 상품을 예전에 등록한 횟수"),
+                },
+                use_container_width=True,
+            )
+
+            selected = edited_df[edited_df["선택"]]
+            if st.button(f"📦 선택한 품목 물품 등록 ({len(selected)}건)", disabled=selected.empty, key="receipt_lines_create"):
+                if selected["name"].isna().any() or (selected["name"].astype(str).str.strip() == "").any():
+                    st.error("품명을 입력해 주세요.")
+                    return
+                items = [{
+                    "line_id": int(r["line_id"]),
+                    "name": str(r["name"]).strip(),
+                    "quantity": int(r["quantity"]) if pd.notna(r["quantity"]) else 1,
+                    "location_id": label_to_loc.get(r["location"]),
+                    "purchase_date": r["purchase_date"].isoformat() if pd.notna(r["purchase_date"]) else None,
+                    "expiry_date": r["expiry_date"].isoformat() if pd.notna(r["expiry_date"]) else None,
+                } for _, r in selected.iterrows()]
+                skipped = [int(i) for i in edited_df.loc[~edited_df["선택"], "line_id"]]
+                created = receipt_items.create_items(receipt_id, items, skip_line_ids=skipped)
+                rerun_with_message(f"{created}개 품목이 물품으로 등록되었습니다." + (f" ({len(skipped)}개 건너뜀)" if skipped else ""))
+        receipt_lines_panel()
+
+elif menu == "지출 분석":
+    import spending
+    st.title("💳 지출 분석")
+    st.caption("영수증이 등록·수정·삭제될 때마다 갱신되는 월별 집계에서 바로 그립니다. 보관된 영수증도 포함됩니다.")
+
+    today = datetime.today().date()
+    this_month = spending.month_key(today)
+    year_ago = today.replace(year=today.year - 1, day=1)
+    months = spending.monthly(year_ago, today)
+    last_month = list(months)[-2]
+    ytd = spending.total_between(today.replace(month=1, day=1), today)
+    last_year = spending.same_day_last_year(today)
+    ytd_before = spending.total_between(last_year.replace(month=1, day=1), last_year)
+
+    def change(now, before):
+        return f"{(now - before) / before:+.1%}" if before else None
+
+    c1, c2, c3 = st.columns(3)
+    c1.metric("이번 달 지출", f"{months[this_month]:,.0f}원", change(months[this_month], months[last_month]),
+              delta_color="inverse", help="지난달 전체 대비")
+    c2.metric("지난달 지출", f"{months[last_month]:,.0f}원")
+    c3.metric(f"{today.year}년 누적", f"{ytd:,.0f}원", change(ytd, ytd_before), delta_color="inverse",
+              help="전년 같은 기간 대비")
+
+    range_val = st.date_input("조회 기간", value=(year_ago, today), key="spending_range")
+    if not (isinstance(range_val, (list, tuple)) and len(range_val) == 2):
+        st.stop()
+    start, end = range_val
+
+    tab_trend, tab_category, tab_store, tab_card, tab_yoy = st.tabs(["추이", "카테고리별", "사용처별", "카드별", "전년 대비"])
+    with tab_trend:
+        st.write("월별 지출")
+        monthly_df = pd.DataFrame(list(spending.monthly(start, end).items()), columns=["월", "지출"]).set_index("월")
+        st.bar_chart(monthly_df)
+        daily_points = spending.daily(start, end)
+        st.write("일별 지출")
+        st.line_chart(pd.DataFrame(daily_points, columns=["날짜", "지출"]).set_index("날짜"))
+        if (end - start).days + 1 > len(daily_points):
+            st.caption(f"{(end - start).days + 1}일을 모양이 유지되도록 {len(daily_points)}개 지점으로 줄여 표시합니다 (LTTB).")
+
+    locations = {str(loc.id): loc for loc in db.get_locations()}
+    dim_labels = {
+        'category': lambda key: f"[{locations[key].category}] {locations[key].name}" if key in locations else "카테고리 없음",
+        'store': lambda key: key or "(사용처 없음)",
+        'card': lambda key: key or "(카드 정보 없음)",
+    }
+    for tab, dim, label in ((tab_category, 'category', "카테고리"), (tab_store, 'store', "사용처"), (tab_card, 'card', "카드")):
+        with tab:
+            totals = spending.totals_by(dim, start, end)
+            if not totals:
+                st.info("이 기간에 등록된 영수증이 없습니다.")
+                continue
+            totals_df = pd.DataFrame([{label: dim_labels[dim](t.key), "건수": t.receipts, "지출": t.total} for t in totals])
+            if dim == 'category' and st.checkbox("대분류로 묶기", key="spending_by_top_category"):
+                totals_df[label] = [locations[t.key].category if t.key in locations else "카테고리 없음" for t in totals]
+                totals_df = totals_df.groupby(label, as_index=False).sum().sort_values("지출", ascending=False)
+            st.bar_chart(totals_df.head(15).set_index(label)["지출"], horizontal=True, sort="-지출")
+            st.dataframe(totals_df, hide_index=True, use_container_width=True,
+                         column_config={"지출": st.column_config.NumberColumn(format="%,.0f원")})
+            # Monthly trend of the biggest values
+            top = [t.key for t in totals[:5]]
+            trend_df = pd.DataFrame([(row.period, dim_labels[dim](row.key), row.total) for row in spending.series(dim, start, end, top)],
+                                    columns=["월", label, "지출"])
+            st.write(f"상위 {len(top)}개 {label} 월별 추이")
+            st.line_chart(trend_df.pivot(index="월", columns=label, values="지출").fillna(0))
+
+    with tab_yoy:
+        year = st.selectbox("연도", list(range(today.year, today.year - 6, -1)), key="spending_yoy_year")
+        yoy_df = pd.DataFrame(spending.year_over_year(year), columns=["월", f"{year}년", f"{year - 1}년"])
+        yoy_df["증감률"] = (yoy_df[f"{year}년"] - yoy_df[f"{year - 1}년"]) / yoy_df[f"{year - 1}년"].where(yoy_df[f"{year - 1}년"] > 0)
+        st.line_chart(yoy_df.set_index("월")[[f"{year}년", f"{year - 1}년"]])
+        st.dataframe(yoy_df, hide_index=True, use_container_width=True, column_config={
+            f"{year}년": st.column_config.NumberColumn(format="%,.0f원"),
+            f"{year - 1}년": st.column_config.NumberColumn(format="%,.0f원"),
+            "증감률": st.column_config.NumberColumn(format="percent"),
+        })
 
 elif menu == "알림 센터":
     st.title("🔔 유통기한 알림")
-    alerts = db.get_expiry_alerts()
+    digest = db.get_latest_expiry_digest()
+    today_str = datetime.now().date().isoformat()
+    import expiry_scheduler
+    # Built here only when no scheduler process has written today's digest, or
+    # items changed and no scheduler is running to pick them up; the rebuild
+    # claims those changes, so later visits just read the digest again
+    stale = digest is None or digest.digest_date != today_str
+    if not stale and db.expiry_changes_pending():
+        stale = not expiry_scheduler.scheduler_running()
+    if stale:
+        expiry_scheduler.run_once()
+        digest = db.get_latest_expiry_digest()
+    
+    alerts = json.loads(digest.payload) if digest and digest.payload else []
+    st.caption(f"알림 기준: {digest.created_at} 생성 (백그라운드 스케줄러: `python expiry_scheduler.py`)")
     
     if alerts:
-        today = datetime.now().date()
+        # One summary toast per digest instead of one per item
+        toast_key = f"expiry_toast_{digest.digest_date}_{digest.created_at}"
+        if not st.session_state.get(toast_key):
+            st.toast(f"만료 {digest.expired}건 · 오늘 만료 {digest.d0}건 · 3일 이내 {digest.d3}건", icon="⚠️")
+            st.session_state[toast_key] = True
+        
         for alt in alerts:
-            expiry = datetime.strptime(alt[3], '%Y-%m-%d').date()
-            diff = (expiry - today).days
-            
+            diff = alt['days_left']
             if diff < 0:
                 severity = "error"
                 label = f"만료됨 ({abs(diff)}일 경과)"
@@ -599,11 +1244,9 @@ elif menu == "알림 센터":
                 severity = "info"
                 label = f"D-{diff}"
             
-            st.toast(f"{alt[1]}이(가) {label} 입니다!", icon="⚠️")
-            
             with st.chat_message("user" if severity=="error" else "assistant"):
-                st.write(f"**{alt[1]}** - {alt[3]} ({label})")
-                st.write(f"위치: {alt[7]} > {alt[1]}") # cat > name
+                st.write(f"**{alt['name']}** - {alt['expiry_date']} ({label})")
+                st.write(f"위치: {alt['category']} > {alt['name']}") # cat > name
     else:
         st.success("유통기한이 임박한 물품이 없습니다. 편안한 하루 되세요! 😊")
 
@@ -617,11 +1260,12 @@ elif menu == "회원 관리":
             reg_un = st.text_input("새 아이디")
             reg_pw = st.text_input("새 비밀번호", type="password")
             reg_pw_confirm = st.text_input("비밀번호 확인", type="password")
+            reg_household = st.text_input("가구 (같은 가구는 같은 데이터를 공유, 비우면 개인 데이터)")
             
             if st.form_submit_button("회원 등록"):
                 if reg_un and reg_pw:
                     if reg_pw == reg_pw_confirm:
-                        if db.register_user(reg_un, reg_pw):
+                        if db.register_user(reg_un, reg_pw, reg_household.strip()):
                             st.success(f"'{reg_un}' 계정이 생성되었습니다.")
                             st.rerun()
                         else:
@@ -635,8 +1279,8 @@ elif menu == "회원 관리":
         st.subheader("회원 목록 및 삭제")
         users = db.get_all_users()
         if users:
-            user_df = pd.DataFrame(users, columns=['ID', 'Username'])
-            st.dataframe(user_df[['Username']], use_container_width=True)
+            user_df = pd.DataFrame(users, columns=['ID', 'Username', 'Household'])
+            st.dataframe(user_df[['Username', 'Household']], use_container_width=True)
             
             st.divider()
             st.write("🗑️ 회원 삭제")
@@ -659,6 +1303,7 @@ elif menu == "회원 관리":
             st.info("등록된 회원이 없습니다.")
 
 elif menu == "데이터 관리":
+    import io
     st.title("💾 데이터 관리 (관리자 전용)")
     
     tab1, tab2 = st.tabs(["데이터 내보내기 (Export)", "데이터 가져오기 (Import)"])
@@ -676,7 +1321,6 @@ elif menu == "데이터 관리":
                 st.dataframe(loc_df.head(), use_container_width=True)
                 
                 try:
-                    import io
                     buffer_loc = io.BytesIO()
                     with pd.ExcelWriter(buffer_loc, engine='openpyxl') as writer:
                         loc_df.to_excel(writer, index=False)
@@ -695,7 +1339,6 @@ elif menu == "데이터 관리":
                 st.dataframe(item_df.head(), use_container_width=True)
                 
                 try:
-                    import io
                     buffer_item = io.BytesIO()
                     with pd.ExcelWriter(buffer_item, engine='openpyxl') as writer:
                         item_df.to_excel(writer, index=False)
@@ -714,7 +1357,6 @@ elif menu == "데이터 관리":
                 st.dataframe(receipt_df.head(), use_container_width=True)
                 
                 try:
-                    import io
                     buffer_receipt = io.BytesIO()
                     with pd.ExcelWriter(buffer_receipt, engine='openpyxl') as writer:
                         receipt_df.to_excel(writer, index=False)
@@ -727,6 +1369,28 @@ elif menu == "데이터 관리":
                     )
                 except ImportError:
                     pass
+        
+        st.divider()
+        st.subheader("변경분(Delta) 내보내기")
+        current_seq = db.get_change_seq()
+        last_seq = int(db.get_setting('delta_export_seq', 0))
+        st.info(f"변경 로그 위치: {current_seq} / 마지막 변경분 내보내기: {last_seq}. "
+                "지정한 위치 이후에 추가·수정·삭제된 데이터만 하나의 Excel 파일(시트별)로 저장합니다.")
+        delta_since = st.number_input("기준 위치 (이 번호 이후의 변경)", min_value=0, max_value=current_seq, value=min(last_seq, current_seq), step=1)
+        if st.button("변경분 조회 및 변환"):
+            import changes_log
+            buffer_delta = io.BytesIO()
+            changes, _ = changes_log.write_delta(int(delta_since), buffer_delta)
+            if changes.full_resync:
+                st.warning("기준 위치 이전의 변경 로그가 정리되어 일부 삭제 내역이 없습니다. 전체 내보내기를 먼저 받아 주세요.")
+            st.write(", ".join(f"{t}: 변경 {len(changes.upserts[t])}건 / 삭제 {len(changes.deletes[t])}건" for t in db.CDC_TABLES))
+            st.download_button(
+                label="📥 변경분 다운로드",
+                data=buffer_delta.getvalue(),
+                file_name=f"mycatalog_delta_{changes.since}_{changes.seq}.xlsx",
+                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                on_click=db.set_setting, args=('delta_export_seq', changes.seq)
+            )
 
     with tab2:
         st.subheader("Excel 파일 업로드 (데이터 교체)")
@@ -793,3 +1457,91 @@ elif menu == "데이터 관리":
                                 st.error(msg)
                     except Exception as e:
                         st.error(f"오류: {e}")
+
+elif menu == "OCR 사용량":
+    import ocr_metrics
+    st.title("📈 OCR 사용량 (관리자 전용)")
+    show_message()
+    usage = ocr_metrics.usage_today()
+    limits = ocr_metrics.budgets()
+    cols = st.columns(len(ocr_metrics.BUDGETS))
+    for col, (_, key, label) in zip(cols, ocr_metrics.BUDGETS):
+        value = f"${usage[key]:.4f}" if key == 'cost' else f"{usage[key]:,}"
+        col.metric(f"오늘 {label}", value, f"한도 {limits[key]:g}" if key in limits else "한도 없음", delta_color="off")
+    budget_message = ocr_metrics.over_budget()
+    if budget_message:
+        st.warning(budget_message)
+
+    days = ocr_metrics.daily_summary(30)
+    if days:
+        daily_df = pd.DataFrame(days, columns=days[0]._fields)
+        st.subheader("일별 집계 (최근 30일)")
+        st.dataframe(daily_df.rename(columns={
+            'day': '날짜', 'calls': '호출', 'failures': '실패', 'fallbacks': '대체 모델', 'prompt_tokens': '입력 토큰',
+            'response_tokens': '출력 토큰', 'image_bytes': '전송 바이트', 'cost': '비용(USD)', 'p50': 'p50(초)', 'p95': 'p95(초)'}),
+            hide_index=True, use_container_width=True)
+        c1, c2 = st.columns(2)
+        with c1:
+            st.write("일별 비용 (USD)")
+            st.bar_chart(daily_df.set_index('day')['cost'].sort_index())
+        with c2:
+            st.write("응답 시간 분포 (최근 7일)")
+            histogram = ocr_metrics.latency_histogram(7)
+            st.bar_chart(pd.DataFrame(histogram, columns=['구간', '호출']).set_index('구간'), sort=False)
+    else:
+        st.info("최근 30일 동안 OCR 호출 기록이 없습니다.")
+
+    st.subheader("단가 및 일일 한도")
+    with st.form("ocr_budget_form"):
+        price_in, price_out = ocr_metrics.prices()
+        c1, c2 = st.columns(2)
+        new_price_in = c1.number_input("입력 토큰 단가 (USD / 100만 토큰)", min_value=0.0, value=price_in, step=0.05, format="%.4f")
+        new_price_out = c2.number_input("출력 토큰 단가 (USD / 100만 토큰)", min_value=0.0, value=price_out, step=0.05, format="%.4f")
+        st.caption("한도를 0으로 두면 제한하지 않습니다. 한도에 도달하면 OCR 요청은 다음 날까지 대기합니다.")
+        limit_cols = st.columns(len(ocr_metrics.BUDGETS))
+        new_limits = {key: col.number_input(label, min_value=0.0, value=float(limits.get(usage_key, 0)), step=1.0)
+                      for col, (key, usage_key, label) in zip(limit_cols, ocr_metrics.BUDGETS)}
+        if st.form_submit_button("저장"):
+            db.set_setting('ocr_price_input', new_price_in)
+            db.set_setting('ocr_price_output', new_price_out)
+            for key, value in new_limits.items():
+                db.set_setting(key, value)
+            rerun_with_message("OCR 단가와 한도가 저장되었습니다.")
+
+elif menu == "DB 상태":
+    import db_maintenance
+    st.title("🩺 DB 상태 (관리자 전용)")
+    show_message()
+    health = db_maintenance.health()
+    size_mb = health.page_count * health.page_size / 1e6
+    free_ratio = health.freelist_count / health.page_count if health.page_count else 0
+    c1, c2, c3, c4 = st.columns(4)
+    c1.metric("파일 크기", f"{size_mb:.1f}MB", f"{health.page_count:,} 페이지", delta_color="off")
+    c2.metric("빈 페이지", f"{health.freelist_count:,}", f"{free_ratio:.1%}", delta_color="off")
+    c3.metric("WAL 크기", f"{health.wal_bytes / 1e6:.1f}MB")
+    c4.metric("ANALYZE 이후 변경", f"{health.churn:,}건", f"전체 {health.rows:,}건", delta_color="off")
+    st.caption(f"auto_vacuum: {health.auto_vacuum} · 페이지 크기 {health.page_size}B · "
+               "백그라운드 스케줄러: `python db_maintenance.py`")
+
+    due = db_maintenance.plan(health)
+    last = db_maintenance.last_runs()
+    st.subheader("정리 작업")
+    st.dataframe(pd.DataFrame(
+        [{'작업': label, '마지막 실행': last[action] or '-', '지금 필요': '예' if action in due else ''}
+         for action, _, label in db_maintenance.ACTIONS]), hide_index=True, use_container_width=True)
+    b1, b2 = st.columns(2)
+    if b1.button("🧹 필요한 작업 실행", disabled=not due):
+        timings = db_maintenance.run(due)
+        rerun_with_message("완료: " + ", ".join(f"{a} {t:.2f}초" for a, t in timings.items()))
+    if b2.button("전체 정리 (VACUUM 포함)"):
+        timings = db_maintenance.tick(force=True)
+        rerun_with_message("완료: " + ", ".join(f"{a} {t:.2f}초" for a, t in timings.items()))
+
+    st.subheader("테이블 / 인덱스별 크기")
+    # dbstat walks every page of the file, so only on request
+    if st.button("크기 조회 (dbstat)"):
+        objects = db_maintenance.storage_by_object()
+        st.dataframe(pd.DataFrame(
+            [{'이름': o.name, '종류': o.type, '테이블': o.table_name, '페이지': o.pages,
+              '크기(MB)': round(o.size_bytes / 1e6, 2), '미사용 비율': f"{o.unused_bytes / o.size_bytes:.0%}" if o.size_bytes else '-'}
+             for o in objects]), hide_index=True, use_container_width=True)
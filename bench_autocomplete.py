@@ -0,0 +1,76 @@
+"""
+Autocomplete benchmark.
+Fills a scratch database with receipts over N distinct store names (Zipf-like
+usage), then times database.suggest_names for empty, 1-2 character (prefix)
+and 3+ character (trigram index) queries against the 10ms budget, and the
+trigger overhead of keeping name_counts current on insert.
+
+    python bench_autocomplete.py [distinct_names] [receipts]
+"""
+import os
+import sys
+import time
+import random
+import sqlite3
+import tempfile
+import database as db
+
+BUDGET_MS = 10
+SYLLABLES = "가나다라마바사아자차카타파하강남동서신한현대롯데이마트홈플러스편의점약국카페빵집식당"
+
+def make_names(n, rng):
+    names = set()
+    while len(names) < n:
+        names.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 8))) + rng.choice(["", " 본점", " 지점", "점"]))
+    return list(names)
+
+def insert_receipts(stores, drop_name_triggers=False):
+    conn = sqlite3.connect(db.DB_PATH)
+    if drop_name_triggers:
+        triggers = conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'trg_receipts_%_names_%'").fetchall()
+        for (name,) in triggers:
+            conn.execute(f"DROP TRIGGER {name}")
+    start = time.perf_counter()
+    conn.executemany("INSERT INTO receipts (store_name, card_type, use_date) VALUES (?, '신한카드', '2025-01-01')",
+                     ((s,) for s in stores))
+    conn.commit()
+    conn.close()
+    return time.perf_counter() - start
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+def main():
+    n_names = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    n_receipts = int(sys.argv[2]) if len(sys.argv) > 2 else 200_000
+    rng = random.Random(7)
+    with tempfile.TemporaryDirectory() as tmp:
+        names = make_names(n_names, rng)
+        stores = rng.choices(names, weights=[1 / (i + 1) for i in range(n_names)], k=n_receipts)
+        db.DB_PATH = os.path.join(tmp, "plain.db")
+        db.init_db()
+        without = insert_receipts(stores, drop_name_triggers=True)
+        db.DB_PATH = os.path.join(tmp, "bench.db")
+        db.init_db()
+        with_triggers = insert_receipts(stores)
+        print(f"{n_names:,} store names, {n_receipts:,} receipts")
+        print(f"  insert: {with_triggers:.2f}s with name triggers, {without:.2f}s without")
+        failed = False
+        for label, length in (("empty", 0), ("1 char", 1), ("2 chars", 2), ("3 chars", 3), ("5 chars", 5)):
+            times = []
+            for _ in range(500):
+                name = rng.choice(names).replace(" ", "")
+                # Short input matches as a prefix, longer input anywhere
+                start_at = rng.randint(0, max(len(name) - length, 0)) if length >= 3 else 0
+                query = name[start_at:start_at + length]
+                start = time.perf_counter()
+                db.suggest_names('store', query)
+                times.append(time.perf_counter() - start)
+            p50, p99 = percentile(times, 0.5) * 1e3, percentile(times, 0.99) * 1e3
+            failed |= p99 > BUDGET_MS
+            print(f"  {label:<8} p50 {p50:6.2f}ms  p99 {p99:6.2f}ms")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
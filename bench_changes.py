@@ -0,0 +1,65 @@
+"""
+Change log benchmark.
+Fills a scratch database with N items, changes a small fraction of them, then
+compares a full export with a delta export of just the changes, and measures
+what the CDC triggers add to a bulk insert and how much compaction removes.
+
+    python bench_changes.py [items] [changed_percent]
+"""
+import os
+import sys
+import time
+import random
+import sqlite3
+import tempfile
+import database as db
+
+def insert_items(n, drop_cdc=False):
+    conn = sqlite3.connect(db.DB_PATH)
+    if drop_cdc:
+        for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'trg_%_cdc_%'").fetchall():
+            conn.execute(f"DROP TRIGGER {name}")
+    conn.execute("INSERT INTO locations (name, category, is_food) VALUES ('냉장고', '냉장실', 1)")
+    start = time.perf_counter()
+    conn.executemany(
+        "INSERT INTO items (name, purchase_date, expiry_date, quantity, location_id) VALUES (?, '2025-01-01', '2026-01-01', 1, 1)",
+        ((f"item-{i}",) for i in range(n)))
+    conn.commit()
+    conn.close()
+    return time.perf_counter() - start
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    percent = float(sys.argv[2]) if len(sys.argv) > 2 else 1.0
+    rng = random.Random(3)
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, "plain.db")
+        db.init_db()
+        without = insert_items(n, drop_cdc=True)
+        db.DB_PATH = os.path.join(tmp, "bench.db")
+        db.init_db()
+        with_cdc = insert_items(n)
+        print(f"{n:,} items: insert {with_cdc:.2f}s with change log, {without:.2f}s without")
+
+        since = db.get_change_seq()
+        changed = rng.sample(range(1, n + 1), int(n * percent / 100))
+        conn = sqlite3.connect(db.DB_PATH)
+        conn.executemany("UPDATE items SET quantity = quantity + 1, version = version + 1 WHERE id = ?", ((i,) for i in changed))
+        conn.executemany("DELETE FROM items WHERE id = ?", ((i,) for i in changed[:len(changed) // 10]))
+        conn.commit()
+        conn.close()
+
+        full_time, (_, item_df, _) = timed(db.export_all_data)
+        delta_time, (changes, frames) = timed(db.export_delta, since)
+        print(f"  full export   {full_time * 1e3:8.1f}ms  {len(item_df):,} item rows")
+        print(f"  delta export  {delta_time * 1e3:8.1f}ms  {len(frames['items']):,} changed + {len(changes.deletes['items']):,} deleted")
+        compact_time, removed = timed(db.compact_changes)
+        print(f"  compaction    {compact_time * 1e3:8.1f}ms  removed {removed:,} superseded entries")
+
+if __name__ == "__main__":
+    main()
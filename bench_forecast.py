@@ -0,0 +1,103 @@
+"""
+Consumption forecast benchmark.
+Fills a scratch database with N items and a few months of consumption and
+restock events each, then times the full NumPy build of the forecast state
+(next to a per-item Python loop over the same events, which must agree), the
+incremental refresh after a batch of new events, and the dashboard's
+"곧 떨어질 물품" list. Exits non-zero when the dashboard list misses the budget.
+
+    python bench_forecast.py [items] [events_per_item] [--budget SECONDS]
+"""
+import os
+import sys
+import math
+import time
+import random
+import argparse
+import sqlite3
+import tempfile
+import statistics
+from collections import defaultdict
+import database as db
+import forecast
+
+BUDGET_SECONDS = 0.5  # dashboard list at 100k items
+
+def fill(n, per_item, rng):
+    conn = sqlite3.connect(db.DB_PATH)
+    conn.execute("INSERT INTO locations (name, category, is_food) VALUES ('냉장고', '냉장실', 1)")
+    conn.executemany(
+        "INSERT INTO items (name, purchase_date, quantity, location_id) VALUES (?, date('now', ?), ?, 1)",
+        ((f"item-{i}", f"-{rng.randrange(10, 150)} days", rng.randrange(1, 20)) for i in range(n)))
+    now = forecast.now_julian()
+    events = []
+    for item_id in range(1, n + 1):
+        for _ in range(per_item):
+            delta = -rng.choice((0.5, 1, 1, 2)) if rng.random() < 0.8 else rng.randrange(1, 10)
+            events.append((item_id, delta, 0, now - rng.uniform(0, 120)))
+    conn.executemany("INSERT INTO quantity_events (item_id, delta, quantity, event_day) VALUES (?, ?, ?, ?)", events)
+    conn.commit()
+    conn.close()
+
+def loop_forecast(now):
+    # Baseline: the same model with a Python loop over items and their events
+    conn = db.get_read_connection()
+    events = defaultdict(list)
+    for item_id, day, delta, quantity in conn.execute(
+            'SELECT item_id, event_day, delta, quantity FROM quantity_events ORDER BY id'):
+        events[item_id].append((day, delta, quantity))
+    conn.close()
+    result = {}
+    for item_id, rows in events.items():
+        tau = forecast.TAU_DAYS
+        weighted = sum(-delta * math.exp((day - now) / tau) for day, delta, _ in rows if delta < 0)
+        age = max(now - min(day for day, _, _ in rows), forecast.MIN_AGE_DAYS)
+        rate = weighted / (tau * (1 - math.exp(-age / tau)))
+        result[item_id] = now + rows[-1][2] / rate if rate > 0 else float('inf')
+    return result
+
+def consume_batch(n, rng):
+    db.record_quantity_events([(rng.randrange(1, n + 1), -1) for _ in range(200)])
+
+def timed(fn, runs=5):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), result
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("items", type=int, nargs="?", default=100_000)
+    parser.add_argument("events", type=int, nargs="?", default=8, help="events per item")
+    parser.add_argument("--budget", type=float, default=BUDGET_SECONDS)
+    args = parser.parse_args()
+    rng = random.Random(4)
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, "bench.db")
+        db.init_db()
+        fill(args.items, args.events, rng)
+        now = forecast.now_julian()
+
+        build, model = timed(forecast.build, runs=3)
+        loop, baseline = timed(lambda: loop_forecast(now), runs=1)
+        ids, _, _, run_out = model.forecast(now)
+        differ = sum(1 for i, r in zip(ids.tolist(), run_out.tolist())
+                     if not math.isclose(r, baseline[i], rel_tol=1e-9) and r != baseline[i])
+        first, _ = timed(lambda: forecast.current_model(wait=float('inf')), runs=1)
+        refresh, _ = timed(lambda: (consume_batch(args.items, rng), forecast.current_model()), runs=5)
+        dashboard, soon = timed(lambda: forecast.run_out_soon(14, 20), runs=20)
+
+        print(f"{args.items:,} items, {args.items * args.events:,} events")
+        print(f"  full build (NumPy)  {build * 1e3:8.1f}ms")
+        print(f"  per-item loop       {loop * 1e3:8.1f}ms  ({differ} items differ)")
+        print(f"  first page (build)  {first * 1e3:8.1f}ms  (background, pages wait {forecast.BUILD_WAIT_SECONDS * 1e3:.0f}ms at most)")
+        print(f"  +200 events refresh {refresh * 1e3:8.2f}ms  (incl. writing them)")
+        print(f"  dashboard list      {dashboard * 1e3:8.2f}ms  {len(soon)} items  (budget {args.budget * 1e3:.0f}ms)")
+        if differ or dashboard > args.budget:
+            print("FAIL: forecast differs from the baseline" if differ else "FAIL: dashboard list over budget")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
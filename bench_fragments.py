@@ -0,0 +1,158 @@
+"""
+Partial rerun benchmark for app.py.
+Fills a scratch database with N items and receipts, then drives the app with
+streamlit's AppTest through the interactions that live in fragments (picking
+an item / category / receipt to edit, changing a list filter, switching the
+add form's category, uploading a receipt) and reports per interaction:
+
+  before  the full script rerun every interaction used to cost
+          (page config, auth DB, CSS, sidebar and every panel's queries)
+  after   the run of the fragment that owns the widget, which is all a
+          fragment rerun executes now
+
+AppTest always reruns the whole script, so "after" is measured as the time
+spent inside that fragment during the full rerun (st.fragment is wrapped with
+a timer); the server adds its fixed per-rerun overhead to both.
+
+    python bench_fragments.py [items] [receipts] [--runs N]
+"""
+import io
+import os
+import sys
+import time
+import random
+import argparse
+import functools
+import sqlite3
+import tempfile
+import statistics
+import unicodedata
+from collections import defaultdict
+from datetime import date, timedelta
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_PATH = os.path.join(APP_DIR, "app.py")
+RUN_TIMEOUT = 60
+
+fragment_seconds = {}  # fragment name -> duration of its last run
+
+def time_fragments():
+    # app.py decorates its panels through st.fragment on every run
+    import streamlit as st
+    real_fragment = st.fragment
+    def timed_fragment(fn, **options):
+        @functools.wraps(fn)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                fragment_seconds[fn.__name__] = time.perf_counter() - start
+        return real_fragment(timed, **options)
+    st.fragment = timed_fragment
+
+def fill(path, n_items, n_receipts, rng):
+    conn = sqlite3.connect(path)
+    categories = ["냉장고", "냉동실", "욕실", "주방", "창고"]
+    conn.executemany("INSERT INTO locations (name, category, is_food) VALUES (?, ?, ?)",
+                     [(f"{c} {i}", c, int(c in ("냉장고", "냉동실"))) for c in categories for i in range(3)])
+    today = date.today()
+    conn.executemany(
+        "INSERT INTO items (name, purchase_date, expiry_date, quantity, location_id) VALUES (?, ?, ?, ?, ?)",
+        ((f"item-{i}", (today - timedelta(days=rng.randrange(200))).isoformat(),
+          (today + timedelta(days=rng.randrange(-30, 400))).isoformat(), rng.randrange(1, 10), rng.randrange(1, 16))
+         for i in range(n_items)))
+    conn.executemany(
+        "INSERT INTO receipts (category_id, store_name, use_date, total_amount) VALUES (?, ?, ?, ?)",
+        ((rng.randrange(1, 16), f"store-{i % 300}", (today - timedelta(days=rng.randrange(300))).isoformat(),
+          rng.randrange(1000, 100000)) for i in range(n_receipts)))
+    conn.commit()
+    conn.close()
+
+def receipt_jpeg(rng):
+    from PIL import Image
+    image = Image.frombytes("L", (64, 96), bytes(rng.randrange(256) for _ in range(64 * 96)))
+    buffer = io.BytesIO()
+    image.convert("RGB").save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+def pad(text, width):
+    # Hangul takes two terminal columns
+    return text + " " * (width - sum(2 if unicodedata.east_asian_width(c) == "W" else 1 for c in text))
+
+def widget(elements, label):
+    return next(e for e in elements if e.label == label)
+
+def pick_other(selectbox, rng, candidates=None):
+    # The options are formatted labels; map candidate values through the app's
+    # format_func to find which ones are listed, then pick another one
+    labels = set(selectbox.options)
+    values = [v for v in (candidates or selectbox.options) if str(selectbox.format_func(v)) in labels]
+    return selectbox.set_value(rng.choice([v for v in values if v != selectbox.value] or values))
+
+def upload(at, rng):
+    return at.get("file_uploader")[0].set_value((f"r{rng.random()}.jpg", receipt_jpeg(rng), "image/jpeg"))
+
+# (menu, interaction, fragment that owns the widget, widget label or step, candidate ids)
+INTERACTIONS = [
+    ("물품 관리", "pick item", "item_editor", "수정 또는 삭제할 물품을 선택하세요", "items"),
+    ("물품 관리", "filter", "item_browser", "조회할 대분류 선택", None),
+    ("물품 관리", "add category", "add_item_panel", "카테고리 선택", None),
+    ("카테고리 설정", "pick category", "location_editor", "관리할 카테고리 선택", "locations"),
+    ("영수증 관리", "pick receipt", "receipt_editor", "관리할 영수증 선택", "receipts"),
+    ("영수증 관리", "filter", "receipt_browser", "카테고리로 필터링", None),
+    ("영수증 관리", "upload", "receipt_capture_panel", upload, None),
+]
+
+def main():
+    parser = argparse.ArgumentParser(description="Full vs fragment rerun timings for app.py")
+    parser.add_argument("items", type=int, nargs="?", default=5000)
+    parser.add_argument("receipts", type=int, nargs="?", default=2000)
+    parser.add_argument("--runs", type=int, default=10, help="runs per interaction (default 10)")
+    args = parser.parse_args()
+    rng = random.Random(7)
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["MYCATALOG_TENANCY"] = "single"
+        sys.path.insert(0, APP_DIR)
+        import database as db
+        db.DB_PATH = os.path.join(tmp, "bench.db")
+        db.init_db()
+        fill(db.DB_PATH, args.items, args.receipts, rng)
+        os.chdir(tmp)  # uploads/ goes to the scratch dir
+
+        time_fragments()
+        from streamlit.testing.v1 import AppTest
+        at = AppTest.from_file(APP_PATH, default_timeout=RUN_TIMEOUT)
+        at.session_state["logged_in"] = True
+        at.session_state["user_id"] = 1
+        at.session_state["username"] = "skpark"
+        at.session_state["db_path"] = db.DB_PATH
+        at.run()
+
+        full = defaultdict(list)
+        partial = defaultdict(list)
+        ids = {"items": range(1, args.items + 1), "receipts": range(1, args.receipts + 1), "locations": range(1, 16)}
+        for menu, name, owner, target, candidates in INTERACTIONS:
+            at.sidebar.selectbox[0].set_value(menu).run()
+            for _ in range(args.runs):
+                if callable(target):
+                    target(at, rng)
+                else:
+                    pick_other(widget(at.selectbox, target), rng, ids.get(candidates))
+                fragment_seconds.clear()
+                start = time.perf_counter()
+                at.run()
+                full[(menu, name)].append(time.perf_counter() - start)
+                if at.exception:
+                    raise RuntimeError(at.exception[0].value)
+                partial[(menu, name)].append(fragment_seconds[owner])
+
+        print(f"{args.items:,} items, {args.receipts:,} receipts, median of {args.runs} runs")
+        print(f"{pad('interaction', 30)} {'fragment':<22} {'before':>9} {'after':>9}")
+        for menu, name, owner, _, _ in INTERACTIONS:
+            before = statistics.median(full[(menu, name)]) * 1e3
+            after = statistics.median(partial[(menu, name)]) * 1e3
+            print(f"{pad(menu + ' / ' + name, 30)} {owner:<22} {before:7.1f}ms {after:7.1f}ms  ({before / after:.1f}x)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Near-duplicate receipt lookup benchmark.
+Fills a scratch database with N receipts carrying random 64-bit image hashes,
+then times database.find_similar_receipts for near-duplicates (a few flipped
+bits) and for unseen hashes, and checks that every planted duplicate is found.
+Also reports the dHash distance between a synthetic receipt image and a
+re-encoded, brightened re-shot of it.
+
+    python bench_image_hash.py [receipts] [lookups]
+"""
+import io
+import os
+import sys
+import time
+import random
+import sqlite3
+import tempfile
+import database as db
+import image_hash
+
+def fill(n, rng):
+    hashes = [rng.getrandbits(64) for _ in range(n)]
+    conn = sqlite3.connect(db.DB_PATH)
+    conn.executemany(
+        "INSERT INTO receipts (id, store_name, use_date, total_amount, image_path) VALUES (?, 'store', '2025-01-01', 1000, ?)",
+        ((i + 1, f"uploads/r{i}.jpg") for i in range(n))
+    )
+    conn.commit()
+    conn.close()
+    db.save_image_hashes([(f"uploads/r{i}.jpg", h) for i, h in enumerate(hashes)])
+    return hashes
+
+def flip_bits(h, k, rng):
+    for b in rng.sample(range(64), k):
+        h ^= 1 << b
+    return h
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+def time_lookups(queries):
+    times, results = [], []
+    for q in queries:
+        start = time.perf_counter()
+        results.append(db.find_similar_receipts(q))
+        times.append(time.perf_counter() - start)
+    return times, results
+
+def reshot_distance():
+    from PIL import Image, ImageDraw, ImageEnhance
+    img = Image.new('L', (900, 1600), 245)
+    draw = ImageDraw.Draw(img)
+    rng = random.Random(1)
+    for y in range(80, 1500, 40):
+        draw.rectangle((60, y, 60 + rng.randint(200, 780), y + 14), fill=30)
+    original, reshot = io.BytesIO(), io.BytesIO()
+    img.convert('RGB').save(original, 'JPEG', quality=95)
+    ImageEnhance.Brightness(img.convert('RGB')).enhance(1.15).resize((720, 1280)).save(reshot, 'JPEG', quality=60)
+    original.seek(0)
+    reshot.seek(0)
+    return (image_hash.dhash(original) ^ image_hash.dhash(reshot)).bit_count()
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    lookups = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    rng = random.Random(42)
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, "bench.db")
+        db.init_db()
+        hashes = fill(n, rng)
+        print(f"{n:,} receipts, {lookups} lookups each")
+
+        targets = rng.sample(range(n), lookups)
+        near = [flip_bits(hashes[i], rng.randint(0, 6), rng) for i in targets]
+        times, results = time_lookups(near)
+        missed = sum(1 for i, r in zip(targets, results) if (i + 1) not in {rec.id for _, rec in r})
+        print(f"  near-duplicate  p50 {percentile(times, 0.5) * 1e3:.3f}ms  p99 {percentile(times, 0.99) * 1e3:.3f}ms  missed {missed}")
+
+        unseen = [rng.getrandbits(64) for _ in range(lookups)]
+        times, _ = time_lookups(unseen)
+        print(f"  unseen          p50 {percentile(times, 0.5) * 1e3:.3f}ms  p99 {percentile(times, 0.99) * 1e3:.3f}ms")
+    print(f"dHash distance original vs re-shot: {reshot_distance()} bits")
+
+if __name__ == "__main__":
+    main()
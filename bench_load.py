@@ -0,0 +1,273 @@
+"""
+Load test for app.py.
+Runs N scripted user sessions concurrently with streamlit's AppTest against a
+scratch data directory: login, dashboard, add an item, edit it, upload a
+receipt and run OCR (the OCR backend is replaced by a stub with a fixed delay
+and each session works the job queue itself), register the receipt, then the
+notification and category pages (plus the admin pages for the admin account).
+Every rerun is timed and reported per menu and action as latency percentiles
+and error rate (exceptions, missing widgets, and the app's own st.error
+messages).
+
+Each session runs in its own process (AppTest is not thread-safe), so writes
+contend on the SQLite file lock rather than one server's writer queue, and
+sessions are not serialized by one interpreter lock: on a multi-core machine the
+numbers are optimistic for a single server process.
+
+    python bench_load.py [--users N] [--iterations N] [--households N]
+                         [--ocr-delay SECONDS] [--think SECONDS]
+
+--households > 0 runs in per-household database mode with the users spread
+over that many households; 0 keeps everyone in one shared database.
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import unicodedata
+import multiprocessing
+from collections import defaultdict
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_PATH = os.path.join(APP_DIR, "app.py")
+PASSWORD = "load-test"
+RUN_TIMEOUT = 60
+WARMUP_SECONDS = 5  # worker start-up (streamlit import) before the sessions begin
+
+class Recorder:
+    def __init__(self):
+        self.samples = defaultdict(list)  # (menu, action) -> [ms]
+        self.errors = defaultdict(list)   # (menu, action) -> [message]
+
+    def add(self, key, ms, error=None):
+        self.samples[key].append(ms)
+        if error:
+            self.errors[key].append(error)
+
+    def merge(self, samples, errors):
+        for key, values in samples.items():
+            self.samples[key].extend(values)
+        for key, messages in errors.items():
+            self.errors[key].extend(messages)
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+def stub_ocr(delay):
+    # Stands in for the Gemini backend: same result shape, fixed latency, no
+    # network. Calls still go through ocr_metrics (budget check, ocr_calls row).
+    import ocr_helper
+
+    class StubBackend(ocr_helper.OcrBackend):
+        name = "stub"
+
+        def request(self, image_file, timings, meta):
+            time.sleep(delay)
+            return json.dumps({
+                'store_name': random.choice(["이마트 성수점", "GS25 역삼점", "스타벅스 강남R점"]),
+                'store_address': "서울특별시",
+                'card_type': "신한카드",
+                'card_number': "1234-****-****-5678",
+                'use_date': time.strftime("%Y-%m-%d %H:%M:%S"),
+                'sales_amount': 9091.0,
+                'vat': 909.0,
+                'total_amount': 10000.0,
+                'lines': [],
+            }, ensure_ascii=False)
+
+        def parse(self, raw):
+            return json.loads(raw)
+
+    ocr_helper.get_backend = lambda name=None: StubBackend()
+
+def process_ocr(at, worker):
+    # No worker process runs under AppTest: the session works the queue itself
+    # (as the page's "이 창에서 바로 분석" button does) until its job is finished,
+    # then reruns so the page loads the result into the form
+    import database as db
+    import ocr_worker
+    job_id = at.session_state["ocr_job_id"]
+    deadline = time.monotonic() + RUN_TIMEOUT
+    with db.using_db(at.session_state["db_path"]):
+        while db.get_ocr_job(job_id).status not in ("done", "failed"):
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"OCR job {job_id} not finished")
+            # Another session may hold the claim on this job; wait for it
+            if ocr_worker.run_pending(worker) == (0, 0):
+                time.sleep(0.05)
+    at.run()
+
+def receipt_jpeg(rng):
+    # Random noise, so every upload has its own image hash (no duplicate warning)
+    from PIL import Image
+    image = Image.frombytes("L", (64, 96), bytes(rng.randrange(256) for _ in range(64 * 96)))
+    buffer = io.BytesIO()
+    image.convert("RGB").save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+def button(at, label):
+    return next(b for b in at.button if b.label.startswith(label))
+
+def widget(elements, label, form=None):
+    return next(e for e in elements if e.label == label and (form is None or e.form_id.startswith(form)))
+
+def type_new_option(selectbox, text):
+    # AppTest can only pick listed options; a typed new name (accept_new_options)
+    # reaches the app as the selected string, so list it first
+    if text not in selectbox.options:
+        selectbox.options.append(text)
+    return selectbox.set_value(text)
+
+def timed_run(at, rec, menu, action, step):
+    """Applies `step` (widget interactions, then .run()) and records the rerun."""
+    start = time.perf_counter()
+    error = None
+    try:
+        step()
+        if at.exception:
+            error = at.exception[0].value
+        elif at.error:  # the app's own failure messages (validation, conflicts)
+            error = at.error[0].value
+    except Exception as e:  # widget missing, timeout ...
+        error = f"{type(e).__name__}: {e}"
+    rec.add((menu, action), (time.perf_counter() - start) * 1e3, error)
+    return error is None
+
+def session(user, iterations, rec, rng, think):
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_file(APP_PATH, default_timeout=RUN_TIMEOUT)
+    timed_run(at, rec, "로그인", "page", at.run)
+
+    def login():
+        at.text_input[0].input(user)
+        at.text_input[1].input(PASSWORD)
+        button(at, "로그인").click().run()
+    if not timed_run(at, rec, "로그인", "submit", login):
+        return
+
+    def go(menu):
+        return lambda: at.sidebar.selectbox[0].set_value(menu).run()
+
+    admin_menus = [m for m in ("회원 관리", "데이터 관리") if m in at.sidebar.selectbox[0].options]
+    for i in range(iterations):
+        tag = f"{user}-{i}"
+        timed_run(at, rec, "대시보드", "page", go("대시보드"))
+        time.sleep(think)
+
+        timed_run(at, rec, "물품 관리", "page", go("물품 관리"))
+        timed_run(at, rec, "물품 관리", "add item",
+                  lambda: (type_new_option(widget(at.selectbox, "📦 품목명"), f"물품 {tag}"), button(at, "등록").click().run()))
+        # The form keeps the submitted name, which the options rendered before the insert lack
+        type_new_option(widget(at.selectbox, "📦 품목명"), f"물품 {tag}")
+        timed_run(at, rec, "물품 관리", "edit item",
+                  lambda: (widget(at.number_input, "수량", form="edit_form").set_value(float(rng.randint(1, 9))),
+                           button(at, "💾 수정 사항 저장").click().run()))
+        time.sleep(think)
+
+        timed_run(at, rec, "영수증 관리", "page", go("영수증 관리"))
+        jpeg = receipt_jpeg(rng)
+        timed_run(at, rec, "영수증 관리", "upload",
+                  lambda: at.get("file_uploader")[0].set_value((f"{tag}.jpg", jpeg, "image/jpeg")).run())
+        timed_run(at, rec, "영수증 관리", "ocr",
+                  lambda: (button(at, "🖼️ 이미지 분석 (OCR) 실행").click().run(), process_ocr(at, f"load:{user}")))
+        timed_run(at, rec, "영수증 관리", "register", lambda: button(at, "영수증 등록").click().run())
+        time.sleep(think)
+
+        timed_run(at, rec, "알림 센터", "page", go("알림 센터"))
+        timed_run(at, rec, "카테고리 설정", "page", go("카테고리 설정"))
+        for menu in admin_menus:
+            timed_run(at, rec, menu, "page", go(menu))
+        time.sleep(think)
+
+def configure(tmp, households):
+    # Points database.py at the scratch data dir; must run before app.py is first executed
+    os.environ["MYCATALOG_TENANCY"] = "household" if households else "single"
+    os.environ["MYCATALOG_DATA_DIR"] = os.path.join(tmp, "data")
+    sys.path.insert(0, APP_DIR)
+    import database as db
+    db.DB_PATH = os.path.join(tmp, "mycatalog.db")
+    return db
+
+def setup(tmp, users, households):
+    # Scratch accounts, each with a category to add items to
+    db = configure(tmp, households)
+    db.ensure_db(db.auth_db_path())
+    names = ["skpark"] + [f"load{i}" for i in range(1, users)]
+    for i, name in enumerate(names[1:], 1):
+        db.register_user(name, PASSWORD, f"home{i % households}" if households else None)
+    # The default admin (one of the sessions) gets the load-test password too
+    with db.using_db(db.auth_db_path()):
+        db.writes(lambda cursor: cursor.execute(
+            "UPDATE users SET password_hash = ?, household = ? WHERE username = 'skpark'",
+            (db.hash_password(PASSWORD), "home0" if households else None)))()
+    for name in names:
+        user = next(u for u in db.get_all_users() if u.username == name)
+        with db.using_db(db.user_db_path(user)):
+            db.ensure_db()
+            if not db.get_locations():
+                db.add_location("냉장고", "냉장실", None, True)
+    return names
+
+def worker_init(tmp, households, ocr_delay):
+    configure(tmp, households)
+    stub_ocr(ocr_delay)
+    os.chdir(tmp)  # uploads/ goes to the scratch dir
+
+def run_session(user, iterations, seed, think, start_at):
+    # Sessions start together once every worker has imported streamlit
+    time.sleep(max(0.0, start_at - time.time()))
+    rec = Recorder()
+    session(user, iterations, rec, random.Random(seed), think)
+    return dict(rec.samples), dict(rec.errors)
+
+def pad(text, width):
+    # Hangul takes two terminal columns
+    return text + " " * (width - sum(2 if unicodedata.east_asian_width(c) == "W" else 1 for c in text))
+
+def report(rec, wall):
+    print(f"{pad('menu', 14)} {'action':<10} {'runs':>5} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8} {'errors':>7}")
+    total = errors = 0
+    for (menu, action), values in sorted(rec.samples.items()):
+        failed = len(rec.errors[(menu, action)])
+        total += len(values)
+        errors += failed
+        print(f"{pad(menu, 14)} {action:<10} {len(values):>5} "
+              + " ".join(f"{percentile(values, q):>6.0f}ms" for q in (50, 90, 99))
+              + f" {max(values):>6.0f}ms {failed / len(values):>6.1%}")
+    print(f"{total} reruns in {wall:.1f}s ({total / wall:.1f}/s), {errors} errors")
+    for key, messages in sorted(rec.errors.items()):
+        if messages:
+            print(f"  {key[0]} / {key[1]}: {messages[0]}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent session load test for app.py")
+    parser.add_argument("--users", type=int, default=8, help="concurrent sessions (default 8)")
+    parser.add_argument("--iterations", type=int, default=3, help="scripted rounds per session (default 3)")
+    parser.add_argument("--households", type=int, default=0, help="per-household DBs over N households (default: shared DB)")
+    parser.add_argument("--ocr-delay", type=float, default=0.5, help="stub OCR latency in seconds (default 0.5)")
+    parser.add_argument("--think", type=float, default=0.0, help="pause between pages in seconds (default 0)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        names = setup(tmp, args.users, args.households)
+        # AppTest keeps a process-wide runtime per run, so each session gets a process
+        context = multiprocessing.get_context("spawn")
+        with context.Pool(len(names), worker_init, (tmp, args.households, args.ocr_delay)) as pool:
+            start_at = time.time() + WARMUP_SECONDS
+            results = pool.starmap(run_session, [(name, args.iterations, i, args.think, start_at)
+                                                 for i, name in enumerate(names)])
+        wall = time.time() - start_at
+        rec = Recorder()
+        for samples, errors in results:
+            rec.merge(samples, errors)
+        mode = f"{args.households} households" if args.households else "shared DB"
+        print(f"{args.users} sessions x {args.iterations} rounds, {mode}, OCR stub {args.ocr_delay}s")
+        report(rec, wall)
+
+if __name__ == "__main__":
+    main()
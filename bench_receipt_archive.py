@@ -0,0 +1,75 @@
+"""
+Receipt archive benchmark.
+Fills a scratch database with N receipts spread over five years, each with a
+few KB of OCR notes, then compares the main DB size and date range queries
+(current month, current year, all five years) before and after archiving
+everything older than the current year.
+
+    python bench_receipt_archive.py [receipts]
+"""
+import os
+import sys
+import time
+import random
+import sqlite3
+import tempfile
+import statistics
+from datetime import date, timedelta
+import database as db
+
+YEARS = 5
+NOTES_SIZE = 3000  # a full OCR response
+
+def fill(n, rng):
+    conn = sqlite3.connect(db.DB_PATH)
+    conn.execute("INSERT INTO locations (name, category, is_food) VALUES ('생활비', '지출', 0)")
+    today = date.today()
+    first = date(today.year - YEARS + 1, 1, 1)
+    span = (today - first).days
+    notes = "x" * NOTES_SIZE
+    conn.executemany(
+        "INSERT INTO receipts (category_id, store_name, use_date, total_amount, notes) VALUES (1, ?, ?, ?, ?)",
+        ((f"store-{i % 500}", (first + timedelta(days=rng.randrange(span + 1))).isoformat(), rng.randrange(1000, 100000), notes)
+         for i in range(n)))
+    conn.commit()
+    conn.close()
+
+def query_ms(start, end, runs=20):
+    times = []
+    for _ in range(runs):
+        t = time.perf_counter()
+        rows = db.get_receipts_between(start, end)
+        times.append((time.perf_counter() - t) * 1e3)
+    return statistics.median(times), len(rows)
+
+def report(label):
+    today = date.today()
+    ranges = [
+        ("this month", today.replace(day=1), today),
+        ("this year", date(today.year, 1, 1), today),
+        (f"{YEARS} years", date(today.year - YEARS + 1, 1, 1), today),
+    ]
+    size = os.path.getsize(db.DB_PATH) / 1e6
+    print(f"{label}: main DB {size:.1f}MB")
+    for name, start, end in ranges:
+        ms, rows = query_ms(start, end)
+        print(f"  {name:<10} {ms:8.2f}ms  {rows:,} receipts")
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    rng = random.Random(9)
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, "bench.db")
+        db.init_db()
+        fill(n, rng)
+        report("before")
+        start = time.perf_counter()
+        moved = db.archive_receipts(date.today().year)
+        conn = sqlite3.connect(db.DB_PATH)
+        conn.execute("VACUUM")
+        conn.close()
+        print(f"archived {sum(moved.values()):,} receipts into {len(moved)} files in {time.perf_counter() - start:.2f}s")
+        report("after")
+
+if __name__ == "__main__":
+    main()
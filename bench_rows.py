@@ -0,0 +1,68 @@
+"""
+Row model benchmark.
+Fills a scratch database with N items and compares, for the list view:
+  legacy    tuple rows -> list of dicts -> DataFrame (the old get_all_items_with_info)
+  models    Item NamedTuple rows from the row_factory
+  columnar  get_items_columnar() -> DataFrame
+reporting construction time and peak traced memory.
+
+    python bench_rows.py [rows]
+"""
+import os
+import sys
+import time
+import sqlite3
+import tempfile
+import tracemalloc
+import pandas as pd
+import database as db
+
+def fill(n):
+    conn = sqlite3.connect(db.DB_PATH)
+    conn.execute("INSERT INTO locations (name, category, is_food) VALUES ('냉장고', '냉장실', 1)")
+    conn.executemany(
+        'INSERT INTO items (name, purchase_date, expiry_date, quantity, notes, location_id) VALUES (?, ?, ?, ?, ?, 1)',
+        ((f"item-{i}", '2025-01-01', '2026-01-01', 1.0, None) for i in range(n))
+    )
+    conn.commit()
+    conn.close()
+
+def legacy():
+    conn = sqlite3.connect(db.DB_PATH)
+    rows = conn.execute('SELECT id, name, purchase_date, expiry_date, quantity, notes, location_id, version FROM items').fetchall()
+    conn.close()
+    data = [{
+        "id": r[0], "name": r[1], "purchase_date": r[2], "expiry_date": r[3],
+        "quantity": r[4], "notes": r[5], "location_id": r[6], "version": r[7]
+    } for r in rows]
+    return pd.DataFrame(data)
+
+def models_rows():
+    return db.get_items()
+
+def columnar():
+    return pd.DataFrame(db.get_items_columnar())
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return elapsed, peak
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, "bench.db")
+        db.init_db()
+        fill(n)
+        print(f"{n:,} rows")
+        for label, fn in (("legacy", legacy), ("models", models_rows), ("columnar", columnar)):
+            elapsed, peak = measure(fn)
+            print(f"  {label:<9} {elapsed:6.2f}s  peak {peak / 2**20:8.1f} MiB")
+
+if __name__ == "__main__":
+    main()
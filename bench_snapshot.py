@@ -0,0 +1,78 @@
+"""
+Analytics snapshot benchmark.
+Fills a scratch database with N receipts and N/2 items, then compares a
+multi-year spend breakdown and the expiry-waste statistics computed with
+pandas over SQLite against the same results from the columnar snapshot, and
+times a full snapshot build against an incremental update after 1% of the
+receipts changed.
+
+    python bench_snapshot.py [receipts]
+"""
+import os
+import sys
+import time
+import random
+import sqlite3
+import tempfile
+import statistics
+from datetime import date
+import pandas as pd
+import database as db
+import mycatalog
+import snapshot
+
+def median_ms(fn, runs=5):
+    times = []
+    for _ in range(runs):
+        t = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - t) * 1e3)
+    return statistics.median(times)
+
+def spend_pandas():
+    conn = db.get_read_connection()
+    df = pd.read_sql_query("SELECT use_date, store_name, total_amount FROM receipts", conn)
+    conn.close()
+    df['year'] = pd.to_datetime(df['use_date']).dt.year
+    return df.groupby(['year', 'store_name'])['total_amount'].agg(['count', 'sum'])
+
+def waste_pandas():
+    conn = db.get_read_connection()
+    items = pd.read_sql_query("SELECT purchase_date, expiry_date, quantity, location_id FROM items", conn)
+    locations = pd.read_sql_query("SELECT id AS location_id, category FROM locations", conn)
+    conn.close()
+    items = items.merge(locations, on='location_id', how='left')
+    items['expired'] = (pd.to_datetime(items['expiry_date']) < pd.Timestamp(date.today())) & (items['quantity'] > 0)
+    items['year'] = pd.to_datetime(items['purchase_date']).dt.year
+    return items.groupby(['year', 'category'])['expired'].agg(['count', 'sum'])
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    rng = random.Random(5)
+    with tempfile.TemporaryDirectory() as tmp:
+        with db.using_db(os.path.join(tmp, "bench.db")):
+            db.init_db()
+            mycatalog.seed_items(n // 2, rng)
+            mycatalog.seed_receipts(n, rng)
+            start = time.perf_counter()
+            current, _ = snapshot.update(full=True)
+            build = time.perf_counter() - start
+            size = sum(os.path.getsize(os.path.join(snapshot.snapshot_dir(), p['file']))
+                       for parts in current['tables'].values() for p in parts.values())
+            print(f"{n:,} receipts, {n // 2:,} items; full build {build:.2f}s, {size / 1e6:.1f}MB")
+
+            conn = sqlite3.connect(db.current_db_path())
+            conn.execute("UPDATE receipts SET total_amount = total_amount + 1 WHERE id % 100 = 0")
+            conn.commit()
+            conn.close()
+            start = time.perf_counter()
+            _, written = snapshot.update()
+            print(f"incremental update after {n // 100:,} changed receipts: {time.perf_counter() - start:.2f}s, {written} partitions")
+
+            snapshot.read('locations')  # first pyarrow import out of the timings
+            print(f"{'':<28} {'pandas+SQLite':>14} {'snapshot':>10}")
+            print(f"{'spend per year and store':<28} {median_ms(spend_pandas):>12.1f}ms {median_ms(lambda: snapshot.spend_by_year('store_name')):>8.1f}ms")
+            print(f"{'expiry waste':<28} {median_ms(waste_pandas):>12.1f}ms {median_ms(snapshot.expiry_waste):>8.1f}ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Spending analytics benchmark.
+Fills scratch databases with N receipts over three years and times what the
+analytics page runs (this month vs last, year to date, monthly and daily
+series, category / store / card totals, year over year) straight from
+receipts with GROUP BY, and from the trigger-maintained rollups. Also reports
+the rollup triggers' cost per inserted receipt.
+
+    python bench_spending.py [receipts ...]
+"""
+import os
+import sys
+import time
+import random
+import sqlite3
+import tempfile
+import statistics
+from datetime import date, timedelta
+import database as db
+import spending
+
+YEARS = 3
+STORES = 300
+
+def fill(n, rng, triggers=True):
+    conn = sqlite3.connect(db.current_db_path())
+    if not triggers:
+        for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'trg_receipts_spending_%'").fetchall():
+            conn.execute(f'DROP TRIGGER {name}')
+    conn.executemany("INSERT INTO locations (name, category, is_food) VALUES (?, '지출', 0)", [(f"loc-{i}",) for i in range(12)])
+    today = date.today()
+    first = date(today.year - YEARS + 1, 1, 1)
+    span = (today - first).days
+    start = time.perf_counter()
+    conn.executemany(
+        "INSERT INTO receipts (category_id, store_name, card_type, use_date, total_amount) VALUES (?, ?, ?, ?, ?)",
+        ((rng.randrange(1, 13), f"store-{rng.randrange(STORES)}", f"card-{rng.randrange(4)}",
+          f"{first + timedelta(days=rng.randrange(span + 1))} 12:00:00", rng.randrange(10, 2000) * 100)
+         for _ in range(n)))
+    conn.commit()
+    elapsed = time.perf_counter() - start
+    conn.close()
+    return elapsed
+
+def page_from_rollups(today):
+    year_ago = today.replace(year=today.year - 1, day=1)
+    spending.monthly(year_ago, today)
+    spending.total_between(today.replace(month=1, day=1), today)
+    spending.daily(year_ago, today)
+    for dim in ('category', 'store', 'card'):
+        spending.totals_by(dim, year_ago, today)
+    spending.year_over_year(today.year)
+
+def page_from_receipts(today):
+    year_ago = today.replace(year=today.year - 1, day=1)
+    conn = db.get_read_connection()
+    bounds = (year_ago.isoformat(), f"{today.isoformat()} 99")
+    conn.execute("SELECT substr(use_date, 1, 7), SUM(total_amount) FROM receipts WHERE use_date BETWEEN ? AND ? GROUP BY 1", bounds).fetchall()
+    conn.execute("SELECT SUM(total_amount) FROM receipts WHERE use_date BETWEEN ? AND ?", (f"{today.year}-01-01", bounds[1])).fetchall()
+    conn.execute("SELECT substr(use_date, 1, 10), SUM(total_amount) FROM receipts WHERE use_date BETWEEN ? AND ? GROUP BY 1", bounds).fetchall()
+    for column in ('category_id', 'store_name', 'card_type'):
+        conn.execute(f"SELECT {column}, COUNT(*), SUM(total_amount) FROM receipts WHERE use_date BETWEEN ? AND ? GROUP BY 1 ORDER BY 3 DESC", bounds).fetchall()
+    conn.execute("SELECT substr(use_date, 1, 7), SUM(total_amount) FROM receipts WHERE use_date >= ? GROUP BY 1", (f"{today.year - 1}-01-01",)).fetchall()
+    conn.close()
+
+def timed_ms(fn, runs=10):
+    times = []
+    for _ in range(runs):
+        t = time.perf_counter()
+        fn(date.today())
+        times.append((time.perf_counter() - t) * 1e3)
+    return statistics.median(times)
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or [1_000, 10_000, 100_000]
+    print(f"{'receipts':>9} {'insert/receipt':>15} {'+triggers':>10} {'rollup rows':>12} {'page (receipts)':>16} {'page (rollups)':>15}")
+    for n in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            with db.using_db(os.path.join(tmp, "plain.db")):
+                db.init_db()
+                plain = fill(n, random.Random(7), triggers=False)
+            with db.using_db(os.path.join(tmp, "bench.db")):
+                db.init_db()
+                with_triggers = fill(n, random.Random(7))
+                rows = db.get_read_connection().execute('SELECT COUNT(*) FROM spending_rollups').fetchone()[0]
+                scan = timed_ms(page_from_receipts)
+                rollup = timed_ms(page_from_rollups)
+        print(f"{n:>9,} {plain / n * 1e6:>13.1f}us {(with_triggers - plain) / n * 1e6:>8.1f}us {rows:>12,} "
+              f"{scan:>14.1f}ms {rollup:>13.1f}ms")
+
+if __name__ == "__main__":
+    main()
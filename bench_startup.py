@@ -0,0 +1,89 @@
+"""
+Cold-start benchmark for app.py.
+Runs the app's login page in a fresh interpreter (Streamlit bare mode, scratch
+working directory) several times, reports the wall time and the slowest imports
+from `-X importtime`, and fails if the login page loads a heavy module or the
+median start exceeds the budget.
+
+    python bench_startup.py [--runs N] [--budget SECONDS]
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+import tempfile
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_PATH = os.path.join(APP_DIR, "app.py")
+
+# Target cold start for the login page (interpreter + streamlit + app script)
+BUDGET_SECONDS = 1.5
+
+# Modules the login page must not import; they belong to later pages
+DEFERRED_MODULES = ["pandas", "numpy", "PIL", "google.genai", "openpyxl", "ocr_helper"]
+
+# Bare mode ignores st.stop(), so make it end the script like the server does at
+# the login gate
+RUNNER = (
+    "import runpy, streamlit as st\n"
+    "def stop(): raise SystemExit(0)\n"
+    "st.stop = stop\n"
+    "runpy.run_path({!r}, run_name='__main__')\n"
+).format(APP_PATH)
+
+def run_once(workdir, importtime=False):
+    env = dict(os.environ, PYTHONPATH=APP_DIR)
+    cmd = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", RUNNER]
+    start = time.perf_counter()
+    proc = subprocess.run(cmd, cwd=workdir, env=env, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr[-2000:])
+    return elapsed, proc.stderr
+
+def parse_importtime(stderr):
+    # "import time: self [us] | cumulative | imported package"
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line.split(":", 1)[1].split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        # Nested imports keep their indentation, so top-level names have none
+        modules[parts[2][1:].rstrip()] = int(parts[1])
+    return modules
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=BUDGET_SECONDS)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        _, stderr = run_once(workdir, importtime=True)
+        modules = parse_importtime(stderr)
+        times = [run_once(workdir)[0] for _ in range(args.runs)]
+
+    top_level = {name: us for name, us in modules.items() if not name.startswith(" ")}
+    print("Slowest top-level imports:")
+    for name, us in sorted(top_level.items(), key=lambda kv: kv[1], reverse=True)[:10]:
+        print(f"  {us / 1000:8.1f} ms  {name}")
+
+    median = statistics.median(times)
+    print(f"Cold start: median {median:.2f}s, min {min(times):.2f}s over {args.runs} runs (budget {args.budget:.2f}s)")
+
+    loaded = [m for m in DEFERRED_MODULES if m in {name.strip() for name in modules}]
+    failed = False
+    if loaded:
+        print(f"FAIL: login page imported deferred modules: {', '.join(loaded)}")
+        failed = True
+    if median > args.budget:
+        print(f"FAIL: cold start {median:.2f}s exceeds budget {args.budget:.2f}s")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
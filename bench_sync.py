@@ -0,0 +1,64 @@
+"""
+Delta sync benchmark.
+For several catalog sizes, clones a catalog of N items into an empty replica
+with sync.py, then edits K items on each side and times the next sync, which
+should depend on K rather than N.
+
+    python bench_sync.py [changes] [sizes...]
+"""
+import os
+import sys
+import time
+import random
+import sqlite3
+import tempfile
+import database as db
+import sync
+
+def fill(path, n):
+    db.ensure_db(path)
+    conn = sqlite3.connect(path)
+    conn.execute("INSERT INTO locations (name, category, is_food) VALUES ('냉장고', '냉장실', 1)")
+    conn.executemany(
+        "INSERT INTO items (name, purchase_date, expiry_date, quantity, location_id) VALUES (?, '2025-01-01', '2026-01-01', 1, 1)",
+        ((f"item-{i}",) for i in range(n)))
+    conn.commit()
+    conn.close()
+
+def edit(path, k, rng, tag):
+    conn = sqlite3.connect(path)
+    ids = [r[0] for r in conn.execute('SELECT id FROM items')]
+    conn.executemany("UPDATE items SET name = ?, version = version + 1 WHERE id = ?",
+                     ((f"{tag}-{i}", i) for i in rng.sample(ids, k)))
+    conn.commit()
+    conn.close()
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+def main():
+    k = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    sizes = [int(s) for s in sys.argv[2:]] or [1_000, 10_000, 100_000]
+    rng = random.Random(5)
+    print(f"{'items':>8} {'clone':>8} {'delta sync':>11} {'rows sent':>10}")
+    for n in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            a_path, b_path = os.path.join(tmp, "a.db"), os.path.join(tmp, "b.db")
+            fill(a_path, n)
+            a, b = sync.LocalReplica(a_path), sync.LocalReplica(b_path)
+            clone_time, _ = timed(sync.sync, a, b)
+            for path in (a_path, b_path):
+                # Keep the clone's WAL checkpoint out of the delta timing
+                conn = sqlite3.connect(path)
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                conn.close()
+            edit(a_path, k, rng, "a")
+            edit(b_path, k, rng, "b")
+            delta_time, stats = timed(sync.sync, a, b)
+            sent = sum(s['sent'] for s in stats.values())
+            print(f"{n:>8,} {clone_time:>7.2f}s {delta_time * 1e3:>9.1f}ms {sent:>10,}")
+
+if __name__ == "__main__":
+    main()
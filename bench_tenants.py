@@ -0,0 +1,110 @@
+"""
+Tenant sharding benchmark.
+Simulates H households with U concurrent users each adding items, once with
+every household in one shared database (MYCATALOG_TENANCY=single) and once with
+one database file per household (MYCATALOG_TENANCY=household). Each household
+runs in its own process (its users are threads in it), like one app server per
+household, so the layouts compare lock contention rather than one interpreter
+lock. Reports write throughput, the p95 latency of a single write and the
+p50/p95 latency of a household's item list. Throughput can only grow with the
+households up to the number of CPU cores, printed with the results.
+In the household layout it also checks that no household's writes show up in
+another household's file, and that names differing only in punctuation or case
+map to separate files; it exits with an error otherwise.
+
+    python bench_tenants.py [writes_per_user] [users_per_household]
+"""
+import os
+import sys
+import time
+import tempfile
+import threading
+import statistics
+import multiprocessing
+import database as db
+
+HOUSEHOLDS = [1, 2, 4, 8]
+WARMUP_SECONDS = 1.0  # process start-up before the households begin together
+
+def configure(tenancy, tmp):
+    db.TENANCY = tenancy
+    db.DB_PATH = os.path.join(tmp, "shared.db")
+    db.DATA_DIR = tmp
+
+def setup(paths):
+    for path in set(paths):
+        db.ensure_db(path)
+        with db.using_db(path):
+            db.add_location("냉장고", "냉장실", None, True)
+
+def household(tenancy, tmp, h, n_users, n_writes, start_at):
+    """One household's users as threads in this process. Returns (write times, list times)."""
+    configure(tenancy, tmp)
+    path = db.tenant_db_path(f"h{h}")
+    write_times, read_times = [], []
+
+    def user(u):
+        with db.using_db(path):
+            for i in range(n_writes):
+                start = time.perf_counter()
+                db.add_item(f"h{h}-u{u}-{i}", '2025-01-01', '2026-01-01', 1, None, 1)
+                write_times.append(time.perf_counter() - start)
+                if i % 50 == 0:
+                    start = time.perf_counter()
+                    db.get_items()
+                    read_times.append(time.perf_counter() - start)
+
+    db.ensure_db(path)
+    threads = [threading.Thread(target=user, args=(u,)) for u in range(n_users)]
+    time.sleep(max(0.0, start_at - time.time()))
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    return write_times, read_times
+
+def p95(values):
+    values = sorted(values)
+    return values[int(len(values) * 0.95) - 1] if len(values) >= 20 else values[-1]
+
+def run(tenancy, tmp, n_households, n_users, n_writes):
+    setup([db.tenant_db_path(f"h{h}") for h in range(n_households)])
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(n_households) as pool:
+        start_at = time.time() + WARMUP_SECONDS
+        results = pool.starmap(household, [(tenancy, tmp, h, n_users, n_writes, start_at)
+                                           for h in range(n_households)])
+        elapsed = time.time() - start_at
+    write_times = [t for writes, _ in results for t in writes]
+    read_times = [t for _, reads in results for t in reads]
+    return len(write_times) / elapsed, p95(write_times), statistics.median(read_times), p95(read_times)
+
+def check_isolation(n_households):
+    # Every item name starts with its household's tag (h{h}-u{u}-{i})
+    for h in range(n_households):
+        with db.using_db(db.tenant_db_path(f"h{h}")):
+            foreign = [item.name for item in db.get_items() if not item.name.startswith(f"h{h}-")]
+        if foreign:
+            raise SystemExit(f"household h{h} sees other households' items: {foreign[:5]}")
+    names = ["a b", "a/b", "a_b", "A_b", "a.b", "가 나", "가_나"]
+    paths = {db.tenant_db_path(name) for name in names}
+    if len(paths) != len(names):
+        raise SystemExit(f"household names share a database file: {sorted(paths)}")
+
+def main():
+    n_writes = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    n_users = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    print(f"{n_users} users per household, {n_writes} writes per user, one process per household, {os.cpu_count()} CPU cores")
+    print(f"{'households':>10} {'layout':<10} {'writes/s':>10} {'write p95':>10} {'list p50':>10} {'list p95':>10}")
+    for tenancy in ('single', 'household'):
+        for n_households in HOUSEHOLDS:
+            with tempfile.TemporaryDirectory() as tmp:
+                configure(tenancy, tmp)
+                rate, write_p95, p50, list_p95 = run(tenancy, tmp, n_households, n_users, n_writes)
+                if tenancy == 'household':
+                    check_isolation(n_households)
+                print(f"{n_households:>10} {tenancy:<10} {rate:>10,.0f} {write_p95 * 1000:>8.1f}ms "
+                      f"{p50 * 1000:>8.1f}ms {list_p95 * 1000:>8.1f}ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Stress test for the single-writer queue.
+Runs many concurrent writer threads against a scratch database, once through
+the writer thread (database.add_item) and once with the old one-connection-per-
+write path, and reports lock errors and throughput for both.
+
+    python bench_writer.py [threads] [writes_per_thread]
+"""
+import os
+import sys
+import time
+import sqlite3
+import tempfile
+import threading
+import database as db
+
+def run_threads(n_threads, n_writes, write):
+    errors = []
+    def worker(t):
+        for i in range(n_writes):
+            try:
+                write(f"item-{t}-{i}")
+            except sqlite3.OperationalError as e:
+                errors.append(str(e))
+    threads = [threading.Thread(target=worker, args=(t,)) for t in range(n_threads)]
+    start = time.perf_counter()
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    return time.perf_counter() - start, errors
+
+def direct_write(name):
+    # The pre-queue path: its own connection, default 5s lock timeout, own commit
+    conn = sqlite3.connect(db.DB_PATH)
+    conn.execute('INSERT INTO items (name, quantity, location_id) VALUES (?, 1, 1)', (name,))
+    conn.commit()
+    conn.close()
+
+def queued_write(name):
+    db.add_item(name, None, None, 1, None, 1)
+
+def main():
+    n_threads = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    n_writes = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    total = n_threads * n_writes
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, write in (("direct", direct_write), ("queued", queued_write)):
+            db.DB_PATH = os.path.join(tmp, f"{label}.db")
+            db.init_db()
+            elapsed, errors = run_threads(n_threads, n_writes, write)
+            written = len(db.get_items())
+            print(f"[{label}] {n_threads} threads x {n_writes} writes: "
+                  f"{elapsed:.2f}s, {written / elapsed:,.0f} writes/s, "
+                  f"{written}/{total} rows, {len(errors)} lock errors")
+            if label == "queued":
+                assert not errors, errors[:3]
+                assert written == total
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Change log maintenance and delta exports.
+
+    python changes_log.py compact [--purge-days N] [--db PATH]
+    python changes_log.py export SEQ [--out FILE] [--db PATH]
+
+compact drops log entries superseded by a later change of the same row; with
+--purge-days it also drops delete tombstones older than N days (consumers that
+have not synced since then must do a full export). export writes everything
+changed after SEQ to an Excel file (one sheet per table plus 'deleted' and
+'meta'); the 'seq' in 'meta' is the SEQ to pass next time.
+"""
+import time
+import argparse
+import database as db
+
+def purge_seq(days):
+    # Highest seq logged at least `days` ago
+    conn = db.get_read_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT MAX(seq) FROM changes WHERE changed_at <= datetime('now', ?)", (f"-{days} days",))
+    seq = cursor.fetchone()[0]
+    conn.close()
+    return seq
+
+def write_delta(since, path=None):
+    import pandas as pd
+    changes, frames = db.export_delta(since)
+    path = path or f"mycatalog_delta_{since}_{changes.seq}.xlsx"
+    with pd.ExcelWriter(path, engine='openpyxl') as writer:
+        for sheet, frame in frames.items():
+            frame.to_excel(writer, sheet_name=sheet, index=False)
+    return changes, path
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="MyCatalog change log")
+    parser.add_argument('--db', help="database file (default: mycatalog.db)")
+    sub = parser.add_subparsers(dest='command', required=True)
+    compact = sub.add_parser('compact', help="drop superseded log entries")
+    compact.add_argument('--purge-days', type=int, help="also drop delete tombstones older than N days")
+    export = sub.add_parser('export', help="write changes after SEQ to an Excel file")
+    export.add_argument('since', type=int)
+    export.add_argument('--out', help="output file (default: mycatalog_delta_<since>_<seq>.xlsx)")
+    args = parser.parse_args()
+    if args.db:
+        db.set_current_db(args.db)
+    db.ensure_db()
+
+    start = time.perf_counter()
+    if args.command == 'compact':
+        purge = purge_seq(args.purge_days) if args.purge_days is not None else None
+        removed = db.compact_changes(purge)
+        print(f"Removed {removed} log entries in {time.perf_counter() - start:.2f}s (now at seq {db.get_change_seq()}).")
+    else:
+        changes, path = write_delta(args.since, args.out)
+        if changes.full_resync:
+            print(f"Warning: changes before seq {args.since} were compacted away; do a full export first.")
+        counts = ", ".join(f"{t} +{len(changes.upserts[t])}/-{len(changes.deletes[t])}" for t in db.CDC_TABLES)
+        print(f"{path}: {counts} (next since={changes.seq})")
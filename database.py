@@ -2,29 +2,264 @@ import sqlite3
 from datetime import datetime
 import os
 import hashlib
-import pandas as pd
+import re
+import json
+import functools
+import contextlib
+import contextvars
+import threading
+import db_writer
+import models
+from models import ChangeSet, ExpiryDigest, Item, Location, OcrJob, Receipt, SubtreeStats, User
 
 DB_PATH = 'mycatalog.db'
 
+# Tenancy: 'single' keeps users and data in DB_PATH (default). 'household' gives
+# every household its own SQLite file under DATA_DIR and keeps the users table in
+# a small central auth DB, so lock contention and table sizes stay per tenant.
+TENANCY = os.environ.get('MYCATALOG_TENANCY', 'single')
+DATA_DIR = os.environ.get('MYCATALOG_DATA_DIR', 'data')
+
+# Database the current thread / Streamlit session is routed to (None -> DB_PATH)
+_current_db = contextvars.ContextVar('mycatalog_db', default=None)
+_initialized_dbs = set()
+
+# Integer day columns (julianday) derived from the free-form TEXT dates. They are
+# VIRTUAL generated columns, so SQLite keeps them (and their indexes) current and
+# range queries never parse dates per row.
+DAY_COLUMNS = {
+    'items': {
+        'purchase_day': 'purchase_date',
+        'expiry_day': 'expiry_date',
+    },
+    'receipts': {
+        'use_day': 'use_date',
+    },
+}
+JULIAN_DAY_OFFSET = 1721424  # julianday(d) = d.toordinal() + offset
+
+def day_column_sql(source):
+    return f"INTEGER GENERATED ALWAYS AS (CAST(julianday(replace(substr({source}, 1, 10), '/', '-')) AS INTEGER)) VIRTUAL"
+
+# Multi-index hamming search: two 64-bit hashes within distance 7 differ in at
+# most one bit of at least one of the four 16-bit chunks (pigeonhole), so probing
+# each chunk index with its 17 one-bit variants finds every candidate.
+HASH_BITS = 64
+HASH_CHUNKS = 4
+CHUNK_BITS = HASH_BITS // HASH_CHUNKS
+MAX_HASH_DISTANCE = 2 * HASH_CHUNKS - 1
+
+# Free-text name columns offered as autocomplete suggestions: kind -> (table, column)
+NAME_KINDS = {
+    'item': ('items', 'name'),
+    'store': ('receipts', 'store_name'),
+    'card': ('receipts', 'card_type'),
+}
+
+# Spending rollup dimensions over a receipts row {r}: dim -> (period, key).
+# Day and month hold the plain totals; the others are per month and value.
+SPENDING_DIMS = {
+    'day': ("substr({r}.use_date, 1, 10)", "''"),
+    'month': ("substr({r}.use_date, 1, 7)", "''"),
+    'category': ("substr({r}.use_date, 1, 7)", "COALESCE(CAST({r}.category_id AS TEXT), '')"),
+    'store': ("substr({r}.use_date, 1, 7)", "COALESCE({r}.store_name, '')"),
+    'card': ("substr({r}.use_date, 1, 7)", "COALESCE({r}.card_type, '')"),
+}
+SPENDING_COLUMNS = ('use_date', 'category_id', 'store_name', 'card_type', 'total_amount')
+
+# Tables whose changes are captured in the `changes` log, with their row model
+CDC_TABLES = {
+    'locations': Location,
+    'items': Item,
+    'receipts': Receipt,
+}
+
+def to_day(d):
+    # date -> value comparable with the *_day columns
+    return d.toordinal() + JULIAN_DAY_OFFSET
+
+def normalize_date(value):
+    """
+    Normalizes dates from forms, Excel and OCR ('2025/10/16 12:22:26', '2025.10.16',
+    datetime objects ...) to 'YYYY-MM-DD' or 'YYYY-MM-DD HH:MM:SS'.
+    Unparseable text is stored unchanged.
+    """
+    if value is None or value != value:  # None, NaN, NaT
+        return None
+    if hasattr(value, 'strftime'):
+        parsed = value
+    else:
+        text = str(value).strip()
+        if not text:
+            return None
+        cleaned = text.replace('/', '-').replace('.', '-').replace('T', ' ')
+        for fmt, length in (('%Y-%m-%d %H:%M:%S', 19), ('%Y-%m-%d %H:%M', 16), ('%Y-%m-%d', 10)):
+            try:
+                parsed = datetime.strptime(cleaned[:length], fmt)
+                break
+            except ValueError:
+                continue
+        else:
+            return text
+    if getattr(parsed, 'hour', 0) or getattr(parsed, 'minute', 0) or getattr(parsed, 'second', 0):
+        return parsed.strftime('%Y-%m-%d %H:%M:%S')
+    return parsed.strftime('%Y-%m-%d')
+
+def current_db_path():
+    return _current_db.get() or DB_PATH
+
+def set_current_db(path):
+    # Called at the start of every rerun with the session's tenant DB
+    _current_db.set(path)
+
+@contextlib.contextmanager
+def using_db(path):
+    token = _current_db.set(path)
+    try:
+        yield
+    finally:
+        _current_db.reset(token)
+
+def auth_db_path():
+    return DB_PATH if TENANCY == 'single' else os.path.join(DATA_DIR, 'auth.db')
+
+def _tenant_slug(household):
+    return re.sub(r'[^\w-]', '_', household or 'default')
+
+def tenant_db_path(household):
+    if TENANCY == 'single':
+        return DB_PATH
+    name = household or 'default'
+    slug = _tenant_slug(name)
+    if slug != name or name != name.casefold():
+        # The slug dropped characters (or case, which some filesystems ignore):
+        # add a hash of the full name so "a b", "a/b" and "a_b" get separate files.
+        # '~' never appears in a plain slug.
+        slug = f"{slug.casefold()}~{hashlib.sha256(name.encode('utf-8')).hexdigest()[:16]}"
+    return os.path.join(DATA_DIR, f"household_{slug}.db")
+
+def _migrate_tenant_files(cursor):
+    # Files named by the old lossy slug move to their new name when only one
+    # household mapped to them; a file several households shared stays put
+    cursor.execute('SELECT DISTINCT COALESCE(household, username) FROM users')
+    by_legacy = {}
+    for (name,) in cursor.fetchall():
+        by_legacy.setdefault(os.path.join(DATA_DIR, f"household_{_tenant_slug(name)}.db"), []).append(name)
+    for legacy, names in by_legacy.items():
+        if not os.path.exists(legacy):
+            continue
+        if len(names) > 1:
+            print(f"Warning: households {names} shared {legacy}. Each now has its own file; move their rows out of it by hand.")
+            continue
+        new = tenant_db_path(names[0])
+        if new == legacy or os.path.exists(new):
+            continue
+        for year in archived_receipt_years(legacy):
+            os.replace(receipt_archive_path(year, legacy), receipt_archive_path(year, new))
+        for suffix in ('-wal', '-shm'):
+            if os.path.exists(legacy + suffix):
+                os.replace(legacy + suffix, new + suffix)
+        os.replace(legacy, new)
+        print(f"Migrated: Renamed {legacy} -> {new}.")
+
 def get_connection():
-    return sqlite3.connect(DB_PATH)
+    return sqlite3.connect(current_db_path())
+
+def get_read_connection():
+    # Read-only connection; in WAL mode readers never block on (or block) the writer thread
+    return sqlite3.connect(f"file:{current_db_path()}?mode=ro", uri=True, timeout=30)
+
+_thread_local = threading.local()
+
+def get_cached_read_connection():
+    # Per-thread read-only connection kept open across calls, for hot lookups
+    # where opening a connection (schema parse, cold page cache) dominates
+    conns = getattr(_thread_local, 'read_conns', None)
+    if conns is None:
+        conns = _thread_local.read_conns = {}
+    path = current_db_path()
+    if path not in conns:
+        conns[path] = get_read_connection()
+    return conns[path]
+
+def writes(fn):
+    """
+    Routes a write function through the single writer thread of the current DB.
+    The decorated function receives the writer's cursor as its first argument;
+    callers omit it. Calling the wrapper blocks until the group commit that
+    contains the write; `wrapper.submit(...)` returns the Future instead.
+    """
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        return wrapper.submit(*args, **kwargs).result()
+    wrapper.submit = lambda *args, **kwargs: db_writer.get_writer(current_db_path()).submit(fn, *args, **kwargs)
+    return wrapper
 
 def hash_password(password):
     return hashlib.sha256(password.encode()).hexdigest()
 
-def init_db():
-    conn = get_connection()
-    cursor = conn.cursor()
-    
+def _init_auth_schema(cursor):
     # Users table
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS users (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         username TEXT UNIQUE NOT NULL,
-        password_hash TEXT NOT NULL
+        password_hash TEXT NOT NULL,
+        household TEXT -- tenant DB in 'household' mode (NULL -> own username)
     )
     ''')
     
+    cursor.execute("PRAGMA table_info(users)")
+    columns = [info[1] for info in cursor.fetchall()]
+    if 'household' not in columns:
+        cursor.execute('ALTER TABLE users ADD COLUMN household TEXT')
+        print("Migrated: Added 'household' column to users table.")
+    
+    # Create default admin user 'skpark' if no users exist
+    cursor.execute('SELECT COUNT(*) FROM users')
+    if cursor.fetchone()[0] == 0:
+        # Default password for skpark is '1234'
+        cursor.execute('INSERT INTO users (username, password_hash) VALUES (?, ?)', 
+                       ("skpark", hash_password("1234")))
+        print("Default admin user 'skpark' created (password: 1234)")
+
+def init_auth_db():
+    path = auth_db_path()
+    if TENANCY == 'single':
+        with using_db(path):
+            return init_db()
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    _init_auth_schema(conn.cursor())
+    _migrate_tenant_files(conn.cursor())
+    conn.commit()
+    conn.close()
+
+def ensure_db(path=None):
+    # init_db() once per database file per process (app reruns call this every time)
+    path = path or current_db_path()
+    if path not in _initialized_dbs:
+        with using_db(path):
+            if path == auth_db_path():
+                init_auth_db()
+            else:
+                os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+                init_db()
+        _initialized_dbs.add(path)
+
+def init_db():
+    conn = get_connection()
+    cursor = conn.cursor()
+    # WAL lets read-only connections run alongside the writer thread
+    # New files free pages with incremental_vacuum; existing ones switch on
+    # their next full VACUUM (db_maintenance.py does that once)
+    cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    cursor.execute("PRAGMA journal_mode=WAL")
+    
+    if current_db_path() == auth_db_path():
+        _init_auth_schema(cursor)
+    
     # Locations table (Hierarchical)
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS locations (
@@ -45,7 +280,7 @@ def init_db():
         print("Migrated: Added 'is_food' column to locations table.")
     
     # Items table
-    cursor.execute('''
+    cursor.execute(f'''
     CREATE TABLE IF NOT EXISTS items (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         name TEXT NOT NULL,
@@ -54,12 +289,15 @@ def init_db():
         quantity REAL DEFAULT 1,
         notes TEXT,
         location_id INTEGER,
+        version INTEGER DEFAULT 0, -- 낙관적 동시성 제어용 행 버전
+        purchase_day {day_column_sql('purchase_date')},
+        expiry_day {day_column_sql('expiry_date')},
         FOREIGN KEY (location_id) REFERENCES locations (id)
     )
     ''')
     
     # Receipts table
-    cursor.execute('''
+    cursor.execute(f'''
     CREATE TABLE IF NOT EXISTS receipts (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         category_id INTEGER,
@@ -73,200 +311,1472 @@ def init_db():
         total_amount REAL DEFAULT 0,
         notes TEXT,
         image_path TEXT,
+        version INTEGER DEFAULT 0,
+        use_day {day_column_sql('use_date')},
         FOREIGN KEY (category_id) REFERENCES locations (id)
     )
     ''')
     
+    # Row version columns for optimistic concurrency (Migration for existing DB)
+    for table in ('items', 'receipts'):
+        cursor.execute(f"PRAGMA table_info({table})")
+        columns = [info[1] for info in cursor.fetchall()]
+        if 'version' not in columns:
+            cursor.execute(f'ALTER TABLE {table} ADD COLUMN version INTEGER DEFAULT 0')
+            print(f"Migrated: Added 'version' column to {table} table.")
+    
+    # Integer day columns + indexes (Migration for existing DB)
+    for table, day_columns in DAY_COLUMNS.items():
+        cursor.execute(f"PRAGMA table_xinfo({table})")
+        columns = [info[1] for info in cursor.fetchall()]
+        for day_col, source in day_columns.items():
+            if day_col not in columns:
+                if table == 'receipts':
+                    # Older OCR results stored 'YYYY/MM/DD HH:MM:SS'
+                    cursor.execute("UPDATE receipts SET use_date = replace(use_date, '/', '-') WHERE use_date LIKE '____/__/__%'")
+                cursor.execute(f'ALTER TABLE {table} ADD COLUMN {day_col} {day_column_sql(source)}')
+                print(f"Migrated: Added '{day_col}' column to {table} table.")
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_{day_col} ON {table} ({day_col})')
+    
+    # Location hierarchy closure table: one row per (ancestor, descendant) pair,
+    # including each location paired with itself at depth 0
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS location_closure (
+        ancestor_id INTEGER NOT NULL,
+        descendant_id INTEGER NOT NULL,
+        depth INTEGER NOT NULL,
+        PRIMARY KEY (ancestor_id, descendant_id)
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_location_closure_descendant ON location_closure (descendant_id, depth)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_items_location ON items (location_id)')
+    
+    # Keep the closure table in sync on insert / move / delete
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_locations_closure_insert AFTER INSERT ON locations
+    BEGIN
+        INSERT INTO location_closure (ancestor_id, descendant_id, depth) VALUES (NEW.id, NEW.id, 0);
+        INSERT INTO location_closure (ancestor_id, descendant_id, depth)
+        SELECT ancestor_id, NEW.id, depth + 1 FROM location_closure WHERE descendant_id = NEW.parent_id;
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_locations_closure_move AFTER UPDATE OF parent_id ON locations
+    WHEN OLD.parent_id IS NOT NEW.parent_id
+    BEGIN
+        -- Detach the subtree from its old ancestors
+        DELETE FROM location_closure
+        WHERE descendant_id IN (SELECT descendant_id FROM location_closure WHERE ancestor_id = NEW.id)
+          AND ancestor_id NOT IN (SELECT descendant_id FROM location_closure WHERE ancestor_id = NEW.id);
+        -- Attach it below the new parent's ancestors
+        INSERT INTO location_closure (ancestor_id, descendant_id, depth)
+        SELECT p.ancestor_id, c.descendant_id, p.depth + c.depth + 1
+        FROM location_closure p, location_closure c
+        WHERE p.descendant_id = NEW.parent_id AND c.ancestor_id = NEW.id;
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_locations_closure_delete AFTER DELETE ON locations
+    BEGIN
+        DELETE FROM location_closure WHERE descendant_id = OLD.id OR ancestor_id = OLD.id;
+    END
+    ''')
+    
+    # Backfill for existing DBs (or after an import)
+    cursor.execute('SELECT (SELECT COUNT(*) FROM locations), (SELECT COUNT(*) FROM location_closure WHERE depth = 0)')
+    loc_count, closure_count = cursor.fetchone()
+    if loc_count != closure_count:
+        rebuild_location_closure(cursor)
+        print("Migrated: Rebuilt location_closure table.")
+    
+    # Expiry scheduler: items whose expiry changed since the scheduler last looked,
+    # and the daily digests it writes
+    cursor.execute('CREATE TABLE IF NOT EXISTS expiry_dirty (item_id INTEGER PRIMARY KEY)')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_items_expiry_insert AFTER INSERT ON items
+    BEGIN
+        INSERT OR IGNORE INTO expiry_dirty (item_id) VALUES (NEW.id);
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_items_expiry_update AFTER UPDATE OF expiry_date, name, location_id ON items
+    BEGIN
+        INSERT OR IGNORE INTO expiry_dirty (item_id) VALUES (NEW.id);
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_items_expiry_delete AFTER DELETE ON items
+    BEGIN
+        INSERT OR IGNORE INTO expiry_dirty (item_id) VALUES (OLD.id);
+    END
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS expiry_digests (
+        digest_date TEXT PRIMARY KEY,
+        created_at TEXT NOT NULL,
+        expired INTEGER DEFAULT 0,
+        d0 INTEGER DEFAULT 0,
+        d3 INTEGER DEFAULT 0,
+        d30 INTEGER DEFAULT 0,
+        payload TEXT -- JSON list of {id, name, expiry_date, days_left, category, bucket}
+    )
+    ''')
+    
+    # Perceptual hashes of receipt images (see image_hash.py), split into 16-bit
+    # chunks with one covering index each for multi-index hamming search
+    cursor.execute(f'''
+    CREATE TABLE IF NOT EXISTS image_hashes (
+        image_path TEXT PRIMARY KEY,
+        hash INTEGER NOT NULL, -- 64-bit dHash stored as signed INTEGER
+        {", ".join(f"h{i} INTEGER NOT NULL" for i in range(HASH_CHUNKS))}
+    ) WITHOUT ROWID
+    ''')
+    for i in range(HASH_CHUNKS):
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_image_hashes_h{i} ON image_hashes (h{i}, hash)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_receipts_image_path ON receipts (image_path)')
+    
+    # Autocomplete: distinct names with usage counts, kept current by triggers on
+    # the source tables, plus an FTS5 trigram index over the names
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS name_counts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT NOT NULL, -- item / store / card (NAME_KINDS)
+        value TEXT NOT NULL,
+        uses INTEGER NOT NULL DEFAULT 0,
+        UNIQUE (kind, value)
+    )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_name_counts_rank ON name_counts (kind, uses DESC)')
+    cursor.execute('''
+    CREATE VIRTUAL TABLE IF NOT EXISTS name_trigrams
+    USING fts5(value, content='name_counts', content_rowid='id', tokenize='trigram')
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_name_counts_insert AFTER INSERT ON name_counts
+    BEGIN
+        INSERT INTO name_trigrams (rowid, value) VALUES (NEW.id, NEW.value);
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_name_counts_delete AFTER DELETE ON name_counts
+    BEGIN
+        INSERT INTO name_trigrams (name_trigrams, rowid, value) VALUES ('delete', OLD.id, OLD.value);
+    END
+    ''')
+    for kind, (table, column) in NAME_KINDS.items():
+        for sql in _name_count_triggers(kind, table, column):
+            cursor.execute(sql)
+    cursor.execute('SELECT (SELECT COUNT(*) FROM name_counts), (SELECT COUNT(*) FROM items) + (SELECT COUNT(*) FROM receipts)')
+    name_count, row_count = cursor.fetchone()
+    if name_count == 0 and row_count > 0:
+        rebuild_name_counts(cursor)
+        print("Migrated: Built name_counts autocomplete index.")
+    
     # Settings table to track initialization
     cursor.execute('CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT)')
     
+    # Change data capture: append-only log of (table, row id, op) with a
+    # monotonic seq; consumers ask for everything after the last seq they saw
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'changes'")
+    new_log = cursor.fetchone() is None
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS changes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        table_name TEXT NOT NULL,
+        row_id INTEGER NOT NULL,
+        op TEXT NOT NULL, -- I / U / D
+        changed_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    for table in CDC_TABLES:
+        for event, op, ref in (('INSERT', 'I', 'NEW'), ('UPDATE', 'U', 'NEW'), ('DELETE', 'D', 'OLD')):
+            cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_cdc_{event.lower()} AFTER {event} ON {table}
+            BEGIN
+                INSERT INTO changes (table_name, row_id, op) VALUES ('{table}', {ref}.id, '{op}');
+            END
+            ''')
+    if new_log:
+        # Existing rows enter the log as inserts so seq 0 means "everything"
+        for table in CDC_TABLES:
+            cursor.execute(f"INSERT INTO changes (table_name, row_id, op) SELECT '{table}', id, 'I' FROM {table}")
+        if cursor.execute('SELECT COUNT(*) FROM changes').fetchone()[0]:
+            print("Migrated: Backfilled changes log.")
+    
+    # Replication metadata (sync.py): a global uid and hybrid logical clock per
+    # row, filled from the changes log, and per-peer watermarks
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS sync_rows (
+        uid TEXT PRIMARY KEY,
+        table_name TEXT NOT NULL,
+        row_id INTEGER, -- local id (NULL for tombstones never seen locally)
+        hlc INTEGER NOT NULL, -- (unix ms << 16) | counter
+        origin TEXT NOT NULL, -- node that made the winning change
+        seq INTEGER NOT NULL, -- local order, for "rows changed since"
+        deleted INTEGER NOT NULL DEFAULT 0,
+        archive_year INTEGER, -- receipts: archive file the row lives in (NULL: main DB)
+        UNIQUE (table_name, row_id)
+    )
+    ''')
+    cursor.execute("PRAGMA table_info(sync_rows)")
+    columns = [info[1] for info in cursor.fetchall()]
+    if 'archive_year' not in columns:
+        cursor.execute('ALTER TABLE sync_rows ADD COLUMN archive_year INTEGER')
+        for year in archived_receipt_years():
+            cursor.executemany('''
+            UPDATE sync_rows SET archive_year = ? WHERE table_name = 'receipts' AND row_id = ?
+            AND row_id NOT IN (SELECT id FROM receipts)
+            ''', [(year, receipt_id) for receipt_id in _archived_receipt_ids(year)])
+        print("Migrated: Added 'archive_year' column to sync_rows table.")
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_sync_rows_seq ON sync_rows (seq)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_sync_rows_hlc ON sync_rows (hlc)')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS sync_peers (
+        node_id TEXT PRIMARY KEY,
+        received_seq INTEGER NOT NULL DEFAULT 0, -- peer's sync_rows.seq applied here
+        last_sync TEXT
+    )
+    ''')
+
+    # Quantity history: one event per consumption / restock. The log's latest
+    # quantity per item always equals items.quantity; direct quantity edits
+    # (forms, grid, sync, imports) are logged by trigger when they differ.
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'quantity_events'")
+    new_events = cursor.fetchone() is None
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS quantity_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        item_id INTEGER NOT NULL,
+        delta REAL NOT NULL, -- < 0 consumed, > 0 restocked
+        quantity REAL NOT NULL, -- item quantity after the event
+        event_day REAL NOT NULL DEFAULT (julianday('now'))
+    )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_quantity_events_item ON quantity_events (item_id, id)')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_items_quantity_insert AFTER INSERT ON items
+    BEGIN
+        -- stocked on its purchase date (items are often registered a few days late)
+        INSERT INTO quantity_events (item_id, delta, quantity, event_day)
+        VALUES (NEW.id, COALESCE(NEW.quantity, 0), COALESCE(NEW.quantity, 0),
+                MIN(COALESCE(NEW.purchase_day + 0.5, julianday('now')), julianday('now')));
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_items_quantity_update AFTER UPDATE OF quantity ON items
+    WHEN NEW.quantity IS NOT OLD.quantity
+     AND NEW.quantity IS NOT (SELECT quantity FROM quantity_events WHERE item_id = NEW.id ORDER BY id DESC LIMIT 1)
+    BEGIN
+        INSERT INTO quantity_events (item_id, delta, quantity) VALUES (NEW.id, COALESCE(NEW.quantity, 0) - COALESCE(OLD.quantity, 0), COALESCE(NEW.quantity, 0));
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_items_quantity_delete AFTER DELETE ON items
+    BEGIN
+        DELETE FROM quantity_events WHERE item_id = OLD.id;
+    END
+    ''')
+    if new_events:
+        # Existing stock counts as restocked on its purchase date
+        cursor.execute('''
+        INSERT INTO quantity_events (item_id, delta, quantity, event_day)
+        SELECT id, COALESCE(quantity, 0), COALESCE(quantity, 0),
+               MIN(COALESCE(purchase_day + 0.5, julianday('now')), julianday('now')) FROM items
+        ''')
+        if cursor.rowcount:
+            print("Migrated: Backfilled quantity_events from item quantities.")
+
+    # OCR jobs: the receipt page enqueues, ocr_worker.py processes. A claimed
+    # job's available_at is its lease end, a retried one's the retry time.
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS ocr_jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        image_path TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'queued', -- queued / running / done / failed
+        attempts INTEGER NOT NULL DEFAULT 0,
+        available_at REAL NOT NULL DEFAULT (julianday('now')),
+        worker TEXT,
+        result TEXT, -- JSON {"text": raw response, "info": extracted fields}
+        error TEXT,
+        created_at TEXT NOT NULL DEFAULT (datetime('now', 'localtime')),
+        finished_at TEXT,
+        receipt_id INTEGER -- the receipt registered from the result
+    )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_ocr_jobs_status ON ocr_jobs (status, available_at)')
+    # One row per OCR engine call, for cost / latency reports and daily budgets (ocr_metrics.py)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS ocr_calls (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        called_at TEXT NOT NULL DEFAULT (datetime('now', 'localtime')),
+        backend TEXT NOT NULL,
+        model TEXT,
+        job_id INTEGER,
+        image_bytes INTEGER DEFAULT 0,
+        prompt_tokens INTEGER DEFAULT 0,
+        response_tokens INTEGER DEFAULT 0,
+        cost REAL DEFAULT 0, -- USD at the prices set when the call was made
+        latency REAL NOT NULL, -- seconds, whole call
+        success INTEGER NOT NULL, -- fields were extracted
+        fallback INTEGER DEFAULT 0, -- answered by the fallback model
+        error TEXT
+    )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_ocr_calls_called_at ON ocr_calls (called_at)')
+
+    # Line items read from receipts, turned into items on the review grid (receipt_items.py)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS receipt_lines (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        receipt_id INTEGER NOT NULL,
+        line_no INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        name_key TEXT NOT NULL, -- normalize_names.name_key(name): matches past lines of the same product
+        quantity REAL DEFAULT 1,
+        unit_price REAL DEFAULT 0,
+        amount REAL DEFAULT 0,
+        status TEXT NOT NULL DEFAULT 'pending', -- pending / created / skipped
+        item_id INTEGER -- the item created from the line
+    )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_receipt_lines_receipt ON receipt_lines (receipt_id, line_no)')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_receipt_lines_pending ON receipt_lines (receipt_id) WHERE status = 'pending'")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_receipt_lines_key ON receipt_lines (name_key) WHERE status = 'created'")
+    # Every way a receipt leaves the table (delete, grid, import, archive move)
+    # takes its unregistered lines along. Created lines stay as the product
+    # history learned_defaults reads; receipt ids are never reused
+    cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = 'trg_receipts_lines_delete'")
+    row = cursor.fetchone()
+    if row and 'status' not in row[0]:
+        cursor.execute('DROP TRIGGER trg_receipts_lines_delete')
+        print("Migrated: Kept created receipt_lines when their receipt is deleted or archived.")
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_receipts_lines_delete AFTER DELETE ON receipts
+    BEGIN
+        DELETE FROM receipt_lines WHERE receipt_id = OLD.id AND status != 'created';
+    END
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_items_name ON items (name)')
+
+    # Spending rollups (spending.py): receipts and total per period and
+    # dimension value, kept current by triggers so the analytics page reads a
+    # few hundred rows however many receipts there are. Archive moves leave
+    # their receipts counted.
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'spending_rollups'")
+    new_rollups = cursor.fetchone() is None
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS spending_rollups (
+        dim TEXT NOT NULL, -- SPENDING_DIMS
+        period TEXT NOT NULL, -- YYYY-MM-DD for day, YYYY-MM otherwise
+        key TEXT NOT NULL, -- category id, store or card name; '' for day / month
+        receipts INTEGER NOT NULL DEFAULT 0,
+        total REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (dim, period, key)
+    ) WITHOUT ROWID
+    ''')
+    for sql in _spending_triggers():
+        cursor.execute(sql)
+    cursor.execute('SELECT COUNT(*) FROM receipts')
+    new_rollups = new_rollups and (cursor.fetchone()[0] > 0 or bool(archived_receipt_years()))
+
     # Check initialization flag
     cursor.execute('SELECT value FROM settings WHERE key = "initialized"')
     if not cursor.fetchone():
         # No default categories anymore as per user request
         cursor.execute('INSERT INTO settings (key, value) VALUES ("initialized", "true")')
-    
-    # Create default admin user 'skpark' if no users exist
-    cursor.execute('SELECT COUNT(*) FROM users')
-    if cursor.fetchone()[0] == 0:
-        # Default password for skpark is '1234'
-        cursor.execute('INSERT INTO users (username, password_hash) VALUES (?, ?)', 
-                       ("skpark", hash_password("1234")))
-        print("Default admin user 'skpark' created (password: 1234)")
 
     conn.commit()
     conn.close()
+    if new_rollups:
+        # Needs ATTACH for the archive files, so it runs on its own connection
+        rebuild_spending_rollups()
+        print("Migrated: Built spending_rollups from receipts.")
 
-# Location CRUD
-def add_location(name, category, parent_id=None, is_food=False):
-    conn = get_connection()
+
+def _name_count_triggers(kind, table, column):
+    add = f'''
+        INSERT INTO name_counts (kind, value, uses) VALUES ('{kind}', NEW.{column}, 1)
+        ON CONFLICT (kind, value) DO UPDATE SET uses = uses + 1;'''
+    remove = f'''
+        UPDATE name_counts SET uses = uses - 1 WHERE kind = '{kind}' AND value = OLD.{column};
+        DELETE FROM name_counts WHERE kind = '{kind}' AND value = OLD.{column} AND uses <= 0;'''
+    has_new = f"NEW.{column} IS NOT NULL AND NEW.{column} != ''"
+    has_old = f"OLD.{column} IS NOT NULL AND OLD.{column} != ''"
+    prefix = f"trg_{table}_{kind}_names"
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS {prefix}_insert AFTER INSERT ON {table} WHEN {has_new} BEGIN {add} END",
+        f"CREATE TRIGGER IF NOT EXISTS {prefix}_delete AFTER DELETE ON {table} WHEN {has_old} BEGIN {remove} END",
+        # Split so a NULL/empty side is simply skipped
+        f"CREATE TRIGGER IF NOT EXISTS {prefix}_update_old AFTER UPDATE OF {column} ON {table} "
+        f"WHEN OLD.{column} IS NOT NEW.{column} AND {has_old} BEGIN {remove} END",
+        f"CREATE TRIGGER IF NOT EXISTS {prefix}_update_new AFTER UPDATE OF {column} ON {table} "
+        f"WHEN OLD.{column} IS NOT NEW.{column} AND {has_new} BEGIN {add} END",
+    ]
+
+def _spending_triggers():
+    def change(ref, sign):
+        sql = ''
+        for dim, (period, key) in SPENDING_DIMS.items():
+            period, key = period.format(r=ref), key.format(r=ref)
+            sql += f'''
+        INSERT INTO spending_rollups (dim, period, key, receipts, total)
+        VALUES ('{dim}', {period}, {key}, {sign}1, {sign}COALESCE({ref}.total_amount, 0))
+        ON CONFLICT (dim, period, key) DO UPDATE SET receipts = receipts + excluded.receipts, total = total + excluded.total;'''
+            if sign == '-':
+                sql += f'''
+        DELETE FROM spending_rollups WHERE dim = '{dim}' AND period = {period} AND key = {key} AND receipts <= 0;'''
+        return sql
+    changed = " OR ".join(f"OLD.{c} IS NOT NEW.{c}" for c in SPENDING_COLUMNS)
+    # Receipts without a date have no period and stay out of the rollups
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS trg_receipts_spending_insert AFTER INSERT ON receipts "
+        f"WHEN NEW.use_date IS NOT NULL BEGIN {change('NEW', '+')} END",
+        f"CREATE TRIGGER IF NOT EXISTS trg_receipts_spending_delete AFTER DELETE ON receipts "
+        f"WHEN OLD.use_date IS NOT NULL BEGIN {change('OLD', '-')} END",
+        f"CREATE TRIGGER IF NOT EXISTS trg_receipts_spending_update_old AFTER UPDATE OF {', '.join(SPENDING_COLUMNS)} ON receipts "
+        f"WHEN ({changed}) AND OLD.use_date IS NOT NULL BEGIN {change('OLD', '-')} END",
+        f"CREATE TRIGGER IF NOT EXISTS trg_receipts_spending_update_new AFTER UPDATE OF {', '.join(SPENDING_COLUMNS)} ON receipts "
+        f"WHEN ({changed}) AND NEW.use_date IS NOT NULL BEGIN {change('NEW', '+')} END",
+    ]
+
+def _add_spending(cursor, source, where='1', params=(), sign=1):
+    # Bulk version of the triggers: adds (sign=1) or removes the receipts of `source` matching `where`
+    for dim, (period, key) in SPENDING_DIMS.items():
+        cursor.execute(f'''
+        INSERT INTO spending_rollups (dim, period, key, receipts, total)
+        SELECT '{dim}', {period.format(r='r')}, {key.format(r='r')}, {sign} * COUNT(*), {sign} * COALESCE(SUM(r.total_amount), 0)
+        FROM {source} AS r WHERE r.use_date IS NOT NULL AND ({where}) GROUP BY 2, 3
+        ON CONFLICT (dim, period, key) DO UPDATE SET receipts = receipts + excluded.receipts, total = total + excluded.total
+        ''', params)
+    cursor.execute('DELETE FROM spending_rollups WHERE receipts <= 0')
+
+def rebuild_spending_rollups():
+    """Recomputes spending_rollups from the main DB and the archive files. Returns the rollup rows."""
+    years = archived_receipt_years()
+    conn = _archive_connection()
     cursor = conn.cursor()
+    for year in years:
+        cursor.execute(f'ATTACH DATABASE ? AS archive_{year}', (receipt_archive_path(year),))
+    try:
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute('DELETE FROM spending_rollups')
+        _add_spending(cursor, 'main.receipts')
+        for year in years:
+            # Same rule as all_receipts: the main DB's copy wins
+            _add_spending(cursor, f'archive_{year}.receipts', 'r.id NOT IN (SELECT id FROM main.receipts)')
+        cursor.execute('SELECT COUNT(*) FROM spending_rollups')
+        rows = cursor.fetchone()[0]
+        cursor.execute('COMMIT')
+    except Exception:
+        if conn.in_transaction:
+            cursor.execute('ROLLBACK')
+        raise
+    finally:
+        for year in years:
+            cursor.execute(f'DETACH DATABASE archive_{year}')
+        conn.close()
+    return rows
+
+def rebuild_name_counts(cursor):
+    cursor.execute('DELETE FROM name_counts')
+    for kind, (table, column) in NAME_KINDS.items():
+        cursor.execute(f'''
+        INSERT INTO name_counts (kind, value, uses)
+        SELECT '{kind}', {column}, COUNT(*) FROM {table}
+        WHERE {column} IS NOT NULL AND {column} != ''
+        GROUP BY {column}
+        ''')
+    cursor.execute("INSERT INTO name_trigrams (name_trigrams) VALUES ('rebuild')")
+
+# Location CRUD
+@writes
+def add_location(cursor, name, category, parent_id=None, is_food=False):
     cursor.execute('INSERT INTO locations (name, category, parent_id, is_food) VALUES (?, ?, ?, ?)', (name, category, parent_id, is_food))
-    conn.commit()
-    conn.close()
 
 def get_locations():
-    conn = get_connection()
+    conn = get_read_connection()
     cursor = conn.cursor()
-    cursor.execute('SELECT * FROM locations')
+    cursor.row_factory = models.row_factory(Location)
+    cursor.execute(f'SELECT {models.columns(Location)} FROM locations')
     rows = cursor.fetchall()
     conn.close()
     return rows
 
-def update_location(location_id, name, category, is_food):
-    conn = get_connection()
-    cursor = conn.cursor()
+@writes
+def update_location(cursor, location_id, name, category, is_food):
     cursor.execute('UPDATE locations SET name=?, category=?, is_food=? WHERE id=?', (name, category, is_food, location_id))
-    conn.commit()
-    conn.close()
 
-def delete_location_safely(location_id):
-    conn = get_connection()
-    cursor = conn.cursor()
+@writes
+def delete_location_safely(cursor, location_id):
     # Reassign items to NULL (meaning Unassigned/Top-level)
     cursor.execute('UPDATE items SET location_id = NULL WHERE location_id = ?', (location_id,))
+    # Child locations move up to the deleted location's parent
+    cursor.execute('''
+    UPDATE locations SET parent_id = (SELECT parent_id FROM locations WHERE id = ?)
+    WHERE parent_id = ?
+    ''', (location_id, location_id))
     # Delete the location
     cursor.execute('DELETE FROM locations WHERE id = ?', (location_id,))
-    conn.commit()
+
+# Location hierarchy (closure table)
+def rebuild_location_closure(cursor):
+    # Recomputes every path from locations.parent_id in one recursive query
+    cursor.execute('DELETE FROM location_closure')
+    cursor.execute('''
+    WITH RECURSIVE tree(ancestor_id, descendant_id, depth) AS (
+        SELECT id, id, 0 FROM locations
+        UNION ALL
+        SELECT tree.ancestor_id, locations.id, tree.depth + 1
+        FROM tree JOIN locations ON locations.parent_id = tree.descendant_id
+        WHERE tree.depth < 64
+    )
+    INSERT OR IGNORE INTO location_closure (ancestor_id, descendant_id, depth)
+    SELECT ancestor_id, descendant_id, depth FROM tree
+    ''')
+
+@writes
+def _move_location_op(cursor, location_id, new_parent_id):
+    if new_parent_id is not None:
+        cursor.execute('SELECT 1 FROM location_closure WHERE ancestor_id = ? AND descendant_id = ?', (location_id, new_parent_id))
+        if cursor.fetchone():
+            raise ValueError("자기 자신 또는 하위 카테고리 아래로는 이동할 수 없습니다.")
+    cursor.execute('UPDATE locations SET parent_id = ? WHERE id = ?', (new_parent_id, location_id))
+
+def move_location(location_id, new_parent_id):
+    # Moves a location together with its whole subtree
+    try:
+        _move_location_op(location_id, new_parent_id)
+        return True, "카테고리가 이동되었습니다."
+    except ValueError as e:
+        return False, str(e)
+
+def get_location_paths():
+    # Returns {location_id: "집 > 주방 > 냉장고"}
+    conn = get_read_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+    SELECT c.descendant_id, l.name
+    FROM location_closure c JOIN locations l ON l.id = c.ancestor_id
+    ORDER BY c.descendant_id, c.depth DESC
+    ''')
+    paths = {}
+    for loc_id, name in cursor.fetchall():
+        paths[loc_id] = f"{paths[loc_id]} > {name}" if loc_id in paths else name
     conn.close()
+    return paths
 
-# Item CRUD
-def add_item(name, purchase_date, expiry_date, quantity, notes, location_id):
-    conn = get_connection()
+def get_subtree_items(location_id):
+    # All items stored in the location or anywhere below it
+    conn = get_read_connection()
+    cursor = conn.cursor()
+    cursor.row_factory = models.row_factory(Item)
+    cursor.execute(f'''
+    SELECT {models.columns(Item, 'items')} FROM location_closure c
+    JOIN items ON items.location_id = c.descendant_id
+    WHERE c.ancestor_id = ?
+    ORDER BY items.expiry_date
+    ''', (location_id,))
+    rows = cursor.fetchall()
+    conn.close()
+    return rows
+
+def get_subtree_stats():
+    # Per-location totals over each whole subtree, as SubtreeStats rows
+    conn = get_read_connection()
     cursor = conn.cursor()
+    cursor.row_factory = models.row_factory(SubtreeStats)
+    today = to_day(datetime.now().date())
+    cursor.execute('''
+    SELECT c.ancestor_id,
+           COUNT(items.id),
+           COALESCE(SUM(items.quantity), 0),
+           COALESCE(SUM(items.expiry_day < ?), 0),
+           COALESCE(SUM(items.expiry_day BETWEEN ? AND ?), 0),
+           MIN(CASE WHEN items.expiry_day >= ? THEN items.expiry_date END)
+    FROM location_closure c
+    LEFT JOIN items ON items.location_id = c.descendant_id
+    GROUP BY c.ancestor_id
+    ''', (today, today, today + 7, today))
+    rows = cursor.fetchall()
+    conn.close()
+    return rows
+
+# Item CRUD
+@writes
+def add_item(cursor, name, purchase_date, expiry_date, quantity, notes, location_id):
     cursor.execute('''
     INSERT INTO items (name, purchase_date, expiry_date, quantity, notes, location_id)
     VALUES (?, ?, ?, ?, ?, ?)
-    ''', (name, purchase_date, expiry_date, quantity, notes, location_id))
-    conn.commit()
-    conn.close()
+    ''', (name, normalize_date(purchase_date), normalize_date(expiry_date), quantity, notes, location_id))
 
 def get_items(location_id=None):
-    conn = get_connection()
+    conn = get_read_connection()
     cursor = conn.cursor()
+    cursor.row_factory = models.row_factory(Item)
     if location_id:
-        cursor.execute('SELECT * FROM items WHERE location_id = ?', (location_id,))
+        cursor.execute(f'SELECT {models.columns(Item)} FROM items WHERE location_id = ?', (location_id,))
     else:
-        cursor.execute('SELECT * FROM items')
+        cursor.execute(f'SELECT {models.columns(Item)} FROM items')
     rows = cursor.fetchall()
     conn.close()
     return rows
 
-def update_item(item_id, name, purchase_date, expiry_date, quantity, notes, location_id):
-    conn = get_connection()
+def get_item(item_id):
+    conn = get_read_connection()
     cursor = conn.cursor()
+    cursor.row_factory = models.row_factory(Item)
+    cursor.execute(f'SELECT {models.columns(Item)} FROM items WHERE id = ?', (item_id,))
+    row = cursor.fetchone()
+    conn.close()
+    return row
+
+def _fetch_columns(model, sql, params=()):
+    # Columnar variant for list views: {field: tuple of values}, no per-row objects
+    conn = get_read_connection()
+    rows = conn.execute(sql, params).fetchall()
+    conn.close()
+    values = list(zip(*rows)) if rows else [()] * len(model._fields)
+    return dict(zip(model._fields, values))
+
+def get_items_columnar(location_id=None):
+    if location_id:
+        return _fetch_columns(Item, f'SELECT {models.columns(Item)} FROM items WHERE location_id = ?', (location_id,))
+    return _fetch_columns(Item, f'SELECT {models.columns(Item)} FROM items')
+
+@writes
+def update_item(cursor, item_id, name, purchase_date, expiry_date, quantity, notes, location_id):
     cursor.execute('''
-    UPDATE items SET name=?, purchase_date=?, expiry_date=?, quantity=?, notes=?, location_id=?
+    UPDATE items SET name=?, purchase_date=?, expiry_date=?, quantity=?, notes=?, location_id=?, version=version+1
     WHERE id=?
-    ''', (name, purchase_date, expiry_date, quantity, notes, location_id, item_id))
-    conn.commit()
-    conn.close()
+    ''', (name, normalize_date(purchase_date), normalize_date(expiry_date), quantity, notes, location_id, item_id))
 
-def delete_item(item_id):
-    conn = get_connection()
-    cursor = conn.cursor()
+@writes
+def delete_item(cursor, item_id):
     cursor.execute('DELETE FROM items WHERE id = ?', (item_id,))
-    conn.commit()
+
+# Quantity events (consumption / restock history)
+def to_julian(moment):
+    # datetime -> julianday() value, comparable with quantity_events.event_day
+    seconds = moment.hour * 3600 + moment.minute * 60 + moment.second
+    return to_day(moment) - 0.5 + seconds / 86400
+
+@writes
+def record_quantity_events(cursor, events):
+    """
+    Applies (item_id, delta) or (item_id, delta, when) events in one job:
+    delta < 0 consumes, > 0 restocks, `when` (datetime) backdates the event.
+    Quantities stop at zero. Returns the ids of items that no longer exist.
+    """
+    missing = []
+    for item_id, delta, *when in events:
+        cursor.execute('SELECT quantity FROM items WHERE id = ?', (item_id,))
+        row = cursor.fetchone()
+        if row is None:
+            missing.append(item_id)
+            continue
+        before = row[0] or 0
+        after = max(before + delta, 0)
+        # Logged first, so the update trigger sees the quantity already recorded
+        cursor.execute('''
+        INSERT INTO quantity_events (item_id, delta, quantity, event_day)
+        VALUES (?, ?, ?, COALESCE(?, julianday('now')))
+        ''', (item_id, after - before, after, to_julian(when[0]) if when else None))
+        cursor.execute('UPDATE items SET quantity = ?, version = version + 1 WHERE id = ?', (after, item_id))
+    return missing
+
+def consume_item(item_id, amount=1):
+    return not record_quantity_events([(item_id, -amount)])
+
+def get_quantity_events(item_id):
+    conn = get_read_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+    SELECT datetime(event_day), delta, quantity FROM quantity_events
+    WHERE item_id = ? ORDER BY id
+    ''', (item_id,))
+    rows = cursor.fetchall()
     conn.close()
+    return rows
 
 def get_expiry_alerts():
-    conn = get_connection()
+    conn = get_read_connection()
     cursor = conn.cursor()
-    today = datetime.now().date().isoformat()
-    # Expired or expiring within 30 days
+    today = to_day(datetime.now().date())
+    # Expired or expiring within 30 days (index range scan on expiry_day)
     cursor.execute('''
-    SELECT items.*, locations.category 
+    SELECT items.id, items.name, items.purchase_date, items.expiry_date, items.quantity, items.notes, items.location_id, locations.category 
     FROM items 
     JOIN locations ON items.location_id = locations.id
-    WHERE expiry_date <= date(?, '+30 days')
-    ORDER BY expiry_date ASC
-    ''', (today,))
+    WHERE expiry_day <= ?
+    ORDER BY expiry_day ASC
+    ''', (today + 30,))
+    rows = cursor.fetchall()
+    conn.close()
+    return rows
+
+def get_expiry_counts(days=7):
+    # (total, expired, expiring within `days`) using the expiry_day index
+    conn = get_read_connection()
+    cursor = conn.cursor()
+    today = to_day(datetime.now().date())
+    cursor.execute('''
+    SELECT (SELECT COUNT(*) FROM items),
+           (SELECT COUNT(*) FROM items WHERE expiry_day < ?),
+           (SELECT COUNT(*) FROM items WHERE expiry_day BETWEEN ? AND ?)
+    ''', (today, today, today + days))
+    row = cursor.fetchone()
+    conn.close()
+    return row
+
+def get_category_counts():
+    # [(category, item_count)], largest first; unassigned items count as '기타'
+    conn = get_read_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+    SELECT COALESCE(locations.category, '기타'), COUNT(*)
+    FROM items LEFT JOIN locations ON items.location_id = locations.id
+    GROUP BY 1 ORDER BY 2 DESC
+    ''')
+    rows = cursor.fetchall()
+    conn.close()
+    return rows
+
+def get_items_expiring(days=7):
+    # Expired items and items expiring within `days`, soonest first
+    conn = get_read_connection()
+    cursor = conn.cursor()
+    cursor.row_factory = models.row_factory(Item)
+    cursor.execute(f'SELECT {models.columns(Item)} FROM items WHERE expiry_day <= ? ORDER BY expiry_day',
+                   (to_day(datetime.now().date()) + days,))
+    rows = cursor.fetchall()
+    conn.close()
+    return rows
+
+def get_items_by_ids(item_ids):
+    # Returns {item_id: (name, category)} for the given ids
+    if not item_ids:
+        return {}
+    conn = get_read_connection()
+    cursor = conn.cursor()
+    placeholders = ",".join("?" * len(item_ids))
+    cursor.execute(f'''
+    SELECT items.id, items.name, COALESCE(locations.category, '기타')
+    FROM items LEFT JOIN locations ON items.location_id = locations.id
+    WHERE items.id IN ({placeholders})
+    ''', list(item_ids))
+    rows = {r[0]: (r[1], r[2]) for r in cursor.fetchall()}
+    conn.close()
+    return rows
+
+@writes
+def save_expiry_digest(cursor, digest_date, counts, payload):
+    cursor.execute('''
+    INSERT OR REPLACE INTO expiry_digests (digest_date, created_at, expired, d0, d3, d30, payload)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (digest_date, datetime.now().isoformat(timespec='seconds'),
+          counts['expired'], counts['d0'], counts['d3'], counts['d30'], payload))
+
+def expiry_changes_pending():
+    # Items changed since the scheduler's last pass (it claims expiry_dirty)
+    conn = get_read_connection()
+    pending = conn.execute('SELECT 1 FROM expiry_dirty LIMIT 1').fetchone() is not None
+    conn.close()
+    return pending
+
+def get_latest_expiry_digest():
+    # Returns an ExpiryDigest or None
+    conn = get_read_connection()
+    cursor = conn.cursor()
+    cursor.row_factory = models.row_factory(ExpiryDigest)
+    cursor.execute(f'SELECT {models.columns(ExpiryDigest)} FROM expiry_digests ORDER BY digest_date DESC LIMIT 1')
+    row = cursor.fetchone()
+    conn.close()
+    return row
+
+# OCR jobs
+OCR_MAX_ATTEMPTS = 3
+OCR_LEASE_SECONDS = 120   # a job whose worker went quiet this long is handed out again
+OCR_RETRY_SECONDS = 30    # times the attempt number
+
+@writes
+def enqueue_ocr_job(cursor, image_path):
+    cursor.execute('INSERT INTO ocr_jobs (image_path) VALUES (?)', (image_path,))
+    return cursor.lastrowid
+
+@writes
+def claim_ocr_job(cursor, worker, lease_seconds=OCR_LEASE_SECONDS):
+    """Takes the oldest available job for `worker`; None when the queue is empty."""
+    # Leases that ran out on the last attempt mean the job keeps killing workers
+    cursor.execute('''
+    UPDATE ocr_jobs SET status = 'failed', error = '작업 시간 초과', finished_at = datetime('now', 'localtime')
+    WHERE status = 'running' AND available_at <= julianday('now') AND attempts >= ?
+    ''', (OCR_MAX_ATTEMPTS,))
+    cursor.execute(f'''
+    UPDATE ocr_jobs SET status = 'running', attempts = attempts + 1, worker = ?,
+                        available_at = julianday('now') + ? / 86400.0
+    WHERE id = (SELECT id FROM ocr_jobs
+                WHERE status IN ('queued', 'running') AND available_at <= julianday('now')
+                ORDER BY id LIMIT 1)
+    RETURNING {models.columns(OcrJob)}
+    ''', (worker, lease_seconds))
+    row = cursor.fetchone()
+    return OcrJob._make(row) if row else None
+
+@writes
+def finish_ocr_job(cursor, job_id, text, info):
+    cursor.execute('''
+    UPDATE ocr_jobs SET status = 'done', result = ?, error = NULL, finished_at = datetime('now', 'localtime')
+    WHERE id = ?
+    ''', (json.dumps({'text': text, 'info': info}, ensure_ascii=False), job_id))
+
+@writes
+def fail_ocr_job(cursor, job_id, error):
+    # Back to the queue with a growing delay until the attempts run out
+    cursor.execute('''
+    UPDATE ocr_jobs SET error = ?,
+        status = CASE WHEN attempts < ? THEN 'queued' ELSE 'failed' END,
+        available_at = julianday('now') + attempts * ? / 86400.0,
+        finished_at = CASE WHEN attempts < ? THEN NULL ELSE datetime('now', 'localtime') END
+    WHERE id = ?
+    ''', (error, OCR_MAX_ATTEMPTS, OCR_RETRY_SECONDS, OCR_MAX_ATTEMPTS, job_id))
+
+def get_ocr_job(job_id):
+    conn = get_read_connection()
+    cursor = conn.cursor()
+    cursor.row_factory = models.row_factory(OcrJob)
+    cursor.execute(f'SELECT {models.columns(OcrJob)} FROM ocr_jobs WHERE id = ?', (job_id,))
+    row = cursor.fetchone()
+    conn.close()
+    return row
+
+def get_unused_ocr_results(limit=20):
+    # Finished jobs no receipt was registered from yet, newest first
+    conn = get_read_connection()
+    cursor = conn.cursor()
+    cursor.row_factory = models.row_factory(OcrJob)
+    cursor.execute(f'''
+    SELECT {models.columns(OcrJob)} FROM ocr_jobs
+    WHERE status = 'done' AND receipt_id IS NULL ORDER BY id DESC LIMIT ?
+    ''', (limit,))
     rows = cursor.fetchall()
     conn.close()
     return rows
 
 def get_location_by_id(loc_id):
-    conn = get_connection()
+    conn = get_read_connection()
     cursor = conn.cursor()
-    cursor.execute('SELECT * FROM locations WHERE id = ?', (loc_id,))
+    cursor.row_factory = models.row_factory(Location)
+    cursor.execute(f'SELECT {models.columns(Location)} FROM locations WHERE id = ?', (loc_id,))
     row = cursor.fetchone()
     conn.close()
     return row
 
 # Receipt CRUD
-def add_receipt(category_id, store_name, store_address, card_type, card_number, use_date, sales_amount, vat, total_amount, notes, image_path):
-    conn = get_connection()
-    cursor = conn.cursor()
+@writes
+def add_receipt(cursor, category_id, store_name, store_address, card_type, card_number, use_date, sales_amount, vat, total_amount, notes, image_path, ocr_job_id=None, lines=()):
     cursor.execute('''
     INSERT INTO receipts (category_id, store_name, store_address, card_type, card_number, use_date, sales_amount, vat, total_amount, notes, image_path)
     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (category_id, store_name, store_address, card_type, card_number, use_date, sales_amount, vat, total_amount, notes, image_path))
-    conn.commit()
-    conn.close()
+    ''', (category_id, store_name, store_address, card_type, card_number, normalize_date(use_date), sales_amount, vat, total_amount, notes, image_path))
+    receipt_id = cursor.lastrowid
+    if lines:
+        # [(line_no, name, name_key, quantity, unit_price, amount), ...] from receipt_items.line_rows
+        cursor.executemany('''
+        INSERT INTO receipt_lines (receipt_id, line_no, name, name_key, quantity, unit_price, amount)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', [(receipt_id,) + tuple(line) for line in lines])
+    if ocr_job_id:
+        # The OCR result was used; it no longer shows up as waiting
+        cursor.execute('UPDATE ocr_jobs SET receipt_id = ? WHERE id = ?', (receipt_id, ocr_job_id))
+    return receipt_id
 
 def get_receipts(category_id=None):
-    conn = get_connection()
+    conn = get_read_connection()
     cursor = conn.cursor()
+    cursor.row_factory = models.row_factory(Receipt)
     if category_id:
-        cursor.execute('SELECT * FROM receipts WHERE category_id = ?', (category_id,))
+        cursor.execute(f'SELECT {models.columns(Receipt)} FROM receipts WHERE category_id = ?', (category_id,))
     else:
-        cursor.execute('SELECT * FROM receipts')
+        cursor.execute(f'SELECT {models.columns(Receipt)} FROM receipts')
     rows = cursor.fetchall()
     conn.close()
     return rows
 
-def update_receipt(receipt_id, category_id, store_name, store_address, card_type, card_number, use_date, sales_amount, vat, total_amount, notes, image_path):
-    conn = get_connection()
+def get_receipt(receipt_id):
+    # Looks in the archive files too, so archived receipts can still be viewed
+    conn = get_read_connection()
+    source = attach_receipt_archives(conn, archived_receipt_years())
     cursor = conn.cursor()
+    cursor.row_factory = models.row_factory(Receipt)
+    cursor.execute(f'SELECT {models.columns(Receipt)} FROM {source} WHERE id = ?', (receipt_id,))
+    row = cursor.fetchone()
+    conn.close()
+    return row
+
+def get_receipts_between(start_date, end_date, category_id=None):
+    # Receipts used between two dates (inclusive), via the use_day index
+    conn = get_read_connection()
+    years = [year for year in archived_receipt_years() if start_date.year <= year <= end_date.year]
+    source = attach_receipt_archives(conn, years)
+    cursor = conn.cursor()
+    cursor.row_factory = models.row_factory(Receipt)
+    sql = f'SELECT {models.columns(Receipt)} FROM {source} WHERE use_day BETWEEN ? AND ?'
+    params = [to_day(start_date), to_day(end_date)]
+    if category_id:
+        sql += ' AND category_id = ?'
+        params.append(category_id)
+    cursor.execute(sql + ' ORDER BY use_day DESC', params)
+    rows = cursor.fetchall()
+    conn.close()
+    return rows
+
+def get_receipts_columnar(category_id=None):
+    if category_id:
+        return _fetch_columns(Receipt, f'SELECT {models.columns(Receipt)} FROM receipts WHERE category_id = ?', (category_id,))
+    return _fetch_columns(Receipt, f'SELECT {models.columns(Receipt)} FROM receipts')
+
+@writes
+def update_receipt(cursor, receipt_id, category_id, store_name, store_address, card_type, card_number, use_date, sales_amount, vat, total_amount, notes, image_path):
     cursor.execute('''
     UPDATE receipts 
-    SET category_id=?, store_name=?, store_address=?, card_type=?, card_number=?, use_date=?, sales_amount=?, vat=?, total_amount=?, notes=?, image_path=?
+    SET category_id=?, store_name=?, store_address=?, card_type=?, card_number=?, use_date=?, sales_amount=?, vat=?, total_amount=?, notes=?, image_path=?, version=version+1
     WHERE id=?
-    ''', (category_id, store_name, store_address, card_type, card_number, use_date, sales_amount, vat, total_amount, notes, image_path, receipt_id))
-    conn.commit()
+    ''', (category_id, store_name, store_address, card_type, card_number, normalize_date(use_date), sales_amount, vat, total_amount, notes, image_path, receipt_id))
+
+@writes
+def delete_receipt(cursor, receipt_id):
+    cursor.execute('DELETE FROM receipts WHERE id = ?', (receipt_id,))
+
+# Receipt archive: receipts older than a cutoff year move to one SQLite file per
+# year next to the main DB, so the main DB (its backups and page cache) only
+# holds the recent ones. Date range reads ATTACH the years they span.
+def receipt_archive_path(year, path=None):
+    # '.' never appears in a tenant slug, so archive names cannot collide with tenant DBs
+    return f"{os.path.splitext(path or current_db_path())[0]}.receipts-{year}.db"
+
+def archived_receipt_years(path=None):
+    base = os.path.splitext(path or current_db_path())[0]
+    pattern = re.compile(re.escape(os.path.basename(base)) + r'\.receipts-(\d{4})\.db$')
+    matches = (pattern.match(name) for name in os.listdir(os.path.dirname(base) or '.'))
+    return sorted(int(m.group(1)) for m in matches if m)
+
+def _archived_receipt_ids(year):
+    conn = sqlite3.connect(f"file:{receipt_archive_path(year)}?mode=ro", uri=True)
+    ids = [receipt_id for (receipt_id,) in conn.execute('SELECT id FROM receipts')]
     conn.close()
+    return ids
 
-def delete_receipt(receipt_id):
-    conn = get_connection()
+def find_archived_receipt(receipt_id):
+    """Archive year holding receipt `receipt_id`, or None."""
+    for year in archived_receipt_years():
+        conn = sqlite3.connect(f"file:{receipt_archive_path(year)}?mode=ro", uri=True)
+        found = conn.execute('SELECT 1 FROM receipts WHERE id = ?', (receipt_id,)).fetchone()
+        conn.close()
+        if found:
+            return year
+    return None
+
+def _create_receipt_archive(cursor, schema):
+    # Same columns as receipts; ids are kept, so they stay unique across files
+    cursor.execute(f'''
+    CREATE TABLE IF NOT EXISTS {schema}.receipts (
+        id INTEGER PRIMARY KEY,
+        category_id INTEGER,
+        store_name TEXT NOT NULL,
+        store_address TEXT,
+        card_type TEXT,
+        card_number TEXT,
+        use_date DATETIME,
+        sales_amount REAL DEFAULT 0,
+        vat REAL DEFAULT 0,
+        total_amount REAL DEFAULT 0,
+        notes TEXT,
+        image_path TEXT,
+        version INTEGER DEFAULT 0,
+        use_day {day_column_sql('use_date')}
+    )
+    ''')
+    cursor.execute(f'CREATE INDEX IF NOT EXISTS {schema}.idx_receipts_use_day ON receipts (use_day)')
+
+def attach_receipt_archives(conn, years):
+    """
+    Attaches the archive files of `years` read-only and returns the table to
+    select receipts from: `receipts` when no archive is involved, otherwise the
+    TEMP view `all_receipts`. A row present in both (an interrupted archive run,
+    a re-import) is taken from the main DB.
+    """
+    columns = models.columns(Receipt)
+    parts = [f'SELECT {columns}, use_day FROM main.receipts']
+    for year in years:
+        schema = f'archive_{year}'
+        conn.execute(f'ATTACH DATABASE ? AS {schema}', (f"file:{receipt_archive_path(year)}?mode=ro",))
+        parts.append(f'SELECT {columns}, use_day FROM {schema}.receipts WHERE id NOT IN (SELECT id FROM main.receipts)')
+    if len(parts) == 1:
+        return 'receipts'
+    conn.execute('DROP VIEW IF EXISTS temp.all_receipts')
+    conn.execute(f"CREATE TEMP VIEW all_receipts AS {' UNION ALL '.join(parts)}")
+    return 'all_receipts'
+
+def receipt_is_archived(receipt_id):
+    # Archived receipts are read-only; edits go to the main DB only
+    conn = get_read_connection()
     cursor = conn.cursor()
-    cursor.execute('DELETE FROM receipts WHERE id = ?', (receipt_id,))
-    conn.commit()
+    cursor.execute('SELECT 1 FROM receipts WHERE id = ?', (receipt_id,))
+    in_main = cursor.fetchone() is not None
     conn.close()
+    # A copy in the main DB wins; an id found nowhere (deleted meanwhile) is not archived
+    return not in_main and find_archived_receipt(receipt_id) is not None
 
-# User Auth Functions
-def register_user(username, password):
-    conn = get_connection()
+def _archive_connection():
+    # ATTACH cannot run inside the writer thread's transactions, so archive
+    # moves use their own connection and wait for the write lock
+    return sqlite3.connect(current_db_path(), timeout=30, isolation_level=None)
+
+def archive_receipts(before_year):
+    """
+    Moves receipts used before Jan 1 of `before_year` into their year's archive
+    file. Returns {year: receipts moved}. Re-running after an interruption is
+    safe: copies replace rows already archived. The moves are kept out of the
+    change log, so delta exports and sync peers do not see them as deletes.
+    """
+    conn = _archive_connection()
     cursor = conn.cursor()
+    cursor.execute('''
+    SELECT CAST(substr(use_date, 1, 4) AS INTEGER), COUNT(*) FROM receipts
+    WHERE use_day < ? GROUP BY 1
+    ''', (to_day(datetime(before_year, 1, 1)),))
+    years = [year for year, _ in cursor.fetchall()]
+    columns = models.columns(Receipt)
+    moved = {}
+    for year in years:
+        bounds = (to_day(datetime(year, 1, 1)), to_day(datetime(year + 1, 1, 1)))
+        cursor.execute('ATTACH DATABASE ? AS archive', (receipt_archive_path(year),))
+        try:
+            _create_receipt_archive(cursor, 'archive')
+            cursor.execute('BEGIN IMMEDIATE')
+            cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM sqlite_sequence WHERE name = 'changes'")
+            seq = cursor.fetchone()[0]
+            # The delete below takes the moved receipts out of the spending
+            # rollups; archived receipts stay counted, so add back the ones
+            # the archive does not hold yet
+            _add_spending(cursor, 'main.receipts', 'r.use_day >= ? AND r.use_day < ? AND r.id NOT IN (SELECT id FROM archive.receipts)', bounds)
+            cursor.execute(f'''
+            INSERT OR REPLACE INTO archive.receipts ({columns})
+            SELECT {columns} FROM main.receipts WHERE use_day >= ? AND use_day < ?
+            ''', bounds)
+            moved[year] = cursor.rowcount
+            # Sync peers' edits of these receipts now go to the archive file
+            cursor.execute('''
+            UPDATE sync_rows SET archive_year = ? WHERE table_name = 'receipts'
+            AND row_id IN (SELECT id FROM main.receipts WHERE use_day >= ? AND use_day < ?)
+            ''', (year,) + bounds)
+            cursor.execute('DELETE FROM main.receipts WHERE use_day >= ? AND use_day < ?', bounds)
+            cursor.execute("DELETE FROM changes WHERE seq > ? AND table_name = 'receipts' AND op = 'D'", (seq,))
+            cursor.execute('COMMIT')
+        except Exception:
+            if conn.in_transaction:
+                cursor.execute('ROLLBACK')
+            raise
+        finally:
+            cursor.execute('DETACH DATABASE archive')
+    conn.close()
+    return moved
+
+def restore_receipts(year):
+    """Moves an archived year back into the main DB and removes its file. Returns receipts restored."""
+    path = receipt_archive_path(year)
+    if not os.path.exists(path):
+        return 0
+    conn = _archive_connection()
+    cursor = conn.cursor()
+    columns = models.columns(Receipt)
+    cursor.execute('ATTACH DATABASE ? AS archive', (path,))
+    cursor.execute('BEGIN IMMEDIATE')
+    cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM sqlite_sequence WHERE name = 'changes'")
+    seq = cursor.fetchone()[0]
+    # The restored receipts are counted in the spending rollups already; the
+    # insert triggers count them again
+    _add_spending(cursor, 'archive.receipts', 'r.id NOT IN (SELECT id FROM main.receipts)', sign=-1)
+    # Rows the main DB already has (a re-import) win over the archived copy
+    cursor.execute(f'INSERT OR IGNORE INTO main.receipts ({columns}) SELECT {columns} FROM archive.receipts')
+    restored = cursor.rowcount
+    # Like archiving, the move is no change for the log or sync peers
+    cursor.execute("DELETE FROM changes WHERE seq > ? AND table_name = 'receipts' AND op = 'I'", (seq,))
+    cursor.execute("UPDATE sync_rows SET archive_year = NULL WHERE table_name = 'receipts' AND archive_year = ?", (year,))
+    cursor.execute('COMMIT')
+    cursor.execute('DETACH DATABASE archive')
+    conn.close()
+    os.remove(path)
+    return restored
+
+@contextlib.contextmanager
+def writing_receipt_archives(years):
+    """
+    Cursor in one write transaction on the current DB with the archive files of
+    `years` attached read-write as archive_YEAR, for write_archived_receipt.
+    """
+    conn = _archive_connection()
+    cursor = conn.cursor()
+    for year in years:
+        cursor.execute(f'ATTACH DATABASE ? AS archive_{year}', (receipt_archive_path(year),))
     try:
-        cursor.execute('INSERT INTO users (username, password_hash) VALUES (?, ?)', 
-                       (username, hash_password(password)))
-        conn.commit()
+        cursor.execute('BEGIN IMMEDIATE')
+        yield cursor
+        cursor.execute('COMMIT')
+    except Exception:
+        if conn.in_transaction:
+            cursor.execute('ROLLBACK')
+        raise
+    finally:
+        conn.close()
+
+def write_archived_receipt(cursor, year, receipt_id, row):
+    """
+    Replaces (row: {column: value}) or deletes (row None) a receipt archived in
+    `year`, keeping the spending rollups and the change log in step. A new use
+    date outside the year moves the receipt back to the main DB. Returns the
+    archive year the receipt is in afterwards (None: main DB or deleted).
+    """
+    schema = f'archive_{year}'
+    cursor.execute('SELECT 1 FROM pragma_database_list WHERE name = ?', (schema,))
+    if cursor.fetchone() is None:
+        raise RuntimeError(f"receipt {receipt_id} was archived to {year} meanwhile; run again")
+    _add_spending(cursor, f'{schema}.receipts', 'r.id = ?', (receipt_id,), sign=-1)
+    if row is None:
+        cursor.execute(f'DELETE FROM {schema}.receipts WHERE id = ?', (receipt_id,))
+        cursor.execute("INSERT INTO changes (table_name, row_id, op) VALUES ('receipts', ?, 'D')", (receipt_id,))
+        return None
+    columns = list(row)
+    if str(row.get('use_date') or '')[:4] != f"{year:04d}":
+        # The main DB's triggers count and log the re-inserted receipt
+        cursor.execute(f'DELETE FROM {schema}.receipts WHERE id = ?', (receipt_id,))
+        cursor.execute(f"INSERT INTO main.receipts (id, {', '.join(columns)}) VALUES (?, {', '.join('?' * len(columns))})",
+                       [receipt_id] + [row[c] for c in columns])
+        return None
+    cursor.execute(f"UPDATE {schema}.receipts SET {', '.join(f'{c} = ?' for c in columns)}, version = version + 1 WHERE id = ?",
+                   [row[c] for c in columns] + [receipt_id])
+    _add_spending(cursor, f'{schema}.receipts', 'r.id = ?', (receipt_id,))
+    cursor.execute("INSERT INTO changes (table_name, row_id, op) VALUES ('receipts', ?, 'U')", (receipt_id,))
+    return year
+
+# Batch editing (grid mode)
+ITEM_COLUMNS = ('name', 'purchase_date', 'expiry_date', 'quantity', 'notes', 'location_id')
+DATE_COLUMNS = ('purchase_date', 'expiry_date', 'use_date')
+RECEIPT_COLUMNS = ('category_id', 'store_name', 'store_address', 'card_type', 'card_number', 'use_date',
+                   'sales_amount', 'vat', 'total_amount', 'notes', 'image_path')
+
+class WriteConflict(Exception):
+    def __init__(self, ids):
+        super().__init__(f"rows modified by another session: {ids}")
+        self.ids = ids
+
+@writes
+def _apply_batch_op(cursor, table, columns, updates, deletes):
+    conflicts = []
+    for row in updates:
+        fields = [c for c in columns if c in row]
+        if not fields:
+            continue
+        row = {c: normalize_date(v) if c in DATE_COLUMNS else v for c, v in row.items()}
+        set_clause = ", ".join(f"{c}=?" for c in fields)
+        cursor.execute(
+            f'UPDATE {table} SET {set_clause}, version=version+1 WHERE id=? AND version=?',
+            [row[c] for c in fields] + [row['id'], row['version']]
+        )
+        if cursor.rowcount == 0:
+            conflicts.append(row['id'])
+    for row_id, version in deletes:
+        cursor.execute(f'DELETE FROM {table} WHERE id=? AND version=?', (row_id, version))
+        if cursor.rowcount == 0:
+            conflicts.append(row_id)
+    if conflicts:
+        raise WriteConflict(conflicts)
+
+def _apply_batch(table, columns, updates, deletes):
+    """
+    Applies grid edits in a single transaction.
+    updates: list of dicts with 'id', 'version' and any subset of `columns`
+    deletes: list of (id, version)
+    Every row is checked against the version the editor loaded; if any row was
+    changed or removed by another session, nothing is written.
+    Returns: (success, conflict_ids)
+    """
+    try:
+        _apply_batch_op(table, columns, updates, deletes)
+        return True, []
+    except WriteConflict as e:
+        return False, e.ids
+
+def apply_item_changes(updates, deletes=()):
+    return _apply_batch('items', ITEM_COLUMNS, updates, deletes)
+
+def apply_receipt_changes(updates, deletes=()):
+    return _apply_batch('receipts', RECEIPT_COLUMNS, updates, deletes)
+
+# Receipt image hashes (near-duplicate detection)
+_HASH_INSERT = f'''
+INSERT OR REPLACE INTO image_hashes (image_path, hash, {", ".join(f"h{i}" for i in range(HASH_CHUNKS))})
+VALUES (?, ?, {", ".join("?" * HASH_CHUNKS)})
+'''
+
+def _hash_chunks(h):
+    mask = (1 << CHUNK_BITS) - 1
+    return [(h >> (i * CHUNK_BITS)) & mask for i in range(HASH_CHUNKS)]
+
+def _hash_row(image_path, h):
+    # SQLite integers are signed 64-bit
+    signed = h - (1 << HASH_BITS) if h >= 1 << (HASH_BITS - 1) else h
+    return [image_path, signed] + _hash_chunks(h)
+
+@writes
+def save_image_hash(cursor, image_path, h):
+    cursor.execute(_HASH_INSERT, _hash_row(image_path, h))
+
+@writes
+def save_image_hashes(cursor, hashes):
+    # Batch form for the backfill job: [(image_path, hash), ...]
+    cursor.executemany(_HASH_INSERT, [_hash_row(path, h) for path, h in hashes])
+
+def find_similar_receipts(h, max_distance=6):
+    """
+    Registered receipts whose image hash is within max_distance bits of h.
+    Returns [(distance, Receipt), ...] sorted by distance.
+    """
+    if max_distance > MAX_HASH_DISTANCE:
+        raise ValueError(f"max_distance must be <= {MAX_HASH_DISTANCE}")
+    probes = []
+    params = []
+    for i, chunk in enumerate(_hash_chunks(h)):
+        variants = [chunk] + [chunk ^ (1 << b) for b in range(CHUNK_BITS)]
+        probes.append(f"SELECT image_path, hash FROM image_hashes WHERE h{i} IN ({','.join('?' * len(variants))})")
+        params.extend(variants)
+    cursor = get_cached_read_connection().cursor()
+    # UNION ALL keeps every probe on its covering index (an OR would go back to
+    # the table per candidate); only the few real matches touch receipts
+    cursor.execute(" UNION ALL ".join(probes), params)
+    mask = (1 << HASH_BITS) - 1
+    distances = {}
+    for image_path, stored in cursor.fetchall():
+        distance = ((stored & mask) ^ h).bit_count()
+        if distance <= max_distance:
+            distances[image_path] = distance
+    matches = []
+    if distances:
+        # Archived receipts keep their hashes and still count as duplicates;
+        # the archives are attached on a connection of its own, not the cached one
+        conn = get_read_connection()
+        source = attach_receipt_archives(conn, archived_receipt_years())
+        cursor = conn.cursor()
+        cursor.row_factory = models.row_factory(Receipt)
+        cursor.execute(f'SELECT {models.columns(Receipt)} FROM {source} WHERE image_path IN ({",".join("?" * len(distances))})',
+                       list(distances))
+        matches = [(distances[r.image_path], r) for r in cursor.fetchall()]
+        conn.close()
+        matches.sort(key=lambda m: m[0])
+    return matches
+
+# Autocomplete
+def suggest_names(kind, text='', limit=10):
+    """
+    Names of the given kind (NAME_KINDS) matching text, most used first.
+    Three or more characters match anywhere through the trigram index; one or
+    two characters (common for Korean names) match as a prefix on the
+    (kind, value) index.
+    """
+    text = (text or '').strip()
+    cursor = get_cached_read_connection().cursor()
+    if len(text) >= 3:
+        cursor.execute('''
+        SELECT c.value FROM name_trigrams t JOIN name_counts c ON c.id = t.rowid
+        WHERE name_trigrams MATCH ? AND c.kind = ?
+        ORDER BY c.uses DESC, c.value LIMIT ?
+        ''', ('"' + text.replace('"', '""') + '"', kind, limit))
+    elif text:
+        upper = text[:-1] + chr(ord(text[-1]) + 1)
+        cursor.execute('''
+        SELECT value FROM name_counts WHERE kind = ? AND value >= ? AND value < ?
+        ORDER BY uses DESC, value LIMIT ?
+        ''', (kind, text, upper, limit))
+    else:
+        cursor.execute('SELECT value FROM name_counts WHERE kind = ? ORDER BY uses DESC, value LIMIT ?', (kind, limit))
+    return [r[0] for r in cursor.fetchall()]
+
+def get_name_counts(kind):
+    # [(value, uses), ...] for the normalization job
+    conn = get_read_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT value, uses FROM name_counts WHERE kind = ? ORDER BY uses DESC, value', (kind,))
+    rows = cursor.fetchall()
+    conn.close()
+    return rows
+
+@writes
+def rename_names(cursor, kind, mapping):
+    """Rewrites every variant -> canonical spelling of one kind. Returns rows changed."""
+    table, column = NAME_KINDS[kind]
+    changed = 0
+    for variant, canonical in mapping.items():
+        cursor.execute(f'UPDATE {table} SET {column} = ?, version = version + 1 WHERE {column} = ?', (canonical, variant))
+        changed += cursor.rowcount
+    return changed
+
+# Settings
+def get_setting(key, default=None):
+    conn = get_read_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT value FROM settings WHERE key = ?', (key,))
+    row = cursor.fetchone()
+    conn.close()
+    return row[0] if row else default
+
+@writes
+def set_setting(cursor, key, value):
+    cursor.execute('INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)', (key, str(value)))
+
+# Change data capture
+def get_changes_since(since=0, tables=None):
+    """
+    Net changes after seq `since`: the current row for everything inserted or
+    updated, and the ids of deleted rows. Pass the returned seq next time.
+    """
+    tables = list(tables or CDC_TABLES)
+    conn = get_read_connection()
+    cursor = conn.cursor()
+    cursor.execute('BEGIN')  # one snapshot for the log and the rows
+    # The AUTOINCREMENT counter keeps growing even when compaction drops the newest entries
+    cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM sqlite_sequence WHERE name = 'changes'")
+    seq = max(cursor.fetchone()[0], since)
+    cursor.execute("SELECT value FROM settings WHERE key = 'changes_floor'")
+    row = cursor.fetchone()
+    full_resync = since < int(row[0]) if row else False
+    upserts, deletes = {}, {}
+    for table in tables:
+        # Latest op per row (SQLite takes the bare column from the MAX(seq) row)
+        cursor.execute('''
+        SELECT row_id, op, MAX(seq) FROM changes
+        WHERE seq > ? AND seq <= ? AND table_name = ?
+        GROUP BY row_id
+        ''', (since, seq, table))
+        latest = cursor.fetchall()
+        deletes[table] = [row_id for row_id, op, _ in latest if op == 'D']
+        changed_ids = [row_id for row_id, op, _ in latest if op != 'D']
+        model = CDC_TABLES[table]
+        rows = []
+        for start in range(0, len(changed_ids), 500):
+            chunk = changed_ids[start:start + 500]
+            cursor.execute(f"SELECT {models.columns(model)} FROM {table} WHERE id IN ({','.join('?' * len(chunk))})", chunk)
+            rows.extend(model._make(r) for r in cursor.fetchall())
+        upserts[table] = rows
+    conn.rollback()
+    conn.close()
+    return ChangeSet(since, seq, full_resync, upserts, deletes)
+
+def get_changed_ids(since=0, tables=None):
+    """
+    (seq, full_resync, {table: ids}) of the rows inserted, updated or deleted
+    after seq `since`, for consumers that read the rows themselves.
+    """
+    tables = list(tables or CDC_TABLES)
+    conn = get_read_connection()
+    cursor = conn.cursor()
+    cursor.execute('BEGIN')
+    cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM sqlite_sequence WHERE name = 'changes'")
+    seq = max(cursor.fetchone()[0], since)
+    cursor.execute("SELECT value FROM settings WHERE key = 'changes_floor'")
+    row = cursor.fetchone()
+    full_resync = since < int(row[0]) if row else False
+    ids = {}
+    for table in tables:
+        cursor.execute('SELECT DISTINCT row_id FROM changes WHERE seq > ? AND seq <= ? AND table_name = ?', (since, seq, table))
+        ids[table] = [row_id for (row_id,) in cursor.fetchall()]
+    conn.rollback()
+    conn.close()
+    return seq, full_resync, ids
+
+def get_change_seq():
+    conn = get_read_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM sqlite_sequence WHERE name = 'changes'")
+    seq = cursor.fetchone()[0]
+    conn.close()
+    return seq
+
+@writes
+def compact_changes(cursor, purge_deletes_before=None):
+    """
+    Drops log entries superseded by a later entry for the same row (always safe
+    for consumers). With purge_deletes_before, also drops delete tombstones up
+    to that seq; consumers behind it get full_resync. Returns rows removed.
+    """
+    cursor.execute('''
+    DELETE FROM changes WHERE seq NOT IN (
+        SELECT MAX(seq) FROM changes GROUP BY table_name, row_id
+    )
+    ''')
+    removed = cursor.rowcount
+    if purge_deletes_before:
+        cursor.execute("DELETE FROM changes WHERE op = 'D' AND seq <= ?", (purge_deletes_before,))
+        removed += cursor.rowcount
+        cursor.execute("SELECT value FROM settings WHERE key = 'changes_floor'")
+        row = cursor.fetchone()
+        floor = max(int(row[0]) if row else 0, purge_deletes_before)
+        cursor.execute("INSERT OR REPLACE INTO settings (key, value) VALUES ('changes_floor', ?)", (str(floor),))
+    return removed
+
+def export_delta(since):
+    """ChangeSet plus one DataFrame per table and a 'deleted' frame, for delta files."""
+    import pandas as pd
+    changes = get_changes_since(since)
+    frames = {table: pd.DataFrame(changes.upserts[table], columns=list(CDC_TABLES[table]._fields))
+              for table in CDC_TABLES}
+    frames['deleted'] = pd.DataFrame(
+        [(table, row_id) for table, ids in changes.deletes.items() for row_id in ids],
+        columns=['table_name', 'id'])
+    frames['meta'] = pd.DataFrame([{'since': changes.since, 'seq': changes.seq, 'full_resync': changes.full_resync}])
+    return changes, frames
+
+# User Auth Functions (always the auth DB, whichever tenant the session uses)
+@writes
+def _insert_user(cursor, username, password_hash, household):
+    cursor.execute('INSERT INTO users (username, password_hash, household) VALUES (?, ?, ?)', (username, password_hash, household))
+
+def register_user(username, password, household=None):
+    try:
+        with using_db(auth_db_path()):
+            _insert_user(username, hash_password(password), household or None)
         return True
     except sqlite3.IntegrityError:
         return False
-    finally:
-        conn.close()
 
 def authenticate_user(username, password):
-    conn = get_connection()
+    with using_db(auth_db_path()):
+        conn = get_read_connection()
     cursor = conn.cursor()
-    cursor.execute('SELECT id, username FROM users WHERE username = ? AND password_hash = ?', 
+    cursor.row_factory = models.row_factory(User)
+    cursor.execute(f'SELECT {models.columns(User)} FROM users WHERE username = ? AND password_hash = ?', 
                    (username, hash_password(password)))
     user = cursor.fetchone()
     conn.close()
-    return user # returns (id, username) or None
+    return user # returns User(id, username, household) or None
 
-def delete_user(user_id):
-    conn = get_connection()
-    cursor = conn.cursor()
+def user_db_path(user):
+    # Tenant DB for a logged-in user; users without a household get their own file
+    return tenant_db_path(user.household or user.username)
+
+@writes
+def _delete_user_op(cursor, user_id):
     cursor.execute('DELETE FROM users WHERE id = ?', (user_id,))
-    conn.commit()
-    conn.close()
+
+def delete_user(user_id):
+    with using_db(auth_db_path()):
+        _delete_user_op(user_id)
 
 def get_all_users():
-    conn = get_connection()
+    with using_db(auth_db_path()):
+        conn = get_read_connection()
     cursor = conn.cursor()
-    cursor.execute('SELECT id, username FROM users')
+    cursor.row_factory = models.row_factory(User)
+    cursor.execute(f'SELECT {models.columns(User)} FROM users')
     users = cursor.fetchall()
     conn.close()
     return users
@@ -277,93 +1787,83 @@ if __name__ == "__main__":
 
 # Data Management (Export/Import)
 def export_all_data():
-    conn = get_connection()
+    import pandas as pd  # only the data management page needs pandas here
+    conn = get_read_connection()
     # Get Locations
-    loc_df = pd.read_sql_query("SELECT * FROM locations", conn)
+    loc_df = pd.read_sql_query(f"SELECT {models.columns(Location)} FROM locations", conn)
     # Get Items
-    item_df = pd.read_sql_query("SELECT * FROM items", conn)
+    item_df = pd.read_sql_query(f"SELECT {models.columns(Item)} FROM items", conn)
     # Get Receipts
-    receipt_df = pd.read_sql_query("SELECT * FROM receipts", conn)
+    receipt_df = pd.read_sql_query(f"SELECT {models.columns(Receipt)} FROM receipts", conn)
     conn.close()
+    # Archived years too, so an export stays a complete backup
+    for year in archived_receipt_years():
+        archive = sqlite3.connect(f"file:{receipt_archive_path(year)}?mode=ro", uri=True)
+        archived_df = pd.read_sql_query(f"SELECT {models.columns(Receipt)} FROM receipts", archive)
+        archive.close()
+        receipt_df = pd.concat([receipt_df, archived_df[~archived_df['id'].isin(receipt_df['id'])]], ignore_index=True)
     return loc_df, item_df, receipt_df
 
+# Imports replace the whole table. They run as one job on the writer thread, so
+# the DELETE + executemany never races other sessions for the write lock.
+IMPORT_COLUMNS = {
+    'locations': ('id', 'name', 'category', 'parent_id', 'is_food'),
+    'items': ('id', 'name', 'purchase_date', 'expiry_date', 'quantity', 'notes', 'location_id'),
+    'receipts': ('id', 'category_id', 'store_name', 'store_address', 'card_type', 'card_number', 'use_date',
+                 'sales_amount', 'vat', 'total_amount', 'notes', 'image_path'),
+}
+IMPORT_DATE_COLUMNS = ('purchase_date', 'expiry_date', 'use_date')
+
+def _replace_rows(cursor, table, insert_sql, records):
+    cursor.execute(f"DELETE FROM {table}")
+    cursor.execute("DELETE FROM sqlite_sequence WHERE name=?", (table,))
+    if records:
+        cursor.executemany(insert_sql, records)
+
+def _import_row(columns, record):
+    row = []
+    for column in columns:
+        value = record.get(column)
+        if column in IMPORT_DATE_COLUMNS:
+            value = normalize_date(value)
+        elif value == '' or value != value:  # empty CSV cell, NaN
+            value = None
+        row.append(value)
+    return row
+
+@writes
+def import_records(cursor, table, records):
+    """
+    Replaces `table` with dict records (missing keys -> NULL). Any iterable
+    works and is consumed while inserting, so files can be streamed in.
+    Returns the number of rows inserted.
+    """
+    columns = IMPORT_COLUMNS[table]
+    _replace_rows(cursor, table, f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                  (_import_row(columns, record) for record in records))
+    if table == 'locations':
+        # Rows may reference parents inserted later, so rebuild the closure afterwards
+        rebuild_location_closure(cursor)
+    cursor.execute(f"SELECT COUNT(*) FROM {table}")
+    return cursor.fetchone()[0]
+
 def import_locations(loc_df):
-    conn = get_connection()
-    cursor = conn.cursor()
     try:
-        cursor.execute("PRAGMA foreign_keys = OFF")
-        
-        # Clear existing locations
-        cursor.execute("DELETE FROM locations")
-        cursor.execute("DELETE FROM sqlite_sequence WHERE name='locations'")
-        
-        if not loc_df.empty:
-            loc_data = loc_df.to_dict('records')
-            cursor.executemany(
-                'INSERT INTO locations (id, name, category, parent_id, is_food) VALUES (:id, :name, :category, :parent_id, :is_food)',
-                loc_data
-            )
-            
-        conn.commit()
+        import_records('locations', loc_df.to_dict('records'))
         return True, "카테고리 데이터 가져오기 성공! (기존 데이터는 삭제되었습니다)"
     except Exception as e:
-        conn.rollback()
         return False, f"카테고리 데이터 가져오기 실패: {str(e)}"
-    finally:
-        cursor.execute("PRAGMA foreign_keys = ON")
-        conn.close()
 
 def import_items(item_df):
-    conn = get_connection()
-    cursor = conn.cursor()
     try:
-        cursor.execute("PRAGMA foreign_keys = OFF")
-        
-        # Clear existing items
-        cursor.execute("DELETE FROM items")
-        cursor.execute("DELETE FROM sqlite_sequence WHERE name='items'")
-        
-        if not item_df.empty:
-            item_data = item_df.to_dict('records')
-            cursor.executemany(
-                'INSERT INTO items (id, name, purchase_date, expiry_date, quantity, notes, location_id) VALUES (:id, :name, :purchase_date, :expiry_date, :quantity, :notes, :location_id)',
-                item_data
-            )
-            
-        conn.commit()
+        import_records('items', item_df.to_dict('records'))
         return True, "물품 데이터 가져오기 성공! (기존 데이터는 삭제되었습니다)"
     except Exception as e:
-        conn.rollback()
         return False, f"물품 데이터 가져오기 실패: {str(e)}"
-    finally:
-        cursor.execute("PRAGMA foreign_keys = ON")
-        conn.close()
 
 def import_receipts(receipt_df):
-    conn = get_connection()
-    cursor = conn.cursor()
     try:
-        cursor.execute("PRAGMA foreign_keys = OFF")
-        
-        # Clear existing receipts
-        cursor.execute("DELETE FROM receipts")
-        cursor.execute("DELETE FROM sqlite_sequence WHERE name='receipts'")
-        
-        if not receipt_df.empty:
-            # fillna to avoid errors with NULL values in SQLite
-            receipt_df = receipt_df.where(pd.notnull(receipt_df), None)
-            receipt_data = receipt_df.to_dict('records')
-            cursor.executemany(
-                '''INSERT INTO receipts (id, category_id, store_name, store_address, card_type, card_number, use_date, sales_amount, vat, total_amount, notes, image_path) 
-                   VALUES (:id, :category_id, :store_name, :store_address, :card_type, :card_number, :use_date, :sales_amount, :vat, :total_amount, :notes, :image_path)''',
-                receipt_data
-            )
-            
-        conn.commit()
+        import_records('receipts', receipt_df.to_dict('records'))
         return True, "영수증 데이터 가져오기 성공! (기존 데이터는 삭제되었습니다)"
     except Exception as e:
-        conn.rollback()
         return False, f"영수증 데이터 가져오기 실패: {str(e)}"
-    finally:
-        cursor.execute("PRAGMA foreign_keys = ON")
-        conn.close()
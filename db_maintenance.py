@@ -0,0 +1,156 @@
+"""
+Database maintenance scheduler.
+Checks the database on every tick and only does the work that is due:
+ANALYZE once enough rows changed since the last one (imports replace whole
+tables), PRAGMA optimize once a day, a WAL checkpoint when the -wal file grows
+past its limit, and freeing pages when the freelist takes a large share of the
+file: incremental_vacuum on files in auto_vacuum=INCREMENTAL mode, a one-time
+full VACUUM (which switches them to that mode) on older files. Last run times
+go to the settings table; the "DB 상태" page shows them with the file layout.
+
+    python db_maintenance.py [--once] [--force] [--interval SECONDS] [--db PATH]
+
+In household tenancy run one scheduler per household DB (--db data/household_x.db).
+"""
+import os
+import time
+import sqlite3
+import argparse
+from datetime import datetime
+import database as db
+from models import DbHealth, StorageObject
+
+FREELIST_RATIO = 0.1          # free pages / all pages before pages are given back
+MIN_FREE_PAGES = 256
+WAL_LIMIT_BYTES = 16 * 2**20  # checkpoint(TRUNCATE) past this
+CHURN_RATIO = 0.1             # changed rows / all rows before a fresh ANALYZE
+MIN_CHURN = 1000
+OPTIMIZE_EVERY_SECONDS = 86400
+
+AUTO_VACUUM_MODES = {0: 'none', 1: 'full', 2: 'incremental'}
+
+# (action, settings key of its last run, label on the DB 상태 page)
+ACTIONS = [
+    ('analyze', 'maint_last_analyze', 'ANALYZE'),
+    ('optimize', 'maint_last_optimize', 'PRAGMA optimize'),
+    ('checkpoint', 'maint_last_checkpoint', 'WAL checkpoint'),
+    ('incremental_vacuum', 'maint_last_incremental_vacuum', 'incremental_vacuum'),
+    ('vacuum', 'maint_last_vacuum', 'VACUUM'),
+]
+
+def _connection():
+    # VACUUM and checkpoints cannot run inside the writer thread's transactions
+    return sqlite3.connect(db.current_db_path(), timeout=30, isolation_level=None)
+
+def wal_bytes(path=None):
+    try:
+        return os.path.getsize((path or db.current_db_path()) + '-wal')
+    except OSError:
+        return 0
+
+def health():
+    conn = db.get_read_connection()
+    cursor = conn.cursor()
+    pragma = lambda name: cursor.execute(f'PRAGMA {name}').fetchone()[0]
+    page_size, page_count, freelist = pragma('page_size'), pragma('page_count'), pragma('freelist_count')
+    auto_vacuum = AUTO_VACUUM_MODES.get(pragma('auto_vacuum'), 'none')
+    rows = sum(cursor.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0] for table in db.CDC_TABLES)
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'")
+    has_stats = cursor.fetchone() is not None
+    conn.close()
+    churn = db.get_change_seq() - int(db.get_setting('maint_analyze_seq', 0))
+    return DbHealth(page_size, page_count, freelist, auto_vacuum, wal_bytes(), rows, max(churn, 0), has_stats)
+
+def storage_by_object():
+    """Pages and bytes per table and index (dbstat), largest first."""
+    conn = db.get_read_connection()
+    cursor = conn.cursor()
+    # aggregate=TRUE reads one summary row per b-tree instead of one per page
+    cursor.execute('''
+    SELECT s.name, COALESCE(m.type, 'table'), COALESCE(m.tbl_name, s.name), s.pageno, s.pgsize, s.unused
+    FROM dbstat AS s LEFT JOIN sqlite_master AS m ON m.name = s.name
+    WHERE s.aggregate = TRUE
+    ORDER BY s.pgsize DESC
+    ''')
+    objects = [StorageObject._make(row) for row in cursor.fetchall()]
+    conn.close()
+    return objects
+
+def last_runs():
+    return {action: db.get_setting(key) for action, key, _ in ACTIONS}
+
+def plan(h, now=None, force=False):
+    """The actions due for health `h`, in the order they should run."""
+    now = now or datetime.now()
+    actions = []
+    if force or not h.has_stats or h.churn >= max(MIN_CHURN, CHURN_RATIO * h.rows):
+        actions.append('analyze')
+    last_optimize = db.get_setting('maint_last_optimize')
+    if force or last_optimize is None or (now - datetime.fromisoformat(last_optimize)).total_seconds() >= OPTIMIZE_EVERY_SECONDS:
+        actions.append('optimize')
+    fragmented = h.freelist_count >= MIN_FREE_PAGES and h.freelist_count >= FREELIST_RATIO * h.page_count
+    if force or fragmented:
+        actions.append('incremental_vacuum' if h.auto_vacuum == 'incremental' else 'vacuum')
+    # VACUUM writes the whole file through the WAL, so checkpoint after it
+    if force or h.wal_bytes >= WAL_LIMIT_BYTES or 'vacuum' in actions:
+        actions.append('checkpoint')
+    return actions
+
+def run(actions):
+    """Runs the given actions and records when. Returns {action: seconds taken}."""
+    seq = db.get_change_seq()
+    timings = {}
+    conn = _connection()
+    for action in actions:
+        start = time.perf_counter()
+        if action == 'analyze':
+            conn.execute('ANALYZE')
+        elif action == 'optimize':
+            conn.execute('PRAGMA optimize')
+        elif action == 'incremental_vacuum':
+            # It frees one page per step; executescript steps it to the end
+            conn.executescript('PRAGMA incremental_vacuum')
+        elif action == 'vacuum':
+            conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+            conn.execute('VACUUM')
+        elif action == 'checkpoint':
+            conn.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchall()
+        timings[action] = time.perf_counter() - start
+    conn.close()
+    finished = datetime.now().isoformat(timespec='seconds')
+    for action, key, _ in ACTIONS:
+        if action in timings:
+            db.set_setting(key, finished)
+    if 'analyze' in timings:
+        db.set_setting('maint_analyze_seq', seq)
+    return timings
+
+def tick(force=False):
+    return run(plan(health(), force=force))
+
+def run_forever(interval=600):
+    while True:
+        timings = tick()
+        if timings:
+            print(f"{datetime.now():%Y-%m-%d %H:%M:%S} " + ", ".join(f"{a} {t:.2f}s" for a, t in timings.items()))
+        time.sleep(interval)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="MyCatalog database maintenance")
+    parser.add_argument('--once', action='store_true', help="run the due actions once and exit")
+    parser.add_argument('--force', action='store_true', help="with --once: run every action")
+    parser.add_argument('--interval', type=float, default=600, help="check interval in seconds")
+    parser.add_argument('--db', help="database file (default: mycatalog.db)")
+    args = parser.parse_args()
+    if args.db:
+        db.set_current_db(args.db)
+    db.ensure_db()
+    if args.once:
+        before = health()
+        timings = tick(force=args.force)
+        after = health()
+        print(f"{datetime.now():%Y-%m-%d %H:%M:%S} " + (", ".join(f"{a} {t:.2f}s" for a, t in timings.items()) or "nothing due")
+              + f"; {before.page_count} -> {after.page_count} pages, {after.freelist_count} free, WAL {after.wal_bytes / 1e6:.1f}MB.")
+    else:
+        print(f"Maintenance scheduler started (interval {args.interval}s).")
+        run_forever(args.interval)
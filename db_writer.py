@@ -0,0 +1,98 @@
+import sqlite3
+import threading
+import queue
+from concurrent.futures import Future
+
+# Maximum number of queued writes folded into one group commit
+MAX_BATCH = 256
+
+class DBWriter:
+    """
+    Single writer thread for one SQLite file.
+    Every write job is a function fn(cursor, *args, **kwargs). Jobs waiting in the
+    queue are coalesced into one transaction (group commit); each job runs inside
+    its own SAVEPOINT so a failing job does not roll back its neighbours.
+    submit() returns a concurrent.futures.Future resolved after the commit.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        # Connected here, not in the thread: a file that cannot be opened raises to
+        # the caller (and get_writer caches nothing) instead of killing the thread
+        # and leaving every submitted future unresolved
+        conn = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+        except Exception:
+            conn.close()
+            raise
+        self._conn = conn
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name=f"DBWriter({db_path})", daemon=True)
+        self._thread.start()
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        self._queue.put((fn, args, kwargs, future))
+        return future
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        conn = self._conn
+        cursor = conn.cursor()
+        stop = False
+        while not stop:
+            batch = [self._queue.get()]
+            while len(batch) < MAX_BATCH:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                stop = True
+                batch = [job for job in batch if job is not None]
+            if batch:
+                self._commit_batch(conn, cursor, batch)
+        conn.close()
+
+    def _commit_batch(self, conn, cursor, batch):
+        results = []
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            for fn, args, kwargs, future in batch:
+                cursor.execute("SAVEPOINT job")
+                try:
+                    results.append((future, fn(cursor, *args, **kwargs), None))
+                    cursor.execute("RELEASE job")
+                except Exception as e:
+                    cursor.execute("ROLLBACK TO job")
+                    cursor.execute("RELEASE job")
+                    results.append((future, None, e))
+            cursor.execute("COMMIT")
+        except Exception as e:
+            # The transaction itself failed (disk full, I/O error ...): fail every job
+            if conn.in_transaction:
+                conn.rollback()
+            for fn, args, kwargs, future in batch:
+                future.set_exception(e)
+            return
+        for future, result, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+def get_writer(db_path):
+    # One writer thread per database file, shared by every Streamlit session
+    with _writers_lock:
+        writer = _writers.get(db_path)
+        if writer is None:
+            writer = _writers[db_path] = DBWriter(db_path)
+        return writer
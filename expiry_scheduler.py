@@ -0,0 +1,206 @@
+"""
+Background expiry scheduler.
+Keeps a min-heap of (expiry day, item id) for every item, updated incrementally
+from the `expiry_dirty` table that triggers on `items` fill, and writes one
+digest per day (expired / D-0 / D-3 / D-30) into `expiry_digests` and the
+local outbox. The 알림 센터 page only reads the latest digest.
+
+    python expiry_scheduler.py [--once] [--interval SECONDS] [--db PATH]
+
+In household tenancy run one scheduler per household DB (--db data/household_x.db).
+"""
+import os
+import json
+import time
+import heapq
+import argparse
+import traceback
+from datetime import date, datetime
+import database as db
+
+OUTBOX_DIR = 'outbox'
+HORIZON_DAYS = 30
+CHUNK = 500  # ids per IN (...) list, under SQLite's variable limit
+
+# (bucket key, label, max days left) checked in order
+BUCKETS = [
+    ('expired', '만료됨', -1),
+    ('d0', '오늘 만료', 0),
+    ('d3', '3일 이내', 3),
+    ('d30', '30일 이내', HORIZON_DAYS),
+]
+
+@db.writes
+def _load_all(cursor, claim_dirty=True):
+    if claim_dirty:
+        cursor.execute('DELETE FROM expiry_dirty')
+    cursor.execute('SELECT id, expiry_day FROM items WHERE expiry_day IS NOT NULL')
+    return cursor.fetchall()
+
+@db.writes
+def _drain_dirty(cursor):
+    # Claims the changed item ids and returns their current expiry_day (None if deleted)
+    cursor.execute('SELECT item_id FROM expiry_dirty')
+    ids = [r[0] for r in cursor.fetchall()]
+    current = {}
+    for start in range(0, len(ids), CHUNK):
+        chunk = ids[start:start + CHUNK]
+        placeholders = ",".join("?" * len(chunk))
+        cursor.execute(f'DELETE FROM expiry_dirty WHERE item_id IN ({placeholders})', chunk)
+        cursor.execute(f'SELECT id, expiry_day FROM items WHERE id IN ({placeholders})', chunk)
+        current.update(cursor.fetchall())
+    return [(item_id, current.get(item_id)) for item_id in ids]
+
+def _heartbeat(interval):
+    # Tells the app a scheduler keeps the digest current (and needs expiry_dirty)
+    db.set_setting('expiry_scheduler_alive_until', time.time() + 3 * interval)
+
+def scheduler_running():
+    return float(db.get_setting('expiry_scheduler_alive_until', 0) or 0) > time.time()
+
+class ExpiryScheduler:
+    def __init__(self):
+        self.heap = []          # (expiry day, item id); stale entries are skipped lazily
+        self.expiry_by_item = {}
+        self.last_digest_day = None
+        self.loaded = False
+        self.digest_stale = False  # a failed pass may have left today's digest behind
+
+    def load(self, claim_dirty=True):
+        self.heap = []
+        self.expiry_by_item = {}
+        self.apply_changes(_load_all(claim_dirty))
+        self.loaded = True
+
+    def apply_changes(self, changes):
+        """Updates the heap from (item_id, expiry_day) pairs. Returns the smallest changed day."""
+        touched = None
+        for item_id, expiry_day in changes:
+            old_day = self.expiry_by_item.pop(item_id, None)
+            # expiry_day is a julianday integer; the heap works in date ordinals
+            day = expiry_day - db.JULIAN_DAY_OFFSET if expiry_day is not None else None
+            if day is not None:
+                self.expiry_by_item[item_id] = day
+                heapq.heappush(self.heap, (day, item_id))
+            for d in (old_day, day):
+                if d is not None and (touched is None or d < touched):
+                    touched = d
+        # Compact once stale entries dominate the heap
+        if len(self.heap) > 2 * len(self.expiry_by_item) + 64:
+            self.heap = [(d, i) for i, d in self.expiry_by_item.items()]
+            heapq.heapify(self.heap)
+        return touched
+
+    def due_items(self, today):
+        # Pops every live entry up to the horizon, then pushes them back: O(k log n)
+        horizon = today + HORIZON_DAYS
+        due, seen = [], set()
+        while self.heap and self.heap[0][0] <= horizon:
+            day, item_id = heapq.heappop(self.heap)
+            if self.expiry_by_item.get(item_id) == day and item_id not in seen:
+                seen.add(item_id)
+                due.append((day, item_id))
+        for entry in due:
+            heapq.heappush(self.heap, entry)
+        return due
+
+    def build_digest(self, today):
+        due = self.due_items(today)
+        details = db.get_items_by_ids([item_id for _, item_id in due])
+        counts = {key: 0 for key, _, _ in BUCKETS}
+        entries = []
+        for day, item_id in due:
+            info = details.get(item_id)
+            if info is None:
+                continue
+            days_left = day - today
+            bucket = next(key for key, _, limit in BUCKETS if days_left <= limit)
+            counts[bucket] += 1
+            entries.append({
+                'id': item_id,
+                'name': info[0],
+                'expiry_date': date.fromordinal(day).isoformat(),
+                'days_left': days_left,
+                'category': info[1],
+                'bucket': bucket,
+            })
+        return counts, entries
+
+    def write_digest(self, today, send=True):
+        counts, entries = self.build_digest(today)
+        digest_date = date.fromordinal(today).isoformat()
+        db.save_expiry_digest(digest_date, counts, json.dumps(entries, ensure_ascii=False))
+        if send:
+            write_outbox(digest_date, counts, entries)
+        self.last_digest_day = today
+        self.digest_stale = False
+        return counts, entries
+
+    def tick(self, today=None):
+        today = today if today is not None else date.today().toordinal()
+        touched = self.apply_changes(_drain_dirty())
+        if today != self.last_digest_day:
+            return self.write_digest(today)
+        if self.digest_stale or (touched is not None and touched <= today + HORIZON_DAYS):
+            # Refresh today's digest in place; the outbox only gets the daily one
+            return self.write_digest(today, send=False)
+        return None
+
+    def run(self, interval=30):
+        while True:
+            # A locked DB or a full disk must not end the scheduler: log, retry next interval
+            try:
+                _heartbeat(interval)
+                if not self.loaded:
+                    self.load()
+                self.tick()
+            except Exception as e:
+                print(f"{datetime.now():%Y-%m-%d %H:%M:%S} expiry scheduler: {type(e).__name__}: {e}")
+                traceback.print_exc()
+                self.digest_stale = True
+            time.sleep(interval)
+
+def write_outbox(digest_date, counts, entries):
+    # Mailbox stub: one plain-text message per daily digest (one folder per household DB)
+    outbox = OUTBOX_DIR
+    if db.TENANCY != 'single':
+        outbox = os.path.join(OUTBOX_DIR, os.path.splitext(os.path.basename(db.current_db_path()))[0])
+    os.makedirs(outbox, exist_ok=True)
+    lines = [f"[MyCatalog] {digest_date} 유통기한 알림",
+             " / ".join(f"{label}: {counts[key]}건" for key, label, _ in BUCKETS), ""]
+    for key, label, _ in BUCKETS:
+        bucket_entries = [e for e in entries if e['bucket'] == key]
+        if bucket_entries:
+            lines.append(f"## {label}")
+            lines.extend(f"- {e['name']} ({e['category']}) {e['expiry_date']}" for e in bucket_entries)
+            lines.append("")
+    path = os.path.join(outbox, f"expiry_digest_{digest_date.replace('-', '')}.txt")
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("\n".join(lines))
+    return path
+
+def run_once():
+    # One-shot pass used by the app when no scheduler process keeps the digest current.
+    # It claims expiry_dirty unless a scheduler is running: that scheduler's heap still
+    # needs the changes, while one started later loads every item anyway.
+    scheduler = ExpiryScheduler()
+    scheduler.load(claim_dirty=not scheduler_running())
+    scheduler.write_digest(date.today().toordinal(), send=False)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="MyCatalog expiry scheduler")
+    parser.add_argument('--once', action='store_true', help="write today's digest and exit")
+    parser.add_argument('--interval', type=float, default=30, help="poll interval in seconds")
+    parser.add_argument('--db', help="database file (default: mycatalog.db)")
+    args = parser.parse_args()
+    if args.db:
+        db.set_current_db(args.db)
+    db.ensure_db()
+    if args.once:
+        scheduler = ExpiryScheduler()
+        scheduler.load()
+        scheduler.write_digest(date.today().toordinal())
+        print(f"{datetime.now():%Y-%m-%d %H:%M:%S} digest written.")
+    else:
+        print(f"Expiry scheduler started (interval {args.interval}s).")
+        ExpiryScheduler().run(args.interval)
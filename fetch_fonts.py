@@ -0,0 +1,43 @@
+"""
+Downloads the Inter / Outfit fonts referenced by static/fonts/fonts.css into
+static/fonts, so the app never calls Google Fonts at runtime (styles.py
+imports Google Fonts while any file is missing). Run once on a machine with
+internet access, then ship static/ with the app (offline / air-gapped installs).
+
+    python fetch_fonts.py
+"""
+import os
+import re
+import urllib.request
+
+FONTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "fonts")
+CSS_URL = "https://fonts.googleapis.com/css2?family=Inter:wght@400;600;700&family=Outfit:wght@400;700&display=swap"
+# Google Fonts only returns woff2 sources to modern browsers
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36"
+
+FACE_RE = re.compile(
+    r"/\* latin \*/\s*@font-face\s*{[^}]*?font-family:\s*'([^']+)';[^}]*?font-weight:\s*(\d+);[^}]*?src:\s*url\(([^)]+)\)",
+    re.S,
+)
+
+def fetch(url):
+    request = urllib.request.Request(url, headers={"User-Agent": USER_AGENT})
+    with urllib.request.urlopen(request, timeout=30) as response:
+        return response.read()
+
+def main():
+    os.makedirs(FONTS_DIR, exist_ok=True)
+    css = fetch(CSS_URL).decode("utf-8")
+    faces = FACE_RE.findall(css)
+    if not faces:
+        raise SystemExit("No latin @font-face rules found in the Google Fonts response.")
+    for family, weight, url in faces:
+        # Matches the file names referenced by static/fonts/fonts.css
+        path = os.path.join(FONTS_DIR, f"{family.lower()}-latin-{weight}.woff2")
+        data = fetch(url)
+        with open(path, "wb") as f:
+            f.write(data)
+        print(f"{path} ({len(data):,} bytes)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+Consumption forecast from the quantity_events history.
+Per item: an exponentially weighted consumption rate (recent use counts most)
+and the projected run-out date at that rate. The per-item state is built once
+per database with NumPy over the whole event log, then kept current by adding
+only the events logged since, so pages never wait for a full pass.
+
+    python forecast.py [--days N] [--db PATH]
+"""
+import time
+import argparse
+import itertools
+import threading
+from datetime import date
+import numpy as np
+import database as db
+from models import RunOut
+
+TAU_DAYS = 30.0           # consumption weight falls by e every 30 days
+MIN_AGE_DAYS = 7.0        # a single use right after purchase is not a daily rate
+BUILD_WAIT_SECONDS = 0.3  # how long a page waits for a first build before showing nothing
+UNIX_EPOCH_JULIAN = 2440587.5
+
+_models = {}  # db path -> Model
+_lock = threading.Lock()
+_building = set()
+
+def now_julian():
+    return time.time() / 86400 + UNIX_EPOCH_JULIAN
+
+def julian_to_date(day):
+    return date.fromordinal(int(day - 0.5) - db.JULIAN_DAY_OFFSET)
+
+class Model:
+    """Per-item consumption state of one database, in id-sorted arrays."""
+    def __init__(self, anchor):
+        self.anchor = anchor  # julian day the weights are relative to
+        self.ids = np.empty(0, np.int64)
+        self.weighted = np.empty(0)   # sum of consumed * exp((day - anchor) / tau)
+        self.first = np.empty(0)      # first event day
+        self.quantity = np.empty(0)   # quantity after the latest event
+        self.last_event_id = 0
+        self.event_count = 0
+
+    def _positions(self, item_ids):
+        # Positions of the (sorted, unique) ids, appending unseen items
+        new = np.setdiff1d(item_ids, self.ids, assume_unique=True)
+        if len(new):
+            at = np.searchsorted(self.ids, new)
+            self.ids = np.insert(self.ids, at, new)
+            self.weighted = np.insert(self.weighted, at, 0.0)
+            self.first = np.insert(self.first, at, np.inf)
+            self.quantity = np.insert(self.quantity, at, 0.0)
+        return np.searchsorted(self.ids, item_ids)
+
+    def add(self, events):
+        """events: rows of (id, item_id, event_day, delta, quantity) in id order."""
+        if not len(events):
+            return
+        item_ids, row_item = np.unique(events[:, 1].astype(np.int64), return_inverse=True)
+        pos = self._positions(item_ids)
+        day, delta = events[:, 2], events[:, 3]
+        used = delta < 0
+        # Anchored weights make the update a plain sum, whatever the event order
+        np.add.at(self.weighted, pos[row_item[used]], -delta[used] * np.exp((day[used] - self.anchor) / TAU_DAYS))
+        np.minimum.at(self.first, pos[row_item], day)
+        # Latest quantity per item: its last row in id order
+        last_row = np.full(len(item_ids), -1)
+        np.maximum.at(last_row, row_item, np.arange(len(events)))
+        self.quantity[pos] = events[last_row, 4]
+        self.last_event_id = int(events[-1, 0])
+        self.event_count += len(events)
+
+    def forecast(self, now):
+        """
+        (item ids, quantities, daily rates, run-out julian days); no consumption
+        -> inf. Call under _lock: add() updates the arrays in place. The results
+        are copies, safe to use after the lock is released.
+        """
+        age = np.maximum(now - self.first, MIN_AGE_DAYS)
+        # Weighted uses over the weighted length of the item's history
+        weight_span = TAU_DAYS * -np.expm1(-age / TAU_DAYS)
+        rate = self.weighted * np.exp((self.anchor - now) / TAU_DAYS) / weight_span
+        with np.errstate(divide='ignore'):
+            run_out = np.where(rate > 0, now + self.quantity / np.where(rate > 0, rate, 1.0), np.inf)
+        return self.ids.copy(), self.quantity.copy(), rate, run_out
+
+def _fetch_events(cursor, after_id):
+    cursor.execute('''
+    SELECT id, item_id, event_day, delta, quantity FROM quantity_events
+    WHERE id > ? ORDER BY id
+    ''', (after_id,))
+    return np.fromiter(itertools.chain.from_iterable(cursor), dtype=np.float64).reshape(-1, 5)
+
+def build():
+    """Full pass over the event log of the current database."""
+    model = Model(now_julian())
+    conn = db.get_read_connection()
+    model.add(_fetch_events(conn.cursor(), 0))
+    conn.close()
+    return model
+
+def _build_in_background(path):
+    def run():
+        try:
+            with db.using_db(path):
+                model = build()
+            with _lock:
+                _models[path] = model
+        finally:
+            _building.discard(path)
+    with _lock:
+        if path in _building:
+            return
+        _building.add(path)
+    threading.Thread(target=run, daemon=True, name=f"forecast-build-{path}").start()
+
+def current_model(wait=BUILD_WAIT_SECONDS):
+    """
+    The current database's model with every logged event applied. Returns None
+    when there is no model yet and the first build takes longer than `wait`.
+    """
+    path = db.current_db_path()
+    with _lock:
+        model = _models.get(path)
+        if model is not None:
+            conn = db.get_read_connection()
+            cursor = conn.cursor()
+            cursor.execute('BEGIN')
+            cursor.execute('SELECT COUNT(*) FROM quantity_events WHERE id <= ?', (model.last_event_id,))
+            if cursor.fetchone()[0] == model.event_count:
+                model.add(_fetch_events(cursor, model.last_event_id))
+                conn.rollback()
+                conn.close()
+                return model
+            conn.rollback()
+            conn.close()
+            # Items were deleted (or imported): rebuild, keep serving the old state meanwhile
+    _build_in_background(path)
+    if model is None:
+        deadline = time.monotonic() + wait
+        while path in _building and time.monotonic() < deadline:
+            time.sleep(0.01)
+        model = _models.get(path)
+    return model
+
+def run_out_soon(days=14, limit=20, wait=BUILD_WAIT_SECONDS):
+    """
+    Items projected to run out within `days` (or already out), soonest first.
+    None while the first forecast for this database is still being built.
+    """
+    model = current_model(wait)
+    if model is None:
+        return None
+    now = now_julian()
+    with _lock:
+        ids, quantity, rate, run_out = model.forecast(now)
+    soon = np.flatnonzero(run_out <= now + days)
+    soon = soon[np.argsort(run_out[soon], kind='stable')]
+    conn = db.get_read_connection()
+    cursor = conn.cursor()
+    result = []
+    # Deleted items may linger until the rebuild; skip them
+    for start in range(0, len(soon), limit):
+        chunk = soon[start:start + limit]
+        chosen = [int(i) for i in ids[chunk]]
+        cursor.execute(f"SELECT id, name, location_id FROM items WHERE id IN ({','.join('?' * len(chosen))})", chosen)
+        names = {row[0]: row[1:] for row in cursor.fetchall()}
+        for i in chunk:
+            if int(ids[i]) in names and len(result) < limit:
+                name, location_id = names[int(ids[i])]
+                result.append(RunOut(int(ids[i]), name, location_id, float(quantity[i]), float(rate[i]),
+                                     max(float(run_out[i] - now), 0.0), julian_to_date(run_out[i]).isoformat()))
+        if len(result) >= limit:
+            break
+    conn.close()
+    return result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Projected run-out dates from consumption history")
+    parser.add_argument('--days', type=int, default=14, help="horizon in days (default 14)")
+    parser.add_argument('--db', help="database file (default: mycatalog.db)")
+    args = parser.parse_args()
+    if args.db:
+        db.set_current_db(args.db)
+    db.ensure_db()
+    start = time.perf_counter()
+    rows = run_out_soon(args.days, limit=100, wait=float('inf'))
+    print(f"{len(rows)} items run out within {args.days} days (computed in {time.perf_counter() - start:.2f}s)")
+    for r in rows:
+        print(f"  {r.run_out_date}  {r.name}  {r.quantity:g} left, {r.daily_rate * 7:.2f}/week")
@@ -0,0 +1,87 @@
+"""
+Perceptual hashes for receipt images.
+dHash compares the brightness of neighbouring pixels on a 9x8 grayscale
+thumbnail, so re-shots of the same receipt (different exposure, JPEG quality,
+slight crop) land a few bits apart while different receipts differ in ~32.
+Hashes are indexed in the `image_hashes` table (database.find_similar_receipts).
+
+Backfill hashes for images already in uploads/ and list near-duplicate receipts:
+
+    python image_hash.py [--uploads DIR] [--db PATH] [--distance BITS]
+"""
+import os
+import time
+import argparse
+import database as db
+
+HASH_SIZE = 8
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+BATCH_SIZE = 500
+
+def dhash(image_file):
+    """64-bit difference hash of an image path or file-like object."""
+    from PIL import Image
+    with Image.open(image_file) as img:
+        # Let the JPEG decoder downscale while decoding (phone photos are ~12MP)
+        img.draft('L', (HASH_SIZE * 8, HASH_SIZE * 8))
+        small = img.convert('L').resize((HASH_SIZE + 1, HASH_SIZE), Image.BILINEAR)
+    pixels = small.tobytes()
+    h = 0
+    for row in range(HASH_SIZE):
+        offset = row * (HASH_SIZE + 1)
+        for col in range(HASH_SIZE):
+            h = (h << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return h
+
+def find_duplicates(image_file, max_distance=6):
+    """Hash of the image and the registered receipts it nearly duplicates."""
+    h = dhash(image_file)
+    return h, db.find_similar_receipts(h, max_distance)
+
+def backfill(upload_dir='uploads'):
+    """Hashes every image under upload_dir. Returns {path: hash}."""
+    hashes = {}
+    batch = []
+    for name in sorted(os.listdir(upload_dir)):
+        if not name.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        path = os.path.join(upload_dir, name)
+        try:
+            h = dhash(path)
+        except OSError as e:
+            print(f"skip {path}: {e}")
+            continue
+        hashes[path] = h
+        batch.append((path, h))
+        if len(batch) >= BATCH_SIZE:
+            db.save_image_hashes(batch)
+            batch = []
+    if batch:
+        db.save_image_hashes(batch)
+    return hashes
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill receipt image hashes")
+    parser.add_argument('--uploads', default='uploads', help="image directory (default: uploads)")
+    parser.add_argument('--db', help="database file (default: mycatalog.db)")
+    parser.add_argument('--distance', type=int, default=6, help="near-duplicate threshold in bits")
+    args = parser.parse_args()
+    if args.db:
+        db.set_current_db(args.db)
+    db.ensure_db()
+    start = time.perf_counter()
+    hashes = backfill(args.uploads)
+    print(f"Hashed {len(hashes)} images in {time.perf_counter() - start:.1f}s.")
+
+    receipt_by_path = {r.image_path: r for r in db.get_receipts() if r.image_path}
+    reported = set()
+    for path, h in hashes.items():
+        receipt = receipt_by_path.get(path)
+        if receipt is None:
+            continue
+        for distance, other in db.find_similar_receipts(h, args.distance):
+            pair = tuple(sorted((receipt.id, other.id)))
+            if other.id != receipt.id and pair not in reported:
+                reported.add(pair)
+                print(f"Near-duplicate ({distance} bits): receipt #{pair[0]} and #{pair[1]}")
+    print(f"{len(reported)} near-duplicate receipt pairs.")
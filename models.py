@@ -0,0 +1,144 @@
+from typing import NamedTuple, Optional
+
+# Row models returned by database.py. NamedTuples have no per-row __dict__ and
+# still unpack / index like the plain tuples they replace.
+
+class Location(NamedTuple):
+    id: int
+    name: str
+    category: str
+    parent_id: Optional[int]
+    is_food: int
+
+class Item(NamedTuple):
+    id: int
+    name: str
+    purchase_date: Optional[str]
+    expiry_date: Optional[str]
+    quantity: float
+    notes: Optional[str]
+    location_id: Optional[int]
+    version: int
+
+class Receipt(NamedTuple):
+    id: int
+    category_id: Optional[int]
+    store_name: str
+    store_address: Optional[str]
+    card_type: Optional[str]
+    card_number: Optional[str]
+    use_date: Optional[str]
+    sales_amount: float
+    vat: float
+    total_amount: float
+    notes: Optional[str]
+    image_path: Optional[str]
+    version: int
+
+class SubtreeStats(NamedTuple):
+    location_id: int
+    item_count: int
+    total_quantity: float
+    expired: int
+    expiring_7d: int
+    next_expiry: Optional[str]
+
+class ExpiryDigest(NamedTuple):
+    digest_date: str
+    created_at: str
+    expired: int
+    d0: int
+    d3: int
+    d30: int
+    payload: Optional[str]  # JSON list of {id, name, expiry_date, days_left, category, bucket}
+
+class ChangeSet(NamedTuple):
+    since: int            # the caller's last seen seq
+    seq: int              # resume point for the next call
+    full_resync: bool     # since is older than the compacted history
+    upserts: dict         # table -> [row model, ...] (current rows)
+    deletes: dict         # table -> [id, ...]
+
+class User(NamedTuple):
+    id: int
+    username: str
+    household: Optional[str]
+
+class RunOut(NamedTuple):
+    item_id: int
+    name: str
+    location_id: Optional[int]
+    quantity: float
+    daily_rate: float     # units consumed per day over the lookback window
+    days_left: float
+    run_out_date: str
+
+class OcrJob(NamedTuple):
+    id: int
+    image_path: str
+    status: str           # queued / running / done / failed
+    attempts: int
+    worker: Optional[str]
+    result: Optional[str] # JSON {"text": ..., "info": {...}}
+    error: Optional[str]
+    created_at: str
+    finished_at: Optional[str]
+    receipt_id: Optional[int]
+
+class ReceiptLine(NamedTuple):
+    id: int
+    receipt_id: int
+    line_no: int
+    name: str
+    name_key: str
+    quantity: float
+    unit_price: float
+    amount: float
+    status: str           # pending / created / skipped
+    item_id: Optional[int]
+
+class OcrDay(NamedTuple):
+    day: str
+    calls: int
+    failures: int
+    fallbacks: int
+    prompt_tokens: int
+    response_tokens: int
+    image_bytes: int
+    cost: float
+    p50: float            # latency seconds
+    p95: float
+
+class SpendingTotal(NamedTuple):
+    period: Optional[str]  # YYYY-MM-DD (day) or YYYY-MM; None in totals over a range
+    key: str               # category id, store or card name; '' for day / month
+    receipts: int
+    total: float
+
+class DbHealth(NamedTuple):
+    page_size: int
+    page_count: int
+    freelist_count: int
+    auto_vacuum: str      # none / full / incremental
+    wal_bytes: int
+    rows: int             # locations + items + receipts
+    churn: int            # change log entries since the last ANALYZE
+    has_stats: bool       # sqlite_stat1 exists
+
+class StorageObject(NamedTuple):
+    name: str
+    type: str             # table / index
+    table_name: str
+    pages: int
+    size_bytes: int
+    unused_bytes: int     # free space inside its pages
+
+def columns(model, table=None):
+    # Explicit select list so rows keep the model's field order regardless of
+    # the physical column order migrations left behind
+    prefix = f"{table}." if table else ""
+    return ", ".join(prefix + f for f in model._fields)
+
+def row_factory(model):
+    make = model._make
+    return lambda cursor, row: make(row)
@@ -0,0 +1,342 @@
+"""
+MyCatalog management CLI.
+One entry point for the operational tasks, against any database file. Every
+command runs its writes as batched jobs on the writer thread, streams rows
+for CSV / JSON Lines, and reports how long it took.
+
+    python mycatalog.py [--db PATH] init                # create / migrate the schema
+    python mycatalog.py [--db PATH] seed [--items N] [--receipts N] [--seed S]
+    python mycatalog.py [--db PATH] reset [--yes]
+    python mycatalog.py [--db PATH] export [--format xlsx|csv|jsonl] [--out DIR]
+    python mycatalog.py [--db PATH] import FILE [--table locations|items|receipts]
+    python mycatalog.py [--db PATH] reindex
+    python mycatalog.py [--db PATH] vacuum
+    python mycatalog.py [--db PATH] backup DEST
+    python mycatalog.py [--db PATH] ocr-backfill [--limit N]
+
+seed without --items / --receipts adds the four sample items. reset without
+--yes only prints what would be deleted. Exports write mycatalog_<table>.<ext>
+(the names the app's data page uses); imports replace the whole table and take
+the format from the file extension.
+"""
+import os
+import csv
+import json
+import time
+import random
+import sqlite3
+import argparse
+from datetime import date, datetime, timedelta
+import database as db
+import db_maintenance
+import receipt_items
+
+EXPORT_TABLES = ('locations', 'items', 'receipts')
+FORMATS = ('xlsx', 'csv', 'jsonl')
+BACKUP_PAGES = 1024  # pages copied per backup step; the writer can commit in between
+OCR_BATCH = 20       # receipts updated per writer job during an OCR backfill
+
+ITEM_NAMES = ["우유", "계란", "두부", "김치", "쌀", "라면", "생수", "휴지", "세제", "샴푸", "치약", "냉동 만두", "사과", "커피"]
+STORES = ["이마트 성수점", "GS25 역삼점", "스타벅스 강남R점", "쿠팡", "다이소 건대점", "올리브영 강남점"]
+CARDS = ["신한카드", "현대카드", "KB국민카드", "삼성카드"]
+DEFAULT_LOCATIONS = [("냉장고", "냉장실", 1), ("냉동고", "냉동실", 1), ("팬트리", "팬트리", 1), ("욕실 수납장", "욕실", 0)]
+
+def table_source(conn, table):
+    # Receipts include the archived years, so an export stays a complete backup
+    if table == 'receipts':
+        return db.attach_receipt_archives(conn, db.archived_receipt_years())
+    return table
+
+@db.writes
+def insert_rows(cursor, sql, rows):
+    # One writer job, one transaction, however many rows the generator yields
+    cursor.executemany(sql, rows)
+    return cursor.rowcount
+
+def locations_for_seed():
+    locations = db.get_locations()
+    if not locations:
+        insert_rows('INSERT INTO locations (name, category, is_food) VALUES (?, ?, ?)', DEFAULT_LOCATIONS)
+        db.writes(db.rebuild_location_closure)()
+        locations = db.get_locations()
+    return locations
+
+def seed_sample():
+    # The original seed: one expired, two imminent and one healthy item
+    loc_map = {loc.category: loc.id for loc in db.get_locations()}
+    today = datetime.now()
+    def day(offset):
+        return (today + timedelta(days=offset)).date().isoformat()
+    rows = [
+        ("우유", day(-10), day(-2), 1, "유기농 우유", loc_map.get("냉장실")),
+        ("계란", day(-5), day(1), 10, "특란", loc_map.get("냉장실")),
+        ("쌀", day(-30), day(300), 1, "햅쌀 10kg", loc_map.get("팬트리")),
+        ("냉동 피자", day(-20), day(3), 2, "콤비네이션", loc_map.get("냉동실")),
+    ]
+    return insert_rows('INSERT INTO items (name, purchase_date, expiry_date, quantity, notes, location_id) VALUES (?, ?, ?, ?, ?, ?)', rows)
+
+def seed_items(n, rng):
+    locations = [loc.id for loc in locations_for_seed()]
+    today = date.today()
+    def rows():
+        for i in range(n):
+            bought = today - timedelta(days=rng.randrange(120))
+            yield (f"{rng.choice(ITEM_NAMES)} {i}", bought.isoformat(), (bought + timedelta(days=rng.randrange(3, 400))).isoformat(),
+                   rng.randrange(1, 10), None, rng.choice(locations))
+    return insert_rows('INSERT INTO items (name, purchase_date, expiry_date, quantity, notes, location_id) VALUES (?, ?, ?, ?, ?, ?)', rows())
+
+def seed_receipts(n, rng):
+    locations = [loc.id for loc in locations_for_seed()]
+    now = datetime.now()
+    def rows():
+        for _ in range(n):
+            total = rng.randrange(10, 2000) * 100
+            used = now - timedelta(minutes=rng.randrange(365 * 24 * 60))
+            yield (rng.choice(locations), rng.choice(STORES), rng.choice(CARDS), used.strftime('%Y-%m-%d %H:%M:%S'),
+                   round(total / 1.1), total - round(total / 1.1), total)
+    return insert_rows('''
+    INSERT INTO receipts (category_id, store_name, card_type, use_date, sales_amount, vat, total_amount)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', rows())
+
+def table_counts(conn):
+    return {table: conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0] for table in EXPORT_TABLES}
+
+@db.writes
+def reset_tables(cursor):
+    # Row by row through the triggers, so the changes log records the deletes for sync
+    for table in ('receipts', 'items', 'locations', 'image_hashes', 'expiry_digests'):
+        cursor.execute(f'DELETE FROM {table}')
+    # The archive files go too (the caller removes them); their receipts are
+    # still counted in the rollups
+    cursor.execute('DELETE FROM spending_rollups')
+    # Created lines outlive their receipt as product history; not past a reset
+    cursor.execute('DELETE FROM receipt_lines')
+    # Make sure initialized is true so it doesn't re-seed
+    cursor.execute("INSERT OR REPLACE INTO settings (key, value) VALUES ('initialized', 'true')")
+
+def export_file(table, fmt, out_dir):
+    path = os.path.join(out_dir, f"mycatalog_{table}.{fmt}")
+    conn = db.get_read_connection()
+    columns = db.IMPORT_COLUMNS[table] + (('version',) if table != 'locations' else ())
+    cursor = conn.execute(f"SELECT {', '.join(columns)} FROM {table_source(conn, table)} ORDER BY id")
+    count = 0
+    if fmt == 'xlsx':
+        from openpyxl import Workbook
+        # Write-only mode streams rows to the file instead of building the sheet in memory
+        book = Workbook(write_only=True)
+        sheet = book.create_sheet(table)
+        sheet.append(columns)
+        for row in cursor:
+            sheet.append(row)
+            count += 1
+        book.save(path)
+    else:
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f) if fmt == 'csv' else None
+            if writer:
+                writer.writerow(columns)
+            for row in cursor:
+                if writer:
+                    writer.writerow(row)
+                else:
+                    f.write(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + '\n')
+                count += 1
+    conn.close()
+    return path, count
+
+def read_records(path):
+    """Dict records from the first sheet of an .xlsx, or a .csv / .jsonl file, streamed."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.xlsx':
+        from openpyxl import load_workbook
+        book = load_workbook(path, read_only=True)
+        rows = book.worksheets[0].iter_rows(values_only=True)
+        columns = next(rows, ())
+        for row in rows:
+            yield dict(zip(columns, row))
+        book.close()
+    elif ext == '.csv':
+        with open(path, encoding='utf-8-sig', newline='') as f:
+            yield from csv.DictReader(f)
+    elif ext in ('.jsonl', '.json'):
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        raise SystemExit(f"Unknown file format: {path} (use .xlsx, .csv or .jsonl)")
+
+def guess_table(path):
+    name = os.path.basename(path).lower()
+    matches = [table for table in EXPORT_TABLES if table in name]
+    if len(matches) != 1:
+        raise SystemExit(f"Cannot tell the table from {name!r}; pass --table")
+    return matches[0]
+
+@db.writes
+def reindex(cursor):
+    cursor.execute('REINDEX')
+    db.rebuild_location_closure(cursor)
+    db.rebuild_name_counts(cursor)
+    cursor.execute('ANALYZE')
+
+def backup(source, dest):
+    # Online backup: a consistent snapshot while the app keeps writing
+    src = sqlite3.connect(f"file:{source}?mode=ro", uri=True, timeout=30)
+    dst = sqlite3.connect(dest)
+    src.backup(dst, pages=BACKUP_PAGES)
+    dst.close()
+    src.close()
+
+def receipts_without_ocr(limit):
+    conn = db.get_read_connection()
+    rows = conn.execute('''
+    SELECT id, image_path FROM receipts
+    WHERE image_path IS NOT NULL AND image_path != '' AND (notes IS NULL OR notes = '')
+    ORDER BY id LIMIT ?
+    ''', (limit if limit else -1,)).fetchall()
+    conn.close()
+    return rows
+
+@db.writes
+def save_ocr_results(cursor, results):
+    # Fills only what is still empty; values typed in the app win
+    for receipt_id, text, info in results:
+        cursor.execute('''
+        UPDATE receipts SET
+            notes = ?,
+            store_address = COALESCE(NULLIF(store_address, ''), ?, store_address),
+            card_type = COALESCE(NULLIF(card_type, ''), ?, card_type),
+            card_number = COALESCE(NULLIF(card_number, ''), ?, card_number),
+            sales_amount = COALESCE(NULLIF(sales_amount, 0), ?, sales_amount),
+            vat = COALESCE(NULLIF(vat, 0), ?, vat),
+            total_amount = COALESCE(NULLIF(total_amount, 0), ?, total_amount),
+            version = version + 1
+        WHERE id = ?
+        ''', (text, info.get('store_address'), info.get('card_type'), info.get('card_number'),
+              info.get('sales_amount'), info.get('vat'), info.get('total_amount'), receipt_id))
+        # Line items for the review grid, unless the receipt already has some
+        cursor.execute('SELECT 1 FROM receipt_lines WHERE receipt_id = ? LIMIT 1', (receipt_id,))
+        if cursor.fetchone() is None:
+            cursor.executemany('''
+            INSERT INTO receipt_lines (receipt_id, line_no, name, name_key, quantity, unit_price, amount)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', [(receipt_id,) + row for row in receipt_items.line_rows(info.get('lines'))])
+
+def ocr_backfill(limit):
+    import ocr_metrics
+    done = failed = 0
+    pending = []
+    for receipt_id, image_path in receipts_without_ocr(limit):
+        message = ocr_metrics.over_budget()
+        if message:
+            print(f"  {message}")
+            break
+        if not os.path.exists(image_path):
+            print(f"  #{receipt_id}: {image_path} not found")
+            failed += 1
+            continue
+        text, info = ocr_metrics.extract_receipt_info(image_path)
+        if not info:  # missing package / API key / API error: the text says which
+            print(f"  #{receipt_id}: {text}")
+            failed += 1
+            continue
+        pending.append((receipt_id, text, info))
+        if len(pending) >= OCR_BATCH:
+            save_ocr_results(pending)
+            done += len(pending)
+            pending = []
+    if pending:
+        save_ocr_results(pending)
+        done += len(pending)
+    return done, failed
+
+def size_mb(path):
+    return os.path.getsize(path) / 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description="MyCatalog management")
+    parser.add_argument('--db', help="database file (default: mycatalog.db)")
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('init', aliases=['migrate'], help="create the schema and run pending migrations")
+    seed = sub.add_parser('seed', help="add sample or generated data")
+    seed.add_argument('--items', type=int, default=0, help="generated items to add")
+    seed.add_argument('--receipts', type=int, default=0, help="generated receipts to add")
+    seed.add_argument('--seed', type=int, default=None, help="random seed")
+    reset = sub.add_parser('reset', help="delete all items, receipts and categories (users and settings stay)")
+    reset.add_argument('--yes', action='store_true', help="really delete (default: show what would go)")
+    export = sub.add_parser('export', help="write every table to files")
+    export.add_argument('--format', choices=FORMATS, default='xlsx')
+    export.add_argument('--out', default='.', help="output directory (default: current)")
+    imp = sub.add_parser('import', help="replace a table with the rows of a file")
+    imp.add_argument('file')
+    imp.add_argument('--table', choices=EXPORT_TABLES, help="default: from the file name")
+    sub.add_parser('reindex', help="rebuild indexes, location paths, name counts and spending rollups, refresh statistics")
+    sub.add_parser('vacuum', help="compact the database file")
+    bak = sub.add_parser('backup', help="online copy of the database (and its receipt archives)")
+    bak.add_argument('dest')
+    ocr = sub.add_parser('ocr-backfill', help="run OCR for receipts that have an image but no OCR text")
+    ocr.add_argument('--limit', type=int, default=0, help="at most N receipts (default: all)")
+    args = parser.parse_args()
+
+    if args.db:
+        db.set_current_db(args.db)
+    path = db.current_db_path()
+    start = time.perf_counter()
+    db.ensure_db()
+
+    if args.command in ('init', 'migrate'):
+        conn = db.get_read_connection()
+        counts = table_counts(conn)
+        conn.close()
+        summary = f"{path} ready: " + ", ".join(f"{n} {table}" for table, n in counts.items())
+    elif args.command == 'seed':
+        rng = random.Random(args.seed)
+        if not args.items and not args.receipts:
+            summary = f"{seed_sample()} sample items added"
+        else:
+            summary = f"{seed_items(args.items, rng)} items, {seed_receipts(args.receipts, rng)} receipts added"
+    elif args.command == 'reset':
+        conn = db.get_read_connection()
+        counts = table_counts(conn)
+        conn.close()
+        archives = [db.receipt_archive_path(year) for year in db.archived_receipt_years()]
+        listing = ", ".join(f"{n} {table}" for table, n in counts.items()) + f", {len(archives)} receipt archive files"
+        if not args.yes:
+            print(f"Would delete {listing} from {path}. Run again with --yes.")
+            return
+        reset_tables()
+        for archive in archives:
+            os.remove(archive)
+        summary = f"Deleted {listing}"
+    elif args.command == 'export':
+        os.makedirs(args.out, exist_ok=True)
+        for table in EXPORT_TABLES:
+            file, count = export_file(table, args.format, args.out)
+            print(f"  {table}: {count} rows -> {file}")
+        summary = f"Exported {len(EXPORT_TABLES)} tables as {args.format}"
+    elif args.command == 'import':
+        table = args.table or guess_table(args.file)
+        summary = f"{table} replaced with {db.import_records(table, read_records(args.file))} rows from {args.file}"
+    elif args.command == 'reindex':
+        reindex()
+        # Attaches the receipt archives, so not part of the writer job
+        rollups = db.rebuild_spending_rollups()
+        summary = f"Reindexed ({rollups} spending rollup rows)"
+    elif args.command == 'vacuum':
+        before = size_mb(path)
+        db_maintenance.run(['vacuum', 'checkpoint'])
+        summary = f"{path}: {before:.1f}MB -> {size_mb(path):.1f}MB"
+    elif args.command == 'backup':
+        backup(path, args.dest)
+        for year in db.archived_receipt_years():
+            backup(db.receipt_archive_path(year), db.receipt_archive_path(year, args.dest))
+        summary = f"Backed up {path} -> {args.dest} ({size_mb(args.dest):.1f}MB)"
+    else:
+        done, failed = ocr_backfill(args.limit)
+        summary = f"OCR filled {done} receipts, {failed} failed"
+    print(f"{summary} in {time.perf_counter() - start:.2f}s.")
+
+if __name__ == "__main__":
+    main()
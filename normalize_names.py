@@ -0,0 +1,87 @@
+"""
+Merges variant spellings of item names, store names and card types.
+Names that only differ in case, spacing, punctuation or corporate markers
+((주), ㈜, 주식회사) are rewritten to their most used spelling, so receipts
+group by store under one name. Near matches (trigram similarity) that are not
+merged automatically are listed for review.
+
+    python normalize_names.py [--apply] [--kind item|store|card] [--db PATH]
+
+Without --apply only the planned merges are printed.
+"""
+import re
+import argparse
+import unicodedata
+import database as db
+
+CORPORATE_MARKERS = re.compile(r'\(주\)|㈜|주식회사|\(유\)|유한회사')
+NON_WORD = re.compile(r'[\W_]+')
+SIMILARITY = 0.5  # trigram Jaccard threshold for review suggestions
+
+def name_key(value):
+    text = unicodedata.normalize('NFKC', value).casefold()
+    text = CORPORATE_MARKERS.sub('', text)
+    return NON_WORD.sub('', text)
+
+def plan_merges(kind):
+    """Returns ({variant: canonical}, groups_before, groups_after) for one kind."""
+    groups = {}
+    for value, uses in db.get_name_counts(kind):
+        key = name_key(value)
+        if key:
+            # Rows arrive most used first, so the first spelling of a key wins
+            groups.setdefault(key, []).append(value)
+    mapping = {}
+    for values in groups.values():
+        for variant in values[1:]:
+            mapping[variant] = values[0]
+    return mapping, len(groups) + len(mapping), len(groups)
+
+def trigrams(value):
+    text = name_key(value)
+    return {text[i:i + 3] for i in range(max(len(text) - 2, 1))}
+
+def search_grams(value):
+    words = NON_WORD.split(unicodedata.normalize('NFKC', value))
+    return {w[i:i + 3] for w in words for i in range(len(w) - 2)}
+
+def similar_pairs(kind, mapping):
+    """Pairs of distinct (post-merge) names whose trigram sets overlap enough."""
+    names = [value for value, _ in db.get_name_counts(kind) if value not in mapping]
+    pairs = []
+    seen = set()
+    for value in names:
+        grams = trigrams(value)
+        # The trigram index narrows the candidates to names sharing a substring
+        # (looked up per word, since the stored names keep their spacing)
+        for gram in search_grams(value):
+            for other in db.suggest_names(kind, gram, limit=50):
+                pair = frozenset((value, other))
+                if other == value or other in mapping or pair in seen:
+                    continue
+                seen.add(pair)
+                other_grams = trigrams(other)
+                score = len(grams & other_grams) / len(grams | other_grams)
+                if score >= SIMILARITY:
+                    pairs.append((score, value, other))
+    pairs.sort(reverse=True)
+    return pairs
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge variant spellings of names")
+    parser.add_argument('--apply', action='store_true', help="rewrite the rows (default: dry run)")
+    parser.add_argument('--kind', choices=sorted(db.NAME_KINDS), help="only this kind of name")
+    parser.add_argument('--db', help="database file (default: mycatalog.db)")
+    args = parser.parse_args()
+    if args.db:
+        db.set_current_db(args.db)
+    db.ensure_db()
+    for kind in [args.kind] if args.kind else db.NAME_KINDS:
+        mapping, before, after = plan_merges(kind)
+        print(f"[{kind}] {before} distinct names -> {after}")
+        for variant, canonical in sorted(mapping.items(), key=lambda m: m[1]):
+            print(f"  {variant!r} -> {canonical!r}")
+        if args.apply and mapping:
+            print(f"  {db.rename_names(kind, mapping)} rows updated.")
+        for score, a, b in similar_pairs(kind, mapping)[:20]:
+            print(f"  review ({score:.2f}): {a!r} ~ {b!r}")
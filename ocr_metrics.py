@@ -0,0 +1,156 @@
+"""
+OCR cost and latency metering.
+Every OCR call made through metered_extract() lands in the ocr_calls table
+with the model that answered, image bytes sent, prompt / response tokens,
+latency, whether fields came back and whether the fallback model was used.
+Daily budgets (calls, tokens, USD) live in settings; metered_extract refuses
+calls once today's usage reaches one, and the worker stops claiming jobs, so
+queued receipts simply wait for the next day.
+
+    python ocr_metrics.py [--days N] [--db PATH]
+"""
+import time
+import argparse
+import statistics
+from datetime import date, timedelta
+import database as db
+import ocr_helper
+from models import OcrDay
+
+# USD per million tokens; Gemini Flash list prices until set on the OCR 사용량 page
+PRICE_SETTINGS = [('ocr_price_input', 0.30), ('ocr_price_output', 2.50)]
+# (settings key, usage key, label); empty or 0 means no limit
+BUDGETS = [
+    ('ocr_budget_calls', 'calls', '호출 수'),
+    ('ocr_budget_tokens', 'tokens', '토큰'),
+    ('ocr_budget_cost', 'cost', '비용 (USD)'),
+]
+LATENCY_BINS = [0.5, 1, 2, 3, 5, 8, 13, 20, 30]  # histogram edges in seconds
+
+def prices():
+    return tuple(float(db.get_setting(key, default)) for key, default in PRICE_SETTINGS)
+
+def budgets():
+    """{usage key: limit} for the budgets that are set."""
+    limits = {}
+    for key, usage_key, _ in BUDGETS:
+        value = float(db.get_setting(key, 0) or 0)
+        if value > 0:
+            limits[usage_key] = value
+    return limits
+
+def cost(prompt_tokens, response_tokens, price=None):
+    price_in, price_out = price or prices()
+    return (prompt_tokens * price_in + response_tokens * price_out) / 1e6
+
+@db.writes
+def record_call(cursor, result, backend, job_id=None, price=None):
+    if price is None:
+        # The writer thread is not routed to the caller's DB; read through its cursor
+        cursor.execute(f"SELECT key, value FROM settings WHERE key IN ({','.join('?' * len(PRICE_SETTINGS))})",
+                       [key for key, _ in PRICE_SETTINGS])
+        stored = dict(cursor.fetchall())
+        price = tuple(float(stored.get(key, default)) for key, default in PRICE_SETTINGS)
+    meta = result.meta or {}
+    prompt_tokens, response_tokens = meta.get('prompt_tokens', 0), meta.get('response_tokens', 0)
+    cursor.execute('''
+    INSERT INTO ocr_calls (backend, model, job_id, image_bytes, prompt_tokens, response_tokens, cost, latency, success, fallback, error)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (backend, meta.get('model'), job_id, meta.get('image_bytes', 0), prompt_tokens, response_tokens,
+          cost(prompt_tokens, response_tokens, price), result.timings.get('total', 0.0),
+          int(bool(result.info)), int(bool(meta.get('fallback'))), result.error))
+
+def usage_today():
+    conn = db.get_read_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+    SELECT COUNT(*), COALESCE(SUM(prompt_tokens + response_tokens), 0), COALESCE(SUM(cost), 0)
+    FROM ocr_calls WHERE called_at >= ?
+    ''', (date.today().isoformat(),))
+    calls, tokens, spent = cursor.fetchone()
+    conn.close()
+    return {'calls': calls, 'tokens': tokens, 'cost': spent}
+
+def over_budget():
+    """A message naming the budget today's usage has reached, or None."""
+    limits = budgets()
+    if not limits:
+        return None
+    usage = usage_today()
+    for _, usage_key, label in BUDGETS:
+        if usage_key in limits and usage[usage_key] >= limits[usage_key]:
+            return f"오늘의 OCR {label} 한도({limits[usage_key]:g})에 도달했습니다. 내일 다시 처리됩니다."
+    return None
+
+def metered_extract(image_file, job_id=None, backend=None):
+    """The OCR path: budget check, the backend call, and its ocr_calls row."""
+    message = over_budget()
+    if message:
+        return ocr_helper.OcrResult('', {}, {}, message)
+    backend = backend or ocr_helper.get_backend()
+    result = backend.extract(image_file)
+    record_call(result, backend.name, job_id)
+    return result
+
+def extract_receipt_info(image_file, job_id=None):
+    """ocr_helper.extract_receipt_info through the meter: (text, info), (message, {}) on failure."""
+    result = metered_extract(image_file, job_id)
+    if result.error:
+        return (f"{result.error}: {result.text}" if result.text else result.error), {}
+    return result.text, result.info
+
+def daily_summary(days=30):
+    """OcrDay rows for the last `days` days with calls, newest first."""
+    since = (date.today() - timedelta(days=days - 1)).isoformat()
+    conn = db.get_read_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+    SELECT substr(called_at, 1, 10), COUNT(*), SUM(1 - success), SUM(fallback), SUM(prompt_tokens),
+           SUM(response_tokens), SUM(image_bytes), SUM(cost)
+    FROM ocr_calls WHERE called_at >= ? GROUP BY 1 ORDER BY 1 DESC
+    ''', (since,))
+    totals = cursor.fetchall()
+    latencies = {}
+    cursor.execute('SELECT substr(called_at, 1, 10), latency FROM ocr_calls WHERE called_at >= ?', (since,))
+    for day, latency in cursor:
+        latencies.setdefault(day, []).append(latency)
+    conn.close()
+    rows = []
+    for row in totals:
+        values = sorted(latencies[row[0]])
+        p50 = statistics.median(values)
+        p95 = statistics.quantiles(values, n=20)[-1] if len(values) > 1 else values[0]
+        rows.append(OcrDay(*row, p50, p95))
+    return rows
+
+def latency_histogram(days=7):
+    """[(bin label, calls)] over the last `days` days."""
+    since = (date.today() - timedelta(days=days - 1)).isoformat()
+    conn = db.get_read_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT latency FROM ocr_calls WHERE called_at >= ?', (since,))
+    counts = [0] * (len(LATENCY_BINS) + 1)
+    for (latency,) in cursor:
+        counts[next((i for i, edge in enumerate(LATENCY_BINS) if latency < edge), len(LATENCY_BINS))] += 1
+    conn.close()
+    labels = [f"< {edge:g}s" for edge in LATENCY_BINS] + [f">= {LATENCY_BINS[-1]:g}s"]
+    return list(zip(labels, counts))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="OCR usage, cost and latency per day")
+    parser.add_argument('--days', type=int, default=14)
+    parser.add_argument('--db', help="database file (default: mycatalog.db)")
+    args = parser.parse_args()
+    if args.db:
+        db.set_current_db(args.db)
+    db.ensure_db()
+    start = time.perf_counter()
+    rows = daily_summary(args.days)
+    print(f"{'day':<11} {'calls':>6} {'failed':>6} {'fallbk':>6} {'tokens in':>10} {'out':>8} {'MB sent':>8} {'USD':>8} {'p50':>6} {'p95':>6}")
+    for r in rows:
+        print(f"{r.day:<11} {r.calls:>6} {r.failures:>6} {r.fallbacks:>6} {r.prompt_tokens:>10,} {r.response_tokens:>8,} "
+              f"{r.image_bytes / 1e6:>8.2f} {r.cost:>8.4f} {r.p50:>5.1f}s {r.p95:>5.1f}s")
+    limits = budgets()
+    usage = usage_today()
+    print("today: " + ", ".join(f"{label} {usage[k]:g}" + (f"/{limits[k]:g}" if k in limits else "")
+                                for _, k, label in BUDGETS) + f" (in {time.perf_counter() - start:.2f}s)")
@@ -0,0 +1,103 @@
+"""
+OCR job worker.
+Claims jobs from the ocr_jobs table (the receipt page enqueues one per
+"이미지 분석" click), runs the configured OCR backend on the stored image
+and writes the result back for the page to pick up. A claim is a lease: the
+job of a worker that died goes back to the queue when its lease runs out, and
+failed calls are retried with a growing delay up to db.OCR_MAX_ATTEMPTS times.
+The calls wait on the network, so throughput grows with --threads and with
+more worker processes on the same DB. Calls are metered (ocr_metrics.py);
+past a daily budget the worker leaves jobs queued until the next day.
+
+    python ocr_worker.py [--threads N] [--once] [--poll SECONDS] [--db PATH]
+
+Run it from the app's directory (image paths are relative to it). In household
+tenancy run one worker per household DB (--db data/household_x.db).
+"""
+import os
+import time
+import socket
+import argparse
+import traceback
+import threading
+from datetime import datetime
+import database as db
+import ocr_metrics
+
+def run_job(job):
+    try:
+        text, info = ocr_metrics.extract_receipt_info(job.image_path, job.id)
+    except Exception as e:
+        db.fail_ocr_job(job.id, f"OCR 처리 중 오류 발생: {e}")
+        return False
+    if not info:
+        # extract_receipt_info reports failures as text with empty info
+        db.fail_ocr_job(job.id, text)
+        return False
+    db.finish_ocr_job(job.id, text, info)
+    return True
+
+def run_pending(worker, limit=None):
+    """Processes available jobs until the queue is empty (or `limit` jobs). Returns (done, failed)."""
+    done = failed = 0
+    while limit is None or done + failed < limit:
+        # Over today's budget the jobs stay queued instead of failing
+        if ocr_metrics.over_budget():
+            break
+        job = db.claim_ocr_job(worker)
+        if job is None:
+            break
+        if run_job(job):
+            done += 1
+        else:
+            failed += 1
+    return done, failed
+
+def work(path, worker, poll):
+    with db.using_db(path):
+        while True:
+            # A locked DB or a failing claim must not end the worker thread: log, poll again
+            try:
+                done, failed = run_pending(worker)
+                if done or failed:
+                    print(f"{datetime.now():%Y-%m-%d %H:%M:%S} {worker}: {done} done, {failed} failed")
+            except Exception as e:
+                print(f"{datetime.now():%Y-%m-%d %H:%M:%S} {worker}: {type(e).__name__}: {e}")
+                traceback.print_exc()
+            time.sleep(poll)
+
+def worker_name(index=0):
+    return f"{socket.gethostname()}:{os.getpid()}:{index}"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="MyCatalog OCR job worker")
+    parser.add_argument('--threads', type=int, default=2, help="jobs processed at the same time (default 2)")
+    parser.add_argument('--once', action='store_true', help="process the queued jobs and exit")
+    parser.add_argument('--poll', type=float, default=1.0, help="seconds between queue checks when idle")
+    parser.add_argument('--db', help="database file (default: mycatalog.db)")
+    args = parser.parse_args()
+    if args.db:
+        db.set_current_db(args.db)
+    db.ensure_db()
+    path = db.current_db_path()
+    if args.once:
+        start = time.perf_counter()
+        results = []
+        def drain(index):
+            with db.using_db(path):
+                results.append(run_pending(worker_name(index)))
+        threads = [threading.Thread(target=drain, args=(i,)) for i in range(args.threads)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        print(f"{sum(d for d, _ in results)} jobs done, {sum(f for _, f in results)} failed "
+              f"in {time.perf_counter() - start:.2f}s.")
+    else:
+        print(f"OCR worker started ({args.threads} threads, {path}).")
+        threads = [threading.Thread(target=work, args=(path, worker_name(i), args.poll), daemon=True)
+                   for i in range(args.threads)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
@@ -0,0 +1,65 @@
+"""
+Per-year receipt archive.
+Receipts used before a cutoff year move out of the main DB into one file per
+year next to it (mycatalog.receipts-2023.db ...). Date range queries in the app
+attach the archived years they span; the receipt list shows the main DB only.
+
+    python receipt_archive.py archive [--before YEAR] [--vacuum] [--db PATH]
+    python receipt_archive.py list [--db PATH]
+    python receipt_archive.py restore YEAR [--db PATH]
+
+--before defaults to the current year (everything older is archived). --vacuum
+shrinks the main DB file afterwards; without it the freed pages are reused.
+"""
+import os
+import time
+import sqlite3
+import argparse
+from datetime import datetime
+import database as db
+
+def vacuum():
+    conn = sqlite3.connect(db.current_db_path(), timeout=30)
+    conn.execute('VACUUM')
+    conn.close()
+
+def archive_sizes():
+    sizes = []
+    for year in db.archived_receipt_years():
+        path = db.receipt_archive_path(year)
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        count = conn.execute('SELECT COUNT(*) FROM receipts').fetchone()[0]
+        conn.close()
+        sizes.append((year, count, os.path.getsize(path)))
+    return sizes
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="MyCatalog receipt archive")
+    parser.add_argument('--db', help="database file (default: mycatalog.db)")
+    sub = parser.add_subparsers(dest='command', required=True)
+    archive = sub.add_parser('archive', help="move old receipts to per-year files")
+    archive.add_argument('--before', type=int, default=datetime.now().year, help="archive receipts used before this year")
+    archive.add_argument('--vacuum', action='store_true', help="shrink the main DB file afterwards")
+    sub.add_parser('list', help="show the archived years")
+    restore = sub.add_parser('restore', help="move an archived year back into the main DB")
+    restore.add_argument('year', type=int)
+    args = parser.parse_args()
+    if args.db:
+        db.set_current_db(args.db)
+    db.ensure_db()
+
+    start = time.perf_counter()
+    if args.command == 'archive':
+        before = os.path.getsize(db.current_db_path())
+        moved = db.archive_receipts(args.before)
+        for year, count in sorted(moved.items()):
+            print(f"{year}: {count} receipts -> {db.receipt_archive_path(year)}")
+        if args.vacuum:
+            vacuum()
+            print(f"Main DB {before / 1e6:.1f}MB -> {os.path.getsize(db.current_db_path()) / 1e6:.1f}MB")
+        print(f"Archived {sum(moved.values())} receipts in {time.perf_counter() - start:.2f}s.")
+    elif args.command == 'list':
+        for year, count, size in archive_sizes():
+            print(f"{year}: {count} receipts, {size / 1e6:.1f}MB")
+    else:
+        print(f"Restored {db.restore_receipts(args.year)} receipts from {args.year}.")
@@ -0,0 +1,159 @@
+"""
+Receipt line items -> inventory.
+OCR returns the purchased lines along with the header fields; they are kept in
+receipt_lines with the receipt. The review grid on the receipt page proposes
+an item per line with defaults learned from history: the item name, location
+and shelf life the same product got when it was registered before (from
+earlier receipt lines first, then from items of the same name), and creates
+the chosen lines as items in one write transaction.
+
+    python receipt_items.py RECEIPT_ID [--db PATH]   # print the proposals
+"""
+import time
+import argparse
+import statistics
+from collections import Counter
+from datetime import date, timedelta
+import database as db
+import models
+from models import ReceiptLine
+from normalize_names import name_key
+
+def line_rows(lines):
+    """OCR line dicts -> rows for db.add_receipt(lines=...); nameless lines are dropped."""
+    rows = []
+    for line in lines or []:
+        name = str(line.get('name') or '').strip()
+        if name and name_key(name):
+            rows.append((len(rows) + 1, name, name_key(name), line.get('quantity') or 1.0,
+                         line.get('unit_price') or 0.0, line.get('amount') or 0.0))
+    return rows
+
+def get_lines(receipt_id, status=None):
+    conn = db.get_read_connection()
+    cursor = conn.cursor()
+    cursor.row_factory = models.row_factory(ReceiptLine)
+    sql = f'SELECT {models.columns(ReceiptLine)} FROM receipt_lines WHERE receipt_id = ?'
+    params = [receipt_id]
+    if status:
+        sql += ' AND status = ?'
+        params.append(status)
+    cursor.execute(sql + ' ORDER BY line_no', params)
+    rows = cursor.fetchall()
+    conn.close()
+    return rows
+
+def receipts_with_pending_lines(limit=50):
+    """[(receipt id, use_date, store_name, pending lines)], newest receipts first."""
+    conn = db.get_read_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+    SELECT r.id, r.use_date, r.store_name, p.lines
+    FROM (SELECT receipt_id, COUNT(*) AS lines FROM receipt_lines WHERE status = 'pending' GROUP BY receipt_id) AS p
+    JOIN receipts AS r ON r.id = p.receipt_id
+    ORDER BY r.use_day DESC, r.id DESC LIMIT ?
+    ''', (limit,))
+    rows = cursor.fetchall()
+    conn.close()
+    return rows
+
+def learned_defaults(keys):
+    """
+    {name_key: (item name, location_id, shelf life days or None, uses)} for the
+    keys seen before. Items created from earlier lines of the product count
+    first; items registered by hand with a matching name fill the rest.
+    """
+    keys = list(set(keys))
+    if not keys:
+        return {}
+    history = {}  # key -> [(name, location_id, shelf life), ...]
+    conn = db.get_read_connection()
+    cursor = conn.cursor()
+    placeholders = ",".join("?" * len(keys))
+    cursor.execute(f'''
+    SELECT l.name_key, i.name, i.location_id, i.expiry_day - i.purchase_day
+    FROM receipt_lines AS l JOIN items AS i ON i.id = l.item_id
+    WHERE l.status = 'created' AND l.name_key IN ({placeholders})
+    ''', keys)
+    for key, name, location_id, shelf_life in cursor:
+        history.setdefault(key, []).append((name, location_id, shelf_life))
+    missing = set(keys) - set(history)
+    if missing:
+        # Spellings of the remaining keys among the item names in use
+        cursor.execute("SELECT value FROM name_counts WHERE kind = 'item'")
+        spellings = {}
+        for (value,) in cursor:
+            key = name_key(value)
+            if key in missing:
+                spellings[value] = key
+        if spellings:
+            placeholders = ",".join("?" * len(spellings))
+            cursor.execute(f'''
+            SELECT name, location_id, expiry_day - purchase_day FROM items WHERE name IN ({placeholders})
+            ''', list(spellings))
+            for name, location_id, shelf_life in cursor:
+                history.setdefault(spellings[name], []).append((name, location_id, shelf_life))
+    conn.close()
+    defaults = {}
+    for key, uses in history.items():
+        name = Counter(u[0] for u in uses).most_common(1)[0][0]
+        locations = Counter(u[1] for u in uses if u[1] is not None)
+        shelf_lives = [u[2] for u in uses if u[2] is not None and u[2] >= 0]
+        defaults[key] = (name, locations.most_common(1)[0][0] if locations else None,
+                         round(statistics.median(shelf_lives)) if shelf_lives else None, len(uses))
+    return defaults
+
+def proposals(receipt_id, purchase_date):
+    """
+    One dict per pending line: line_id, name, quantity, location_id,
+    purchase_date, expiry_date (ISO or None), amount, uses (past matches).
+    """
+    lines = get_lines(receipt_id, 'pending')
+    defaults = learned_defaults(line.name_key for line in lines)
+    result = []
+    for line in lines:
+        name, location_id, shelf_life, uses = defaults.get(line.name_key, (line.name, None, None, 0))
+        expiry = (purchase_date + timedelta(days=shelf_life)).isoformat() if shelf_life is not None and purchase_date else None
+        result.append({'line_id': line.id, 'name': name, 'quantity': line.quantity, 'location_id': location_id,
+                       'purchase_date': purchase_date.isoformat() if purchase_date else None,
+                       'expiry_date': expiry, 'amount': line.amount, 'uses': uses})
+    return result
+
+@db.writes
+def create_items(cursor, receipt_id, rows, skip_line_ids=()):
+    """
+    rows: [{line_id, name, quantity, location_id, purchase_date, expiry_date}].
+    Creates the items and marks their lines created, the other lines skipped,
+    all in one transaction. Returns the number of items created.
+    """
+    for row in rows:
+        cursor.execute('''
+        INSERT INTO items (name, purchase_date, expiry_date, quantity, notes, location_id)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ''', (row['name'], db.normalize_date(row['purchase_date']), db.normalize_date(row['expiry_date']),
+              row['quantity'], f"영수증 #{receipt_id}", row['location_id']))
+        cursor.execute("UPDATE receipt_lines SET status = 'created', item_id = ? WHERE id = ? AND receipt_id = ?",
+                       (cursor.lastrowid, row['line_id'], receipt_id))
+    cursor.executemany("UPDATE receipt_lines SET status = 'skipped' WHERE id = ? AND receipt_id = ? AND status = 'pending'",
+                       [(line_id, receipt_id) for line_id in skip_line_ids])
+    return len(rows)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Item proposals for a receipt's pending lines")
+    parser.add_argument('receipt_id', type=int)
+    parser.add_argument('--db', help="database file (default: mycatalog.db)")
+    args = parser.parse_args()
+    if args.db:
+        db.set_current_db(args.db)
+    db.ensure_db()
+    receipt = db.get_receipt(args.receipt_id)
+    if receipt is None:
+        raise SystemExit(f"No receipt #{args.receipt_id}")
+    start = time.perf_counter()
+    use_date = date.fromisoformat(receipt.use_date[:10]) if receipt.use_date else None
+    rows = proposals(args.receipt_id, use_date)
+    print(f"#{receipt.id} {receipt.store_name} {receipt.use_date}: {len(rows)} pending lines "
+          f"({time.perf_counter() - start:.3f}s)")
+    for row in rows:
+        print(f"  {row['name']} x{row['quantity']:g}  location {row['location_id']}  expiry {row['expiry_date']}  "
+              f"({row['uses']} past)")
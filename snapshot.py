@@ -0,0 +1,373 @@
+"""
+Columnar analytics snapshot.
+Writes locations, items and receipts (archived years included) as Arrow IPC
+files partitioned by year into a directory next to the database
+(mycatalog.snapshot/receipts/year=2025/<seq>.arrow ...), and keeps them
+current from the changes log: an update rewrites only the partitions holding
+rows changed since the snapshot's seq. manifest.json names the current files,
+so readers always see a complete snapshot while an update runs.
+
+The analysis functions read those files memory-mapped and load only the
+columns and years they ask for; heavy queries never open mycatalog.db or wait
+on its lock.
+
+    python snapshot.py update [--full] [--format arrow|parquet] [--interval SECONDS] [--db PATH]
+    python snapshot.py status [--db PATH]
+    python snapshot.py spend [--by category|store_name|card_type] [--db PATH]
+    python snapshot.py waste [--db PATH]
+
+Needs pyarrow (pip install pyarrow); the app itself does not.
+"""
+import os
+import json
+import time
+import argparse
+from datetime import date, datetime
+import database as db
+
+FETCH_ROWS = 50_000
+FORMATS = ('arrow', 'parquet')  # parquet files are smaller but decoded on every read
+JULIAN_EPOCH = db.JULIAN_DAY_OFFSET + date(1970, 1, 1).toordinal()  # *_day value of 1970-01-01
+
+# table -> (partition expression or None, [(column, SQL expression, type)]).
+# Dates come from the *_day columns, so no date strings are parsed per row.
+TABLES = {
+    'locations': (None, [
+        ('id', 'id', 'int64'),
+        ('name', 'name', 'string'),
+        ('category', 'category', 'string'),
+        ('parent_id', 'parent_id', 'int64'),
+        ('is_food', 'is_food', 'bool'),
+    ]),
+    'items': ('purchase_date', [
+        ('id', 'id', 'int64'),
+        ('name', 'name', 'string'),
+        ('purchase_date', f'purchase_day - {JULIAN_EPOCH}', 'date32'),
+        ('expiry_date', f'expiry_day - {JULIAN_EPOCH}', 'date32'),
+        ('quantity', 'quantity', 'float64'),
+        ('notes', 'notes', 'string'),
+        ('location_id', 'location_id', 'int64'),
+        ('version', 'version', 'int64'),
+    ]),
+    'receipts': ('use_date', [
+        ('id', 'id', 'int64'),
+        ('category_id', 'category_id', 'int64'),
+        ('store_name', 'store_name', 'string'),
+        ('store_address', 'store_address', 'string'),
+        ('card_type', 'card_type', 'string'),
+        ('card_number', 'card_number', 'string'),
+        ('use_date', "CAST(strftime('%s', substr(use_date || ' 00:00:00', 1, 19)) AS INTEGER)", 'timestamp'),
+        ('sales_amount', 'sales_amount', 'float64'),
+        ('vat', 'vat', 'float64'),
+        ('total_amount', 'total_amount', 'float64'),
+        ('notes', 'notes', 'string'),
+        ('image_path', 'image_path', 'string'),
+        ('version', 'version', 'int64'),
+    ]),
+}
+# Arrays are built from the SQLite values as the storage type, then cast
+STORAGE_TYPES = {'date32': 'int32', 'timestamp': 'int64', 'bool': 'int8'}
+
+class SnapshotError(Exception):
+    pass
+
+def _load_pyarrow():
+    # Optional dependency, imported on first use
+    try:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.ipc
+        import pyarrow.parquet
+        return pyarrow
+    except ImportError:
+        return None
+
+def _pyarrow():
+    pa = _load_pyarrow()
+    if pa is None:
+        raise SnapshotError("'pyarrow' 패키지가 설치되지 않았습니다. 터미널에서 'pip install pyarrow'를 실행해 주세요.")
+    return pa
+
+def _type(pa, name):
+    return pa.timestamp('s') if name == 'timestamp' else getattr(pa, 'bool_' if name == 'bool' else name)()
+
+def schema(table, columns=None):
+    pa = _pyarrow()
+    return pa.schema([(name, _type(pa, kind)) for name, _, kind in TABLES[table][1] if columns is None or name in columns])
+
+def snapshot_dir(path=None):
+    return f"{os.path.splitext(path or db.current_db_path())[0]}.snapshot"
+
+def manifest(path=None):
+    """The current manifest ({seq, format, built_at, tables: {table: {partition: {file, rows}}}}) or None."""
+    try:
+        with open(os.path.join(snapshot_dir(path), 'manifest.json'), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+# Writing
+def _partition_sql(column):
+    # 'YYYY' from the date column, 'none' for rows without a usable date
+    return f"CASE WHEN substr({column}, 1, 4) GLOB '[0-9][0-9][0-9][0-9]' THEN substr({column}, 1, 4) ELSE 'none' END"
+
+def _fetch(pa, cursor, table, source, where='1', params=()):
+    """{partition: pyarrow Table} of the rows of `source` matching `where`."""
+    partition, columns = TABLES[table]
+    select = ", ".join(expr for _, expr, _ in columns) + (f", {_partition_sql(partition)}" if partition else ", ''")
+    cursor.execute(f"SELECT {select} FROM {source} WHERE {where}", params)
+    target = schema(table)
+    parts = {}
+    while True:
+        rows = cursor.fetchmany(FETCH_ROWS)
+        if not rows:
+            break
+        values = list(zip(*rows))
+        arrays = [pa.array(values[i], _type(pa, STORAGE_TYPES.get(kind, kind))).cast(_type(pa, kind))
+                  for i, (_, _, kind) in enumerate(columns)]
+        batch = pa.Table.from_arrays(arrays, schema=target)
+        keys = pa.array(values[-1], pa.string())
+        for key in keys.unique().to_pylist():
+            parts.setdefault(key, []).append(batch.filter(pa.compute.equal(keys, key)))
+    return {key: pa.concat_tables(tables) for key, tables in parts.items()}
+
+def _file_name(table, partition, seq, fmt):
+    folder = f"{table}/year={partition}" if partition else table
+    return f"{folder}/{seq}.{fmt}"
+
+def _write(pa, data, root, name, fmt):
+    path = os.path.join(root, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + '.tmp'
+    if fmt == 'parquet':
+        pa.parquet.write_table(data, tmp)
+    else:
+        # Uncompressed IPC, so readers map the columns straight from the page cache
+        with pa.ipc.new_file(tmp, data.schema) as writer:
+            writer.write_table(data)
+    os.replace(tmp, path)
+
+def _commit(root, new, old):
+    # The manifest swap makes the new files current; files only the old one named go
+    tmp = os.path.join(root, 'manifest.json.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(new, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, os.path.join(root, 'manifest.json'))
+    current = {p['file'] for parts in new['tables'].values() for p in parts.values()}
+    for parts in (old or {}).get('tables', {}).values():
+        for p in parts.values():
+            if p['file'] not in current:
+                try:
+                    os.remove(os.path.join(root, p['file']))
+                except OSError:
+                    pass  # still mapped by a reader (Windows); the next full build replaces it
+
+def _read_source(conn, table):
+    # Receipts include the archived years, like exports
+    if table == 'receipts':
+        return db.attach_receipt_archives(conn, db.archived_receipt_years())
+    return table
+
+def build(fmt='arrow'):
+    """Writes a complete snapshot of the current database. Returns the new manifest."""
+    pa = _pyarrow()
+    root = snapshot_dir()
+    old = manifest()
+    conn = db.get_read_connection()
+    sources = {table: _read_source(conn, table) for table in TABLES}
+    cursor = conn.cursor()
+    cursor.execute('BEGIN')  # the rows and the seq from one read snapshot
+    cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM sqlite_sequence WHERE name = 'changes'")
+    seq = cursor.fetchone()[0]
+    new = {'seq': seq, 'format': fmt, 'built_at': datetime.now().isoformat(timespec='seconds'), 'tables': {}}
+    for table in TABLES:
+        new['tables'][table] = {}
+        for partition, data in _fetch(pa, cursor, table, sources[table]).items():
+            name = _file_name(table, partition, seq, fmt)
+            _write(pa, data.sort_by('id'), root, name, fmt)
+            new['tables'][table][partition] = {'file': name, 'rows': data.num_rows}
+    conn.rollback()
+    conn.close()
+    _commit(root, new, old)
+    return new
+
+def update(full=False, fmt=None):
+    """
+    Brings the snapshot up to the changes log. Rebuilds everything when there
+    is no snapshot yet, the format changes, or the log was compacted past the
+    snapshot's seq. Returns (manifest, partitions written).
+    """
+    pa = _pyarrow()
+    old = manifest()
+    fmt = fmt or (old or {}).get('format', 'arrow')
+    if full or old is None or old['format'] != fmt:
+        new = build(fmt)
+        return new, sum(len(parts) for parts in new['tables'].values())
+    seq, full_resync, changed = db.get_changed_ids(old['seq'], TABLES)
+    if full_resync:
+        new = build(fmt)
+        return new, sum(len(parts) for parts in new['tables'].values())
+    if seq == old['seq']:
+        return old, 0
+    root = snapshot_dir()
+    new = {'seq': seq, 'format': fmt, 'built_at': datetime.now().isoformat(timespec='seconds'),
+           'tables': {table: dict(parts) for table, parts in old['tables'].items()}}
+    written = 0
+    conn = db.get_read_connection()
+    for table in TABLES:
+        touched = sorted(changed[table])
+        if not touched:
+            continue
+        # Current rows of the touched ids (deleted ones are not found; archived
+        # receipts are, in their archive file)
+        fresh = {}
+        source = _read_source(conn, table)
+        for start in range(0, len(touched), 500):
+            chunk = touched[start:start + 500]
+            for partition, data in _fetch(pa, conn.cursor(), table, source, f"id IN ({','.join('?' * len(chunk))})", chunk).items():
+                fresh.setdefault(partition, []).append(data)
+        touched_ids = pa.array(touched, pa.int64())
+        parts = new['tables'][table]
+        for partition in set(parts) | set(fresh):
+            kept = []
+            if partition in parts:
+                current = _read_file(pa, os.path.join(root, parts[partition]['file']))
+                gone = pa.compute.is_in(current['id'], value_set=touched_ids)
+                if partition not in fresh and not pa.compute.any(gone).as_py():
+                    continue
+                kept.append(current.filter(pa.compute.invert(gone)))
+            data = pa.concat_tables(kept + fresh.get(partition, [])).sort_by('id')
+            if data.num_rows:
+                name = _file_name(table, partition, seq, fmt)
+                _write(pa, data, root, name, fmt)
+                parts[partition] = {'file': name, 'rows': data.num_rows}
+            else:
+                parts.pop(partition, None)
+            written += 1
+    conn.close()
+    _commit(root, new, old)
+    return new, written
+
+# Reading: snapshot files only
+def _read_file(pa, path, columns=None):
+    if path.endswith('.parquet'):
+        return pa.parquet.read_table(path, columns=columns, memory_map=True)
+    # Zero-copy: the table's buffers point into the mapped file, so columns
+    # that are not selected are never read from disk
+    data = pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+    return data.select(columns) if columns else data
+
+def read(table, columns=None, years=None, path=None):
+    """
+    pyarrow Table of `table` from the snapshot, with only `columns` and, for
+    items / receipts, only the partitions of `years` (purchase / use year).
+    """
+    pa = _pyarrow()
+    current = manifest(path)
+    if current is None:
+        raise SnapshotError("분석용 스냅샷이 없습니다. 'python snapshot.py update'를 먼저 실행해 주세요.")
+    root = snapshot_dir(path)
+    wanted = {str(y) for y in years} if years is not None else None
+    tables = [_read_file(pa, os.path.join(root, p['file']), columns)
+              for partition, p in sorted(current['tables'][table].items())
+              if wanted is None or partition in wanted or not TABLES[table][0]]
+    if not tables:
+        return schema(table, columns).empty_table()
+    return pa.concat_tables(tables)
+
+def frame(table, columns=None, years=None, path=None):
+    """read() as a pandas DataFrame."""
+    return read(table, columns, years, path).to_pandas()
+
+def spend_by_year(by='category', years=None, path=None):
+    """pyarrow Table (year, key, receipts, total) of spending per use year and category / store_name / card_type."""
+    pa = _pyarrow()
+    pc = pa.compute
+    column = 'category_id' if by == 'category' else by
+    receipts = read('receipts', ['use_date', 'total_amount', column], years, path)
+    if by == 'category':
+        # Receipt categories are locations; group by their 대분류
+        locations = read('locations', ['id', 'category'], path=path).rename_columns(['category_id', 'key'])
+        receipts = receipts.join(locations, 'category_id', join_type='left outer')
+    else:
+        receipts = receipts.rename_columns(['use_date', 'total_amount', 'key'])
+    data = pa.table({'year': pc.year(receipts['use_date']), 'key': receipts['key'], 'total_amount': receipts['total_amount']})
+    result = data.group_by(['year', 'key']).aggregate([('total_amount', 'count'), ('total_amount', 'sum')])
+    result = result.rename_columns(['year', 'key', 'receipts', 'total'])
+    return result.sort_by([('year', 'descending'), ('total', 'descending')])
+
+def expiry_waste(years=None, today=None, path=None):
+    """
+    pyarrow Table (year, category, items, expired, expired_quantity, waste_ratio)
+    per purchase year and location 대분류: items past their expiry date that
+    are still in stock count as wasted.
+    """
+    pa = _pyarrow()
+    pc = pa.compute
+    items = read('items', ['expiry_date', 'purchase_date', 'quantity', 'location_id'], years, path)
+    locations = read('locations', ['id', 'category'], path=path).rename_columns(['location_id', 'category'])
+    items = items.join(locations, 'location_id', join_type='left outer')
+    expired = pc.and_(pc.less(items['expiry_date'], pa.scalar(today or date.today(), pa.date32())),
+                      pc.greater(items['quantity'], 0))
+    expired = pc.fill_null(expired, False)
+    data = pa.table({
+        'year': pc.year(items['purchase_date']),
+        'category': pc.fill_null(items['category'], '기타'),
+        'expired': pc.cast(expired, pa.int64()),
+        'expired_quantity': pc.if_else(expired, items['quantity'], 0.0),
+    })
+    result = data.group_by(['year', 'category']).aggregate([('expired', 'count'), ('expired', 'sum'), ('expired_quantity', 'sum')])
+    result = result.rename_columns(['year', 'category', 'items', 'expired', 'expired_quantity'])
+    result = result.append_column('waste_ratio', pc.divide(pc.cast(result['expired'], pa.float64()), result['items']))
+    return result.sort_by([('year', 'descending'), ('expired', 'descending')])
+
+def status():
+    """(manifest or None, changes logged since its seq)."""
+    current = manifest()
+    return current, db.get_change_seq() - (current['seq'] if current else 0)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Columnar analytics snapshot of the MyCatalog database")
+    parser.add_argument('--db', help="database file (default: mycatalog.db)")
+    sub = parser.add_subparsers(dest='command', required=True)
+    upd = sub.add_parser('update', help="bring the snapshot up to date (incrementally when possible)")
+    upd.add_argument('--full', action='store_true', help="rewrite every partition")
+    upd.add_argument('--format', choices=FORMATS, help="file format (default: the snapshot's, else arrow)")
+    upd.add_argument('--interval', type=float, help="keep updating every SECONDS")
+    sub.add_parser('status', help="show the snapshot's partitions and how far behind it is")
+    spend = sub.add_parser('spend', help="spending per year from the snapshot")
+    spend.add_argument('--by', choices=('category', 'store_name', 'card_type'), default='category')
+    sub.add_parser('waste', help="expired items per purchase year and category from the snapshot")
+    args = parser.parse_args()
+    if args.db:
+        db.set_current_db(args.db)
+    try:
+        if args.command == 'update':
+            db.ensure_db()
+            while True:
+                start = time.perf_counter()
+                current, written = update(args.full, args.format)
+                rows = sum(p['rows'] for parts in current['tables'].values() for p in parts.values())
+                print(f"{datetime.now():%Y-%m-%d %H:%M:%S} seq {current['seq']}: {written} partitions written, "
+                      f"{rows:,} rows in {snapshot_dir()} ({time.perf_counter() - start:.2f}s)")
+                if not args.interval:
+                    break
+                args.full = False
+                time.sleep(args.interval)
+        elif args.command == 'status':
+            db.ensure_db()
+            current, behind = status()
+            if current is None:
+                raise SystemExit("No snapshot yet; run: python snapshot.py update")
+            print(f"{snapshot_dir()}: seq {current['seq']} ({current['format']}, {current['built_at']}), {behind} changes behind")
+            for table, parts in current['tables'].items():
+                size = sum(os.path.getsize(os.path.join(snapshot_dir(), p['file'])) for p in parts.values())
+                print(f"  {table:<10} {sum(p['rows'] for p in parts.values()):>10,} rows  {len(parts):>3} partitions  {size / 1e6:>7.1f}MB")
+        else:
+            start = time.perf_counter()
+            result = spend_by_year(args.by) if args.command == 'spend' else expiry_waste()
+            elapsed = time.perf_counter() - start
+            print(result.to_pandas().to_string(index=False))
+            print(f"({result.num_rows} rows in {elapsed * 1e3:.1f}ms)")
+    except SnapshotError as e:
+        raise SystemExit(str(e))
@@ -0,0 +1,144 @@
+"""
+Spending analytics from the spending_rollups table.
+The rollups hold receipts and total per day, per month, and per month and
+category / store / card; triggers on receipts keep them current (see
+database.SPENDING_DIMS). Every query here reads rollup rows only, so the
+analytics page costs the same with 100 receipts or 1M. Long daily series are
+downsampled with LTTB (largest triangle three buckets) before plotting.
+
+    python spending.py [--year YEAR] [--rebuild] [--db PATH]
+"""
+import time
+import argparse
+from datetime import date, timedelta
+import database as db
+import models
+from models import SpendingTotal
+
+DAILY_POINTS = 180  # points a daily chart is downsampled to
+
+def month_key(d):
+    return f"{d.year:04d}-{d.month:02d}"
+
+def _totals(sql, params):
+    conn = db.get_read_connection()
+    cursor = conn.cursor()
+    cursor.row_factory = models.row_factory(SpendingTotal)
+    cursor.execute(sql, params)
+    rows = cursor.fetchall()
+    conn.close()
+    return rows
+
+def series(dim, start, end, keys=None):
+    """
+    SpendingTotal rows of `dim` for the periods from start to end (dates,
+    inclusive), in period order. `keys` limits the category / store / card
+    values.
+    """
+    if dim == 'day':
+        bounds = (start.isoformat(), end.isoformat())
+    else:
+        bounds = (month_key(start), month_key(end))
+    sql = f'SELECT {models.columns(SpendingTotal)} FROM spending_rollups WHERE dim = ? AND period BETWEEN ? AND ?'
+    params = [dim, *bounds]
+    if keys is not None:
+        sql += f' AND key IN ({",".join("?" * len(keys))})'
+        params += list(keys)
+    return _totals(sql + ' ORDER BY period, key', params)
+
+def totals_by(dim, start, end, limit=None):
+    """[SpendingTotal(period=None, key, receipts, total)] over the months of start..end, largest total first."""
+    sql = '''
+    SELECT NULL, key, SUM(receipts), SUM(total) FROM spending_rollups
+    WHERE dim = ? AND period BETWEEN ? AND ? GROUP BY key ORDER BY 4 DESC
+    '''
+    params = [dim, month_key(start), month_key(end)]
+    if limit:
+        sql += ' LIMIT ?'
+        params.append(limit)
+    return _totals(sql, params)
+
+def monthly(start, end):
+    """{'YYYY-MM': total} for every month of start..end, months without receipts as 0."""
+    totals = {row.period: row.total for row in series('month', start, end)}
+    months = {}
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        key = f"{year:04d}-{month:02d}"
+        months[key] = totals.get(key, 0.0)
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+def total_between(start, end):
+    """Spending from start to end (dates, inclusive), from the day rollups."""
+    return sum(row.total for row in series('day', start, end))
+
+def same_day_last_year(d):
+    try:
+        return d.replace(year=d.year - 1)
+    except ValueError:  # Feb 29
+        return d.replace(year=d.year - 1, day=28)
+
+def year_over_year(year):
+    """[(month, total in `year`, total in the year before)] for months 1-12."""
+    this = monthly(date(year, 1, 1), date(year, 12, 31))
+    last = monthly(date(year - 1, 1, 1), date(year - 1, 12, 31))
+    return [(m, this[f"{year:04d}-{m:02d}"], last[f"{year - 1:04d}-{m:02d}"]) for m in range(1, 13)]
+
+def daily(start, end, points=DAILY_POINTS):
+    """[(date, total)] for every day of start..end (0 without receipts), LTTB-downsampled to `points`."""
+    totals = {row.period: row.total for row in series('day', start, end)}
+    days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+    values = [(d.toordinal(), totals.get(d.isoformat(), 0.0)) for d in days]
+    return [(date.fromordinal(x), y) for x, y in lttb(values, points)]
+
+def lttb(points, threshold):
+    """
+    Largest-Triangle-Three-Buckets downsampling of [(x, y)] sorted by x. Keeps
+    the first and last point and, per bucket, the point forming the largest
+    triangle with the previous pick and the next bucket's mean, so peaks survive.
+    """
+    n = len(points)
+    if threshold >= n or threshold < 3:
+        return list(points)
+    sampled = [points[0]]
+    every = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        start, end = int(i * every) + 1, int((i + 1) * every) + 1
+        next_start, next_end = end, min(int((i + 2) * every) + 1, n)
+        avg_x = sum(p[0] for p in points[next_start:next_end]) / (next_end - next_start)
+        avg_y = sum(p[1] for p in points[next_start:next_end]) / (next_end - next_start)
+        ax, ay = points[a]
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            x, y = points[j]
+            area = abs((ax - avg_x) * (y - ay) - (ax - x) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        sampled.append(points[best])
+        a = best
+    sampled.append(points[-1])
+    return sampled
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Monthly spending and year-over-year change from the rollups")
+    parser.add_argument('--year', type=int, default=date.today().year)
+    parser.add_argument('--rebuild', action='store_true', help="recompute the rollups from all receipts first")
+    parser.add_argument('--db', help="database file (default: mycatalog.db)")
+    args = parser.parse_args()
+    if args.db:
+        db.set_current_db(args.db)
+    db.ensure_db()
+    if args.rebuild:
+        start = time.perf_counter()
+        rows = db.rebuild_spending_rollups()
+        print(f"Rebuilt {rows:,} rollup rows in {time.perf_counter() - start:.2f}s.")
+    start = time.perf_counter()
+    rows = year_over_year(args.year)
+    elapsed = time.perf_counter() - start
+    print(f"{'month':<6} {args.year:>14} {args.year - 1:>14} {'change':>8}")
+    for month, this, last in rows:
+        change = f"{(this - last) / last:+.0%}" if last else "-"
+        print(f"{month:<6} {this:>14,.0f} {last:>14,.0f} {change:>8}")
+    print(f"total  {sum(r[1] for r in rows):>14,.0f} {sum(r[2] for r in rows):>14,.0f} (in {elapsed * 1e3:.1f}ms)")
@@ -0,0 +1,496 @@
+"""
+Delta replication between two MyCatalog databases.
+Every synced row (locations, items, receipts) gets a global uid and a hybrid
+logical clock stamp in `sync_rows`, filled from the changes log. A sync sends
+each side only the rows stamped since the other side's last sync; conflicting
+edits resolve last-writer-wins on (hlc, node id), so both sides converge to the
+same state. Receipt images travel by content hash and are only sent when the
+other side does not have them yet.
+
+    python sync.py sync A.db B.db                 # two local files
+    python sync.py serve --db B.db [--port 8765]  # expose B on the network
+    python sync.py sync A.db --remote HOST:8765   # sync A with a served DB
+    python sync.py new-node --db COPY.db          # after copying a synced file
+
+Set MYCATALOG_SYNC_TOKEN on both ends to require a shared token; serving on a
+non-loopback address is refused without one.
+"""
+import os
+import re
+import hmac
+import json
+import time
+import uuid
+import base64
+import socket
+import hashlib
+import ipaddress
+import argparse
+import socketserver
+import database as db
+
+DEFAULT_PORT = 8765
+UPLOAD_DIR = 'uploads'
+# Image hashes and extensions come from the peer and become file names here
+BLOB_HASH_RE = re.compile(r'[0-9a-f]{64}')
+BLOB_EXT_RE = re.compile(r'\.[A-Za-z0-9]{1,5}')
+
+# Synced tables in apply order (parents first) -> foreign key columns and the
+# table they reference. Foreign keys travel as uids.
+SYNC_TABLES = {
+    'locations': {'parent_id': 'locations'},
+    'items': {'location_id': 'locations'},
+    'receipts': {'category_id': 'locations'},
+}
+VERSIONED_TABLES = ('items', 'receipts')
+
+def data_columns(table):
+    return [f for f in db.CDC_TABLES[table]._fields if f not in ('id', 'version')]
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _setting(cursor, key):
+    cursor.execute('SELECT value FROM settings WHERE key = ?', (key,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+def _put_setting(cursor, key, value):
+    cursor.execute('INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)', (key, str(value)))
+
+class Clock:
+    """Hybrid logical clock: (unix ms << 16) | counter, never going backwards."""
+    def __init__(self, last):
+        self.last = last
+
+    def tick(self):
+        self.last = max(int(time.time() * 1000) << 16, self.last + 1)
+        return self.last
+
+def _clock(cursor):
+    # Remote stamps applied here are in sync_rows too, so the clock also moves past them
+    cursor.execute('SELECT COALESCE(MAX(hlc), 0) FROM sync_rows')
+    return Clock(cursor.fetchone()[0])
+
+def _next_batch(cursor):
+    # sync_rows.seq: one increasing number per stamping / apply job
+    cursor.execute('SELECT COALESCE(MAX(seq), 0) + 1 FROM sync_rows')
+    return cursor.fetchone()[0]
+
+def _changes_seq(cursor):
+    cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM sqlite_sequence WHERE name = 'changes'")
+    return cursor.fetchone()[0]
+
+def _initial_uid(cursor, table, row_id):
+    # Rows that exist before the first stamping get a uid derived from their
+    # content, so two copies of the same file agree on them
+    cursor.execute(f"SELECT {', '.join(data_columns(table))} FROM {table} WHERE id = ?", (row_id,))
+    content = json.dumps([table, row_id, cursor.fetchone()], ensure_ascii=False, default=str)
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+def _stamp_local(cursor, node):
+    """Stamps every local change logged since the last run. Returns rows stamped."""
+    meta_seq = _setting(cursor, 'sync_meta_seq')
+    first_run = meta_seq is None
+    upto = _changes_seq(cursor)
+    tables = list(SYNC_TABLES)
+    cursor.execute(f'''
+    SELECT table_name, row_id, op, MAX(seq) FROM changes
+    WHERE seq > ? AND seq <= ? AND table_name IN ({','.join('?' * len(tables))})
+    GROUP BY table_name, row_id ORDER BY MAX(seq)
+    ''', [int(meta_seq or 0), upto] + tables)
+    pending = cursor.fetchall()
+    clock = _clock(cursor)
+    batch = _next_batch(cursor)
+    for table, row_id, op, _ in pending:
+        cursor.execute('SELECT uid FROM sync_rows WHERE table_name = ? AND row_id = ?', (table, row_id))
+        row = cursor.fetchone()
+        if row:
+            cursor.execute('UPDATE sync_rows SET hlc = ?, origin = ?, seq = ?, deleted = ? WHERE uid = ?',
+                           (clock.tick(), node, batch, int(op == 'D'), row[0]))
+        elif op != 'D':  # rows created and deleted between two runs never existed for peers
+            uid = _initial_uid(cursor, table, row_id) if first_run else uuid.uuid4().hex
+            archive_year = None
+            if table == 'receipts':
+                # Archived before its first stamping
+                cursor.execute('SELECT 1 FROM receipts WHERE id = ?', (row_id,))
+                if cursor.fetchone() is None:
+                    archive_year = db.find_archived_receipt(row_id)
+            cursor.execute('''
+            INSERT INTO sync_rows (uid, table_name, row_id, hlc, origin, seq, archive_year) VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (uid, table, row_id, clock.tick(), node, batch, archive_year))
+    _put_setting(cursor, 'sync_meta_seq', upto)
+    return len(pending)
+
+@db.writes
+def _node_id_op(cursor, renew=False):
+    node = _setting(cursor, 'sync_node_id')
+    if node is None or renew:
+        node = uuid.uuid4().hex[:12]
+        _put_setting(cursor, 'sync_node_id', node)
+    return node
+
+_stamp_local_op = db.writes(_stamp_local)
+
+def _apply(cursor, node, records, sender, watermark, image_paths):
+    """Applies a peer's rows; the (hlc, origin) winner stays. Returns (applied, kept_local)."""
+    _stamp_local(cursor, node)  # local edits made since the last stamp compete too
+    batch = _next_batch(cursor)
+    applied = kept = 0
+    local_ids = {}  # uid -> local row id, for foreign keys within this batch
+    pending_parents = []
+    order = {table: i for i, table in enumerate(SYNC_TABLES)}
+    for rec in sorted(records, key=lambda r: order[r['table']]):
+        table, uid = rec['table'], rec['uid']
+        cursor.execute('SELECT row_id, hlc, origin, archive_year FROM sync_rows WHERE uid = ?', (uid,))
+        local = cursor.fetchone()
+        if local and (local[1], local[2]) >= (rec['hlc'], rec['origin']):
+            kept += 1
+            continue
+        row_id, archive_year = (local[0], local[3]) if local else (None, None)
+        if row_id is not None and archive_year is None:
+            cursor.execute(f'SELECT 1 FROM {table} WHERE id = ?', (row_id,))
+            if cursor.fetchone() is None:
+                row_id = None
+        if rec['deleted']:
+            if archive_year is not None:
+                archive_year = db.write_archived_receipt(cursor, archive_year, row_id, None)
+            elif row_id is not None:
+                cursor.execute(f'DELETE FROM {table} WHERE id = ?', (row_id,))
+        else:
+            data = dict(rec['data'])
+            for column, ref_table in SYNC_TABLES[table].items():
+                ref_uid = data[column]
+                data[column] = _local_id(cursor, local_ids, ref_uid)
+                if ref_uid is not None and data[column] is None and table == 'locations':
+                    pending_parents.append((uid, ref_uid))
+            if table == 'receipts' and rec.get('image_hash'):
+                data['image_path'] = image_paths.get(rec['image_hash'], data['image_path'])
+            columns = data_columns(table)
+            values = [data[c] for c in columns]
+            if archive_year is not None:
+                # Updated where it lives; inserting would duplicate it in the main DB
+                archive_year = db.write_archived_receipt(cursor, archive_year, row_id, {c: data[c] for c in columns})
+            elif row_id is not None:
+                bump = ", version = version + 1" if table in VERSIONED_TABLES else ""
+                cursor.execute(f"UPDATE {table} SET {', '.join(f'{c} = ?' for c in columns)}{bump} WHERE id = ?",
+                               values + [row_id])
+            else:
+                cursor.execute(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", values)
+                row_id = cursor.lastrowid
+            # A stale mapping (tombstone) may still hold this local id
+            cursor.execute('UPDATE sync_rows SET row_id = NULL WHERE table_name = ? AND row_id = ? AND uid != ?',
+                           (table, row_id, uid))
+            local_ids[uid] = row_id
+        cursor.execute('''
+        INSERT INTO sync_rows (uid, table_name, row_id, hlc, origin, seq, deleted, archive_year) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (uid) DO UPDATE SET row_id = excluded.row_id, hlc = excluded.hlc, origin = excluded.origin,
+            seq = excluded.seq, deleted = excluded.deleted, archive_year = excluded.archive_year
+        ''', (uid, table, row_id, rec['hlc'], rec['origin'], batch, int(rec['deleted']), archive_year))
+        applied += 1
+    # Parents that arrived after their children in the same batch
+    for uid, parent_uid in pending_parents:
+        parent_id = _local_id(cursor, local_ids, parent_uid)
+        if parent_id is not None:
+            cursor.execute('UPDATE locations SET parent_id = ? WHERE id = ?', (parent_id, local_ids[uid]))
+    # The writes above are already stamped; keep them out of the next local stamping
+    _put_setting(cursor, 'sync_meta_seq', _changes_seq(cursor))
+    cursor.execute('''
+    INSERT INTO sync_peers (node_id, received_seq, last_sync) VALUES (?, ?, datetime('now'))
+    ON CONFLICT (node_id) DO UPDATE SET received_seq = MAX(received_seq, excluded.received_seq), last_sync = excluded.last_sync
+    ''', (sender, watermark))
+    return applied, kept
+
+_apply_op = db.writes(_apply)
+
+def _archive_years(cursor, uids):
+    years = set()
+    for start in range(0, len(uids), 500):
+        chunk = uids[start:start + 500]
+        cursor.execute(f"SELECT DISTINCT archive_year FROM sync_rows WHERE archive_year IS NOT NULL AND uid IN ({','.join('?' * len(chunk))})", chunk)
+        years.update(year for (year,) in cursor.fetchall())
+    return sorted(years)
+
+def _local_id(cursor, local_ids, uid):
+    if uid is None:
+        return None
+    if uid in local_ids:
+        return local_ids[uid]
+    cursor.execute('SELECT row_id FROM sync_rows WHERE uid = ? AND deleted = 0', (uid,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+def blob_path(h, ext):
+    # Only a sha256 name and a short plain extension, so a peer cannot pick a
+    # path outside uploads/ (separators, '..'); other extensions become .jpg
+    if not BLOB_HASH_RE.fullmatch(h or ''):
+        raise ValueError(f"invalid image hash {h!r}")
+    if not BLOB_EXT_RE.fullmatch(ext or ''):
+        ext = '.jpg'
+    return os.path.join(UPLOAD_DIR, f"{h[:32]}{ext}")
+
+class LocalReplica:
+    """A database file on this machine (image paths are relative to its folder)."""
+    def __init__(self, path):
+        self.path = path
+        self.base_dir = os.path.dirname(os.path.abspath(path))
+        self.blob_paths = {}  # content hash -> image path, from the last export
+        self._node = None
+        db.ensure_db(path)
+
+    def _db(self):
+        return db.using_db(self.path)
+
+    def node_id(self, renew=False):
+        if self._node is None or renew:
+            with self._db():
+                self._node = _node_id_op(renew)
+        return self._node
+
+    def refresh(self):
+        with self._db():
+            return _stamp_local_op(self.node_id())
+
+    def received_seq(self, peer):
+        with self._db():
+            conn = db.get_read_connection()
+            row = conn.execute('SELECT received_seq FROM sync_peers WHERE node_id = ?', (peer,)).fetchone()
+            conn.close()
+        return row[0] if row else 0
+
+    def changes_for(self, peer, since):
+        """Rows stamped after `since` that did not come from `peer`. Returns (records, watermark)."""
+        with self._db():
+            conn = db.get_read_connection()
+            # Archived receipts are sent from their archive files
+            sources = {table: table for table in SYNC_TABLES}
+            sources['receipts'] = db.attach_receipt_archives(conn, db.archived_receipt_years())
+        cursor = conn.cursor()
+        cursor.execute('BEGIN')  # one snapshot for sync_rows and the tables
+        cursor.execute('SELECT COALESCE(MAX(seq), 0) FROM sync_rows')
+        watermark = max(cursor.fetchone()[0], since)
+        cursor.execute('''
+        SELECT uid, table_name, row_id, hlc, origin, deleted FROM sync_rows
+        WHERE seq > ? AND seq <= ? AND origin != ? ORDER BY seq
+        ''', (since, watermark, peer))
+        meta = cursor.fetchall()
+        rows = {table: {} for table in SYNC_TABLES}
+        for table in SYNC_TABLES:
+            ids = [m[2] for m in meta if m[1] == table and not m[5] and m[2] is not None]
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                cursor.execute(f"SELECT id, {', '.join(data_columns(table))} FROM {sources[table]} WHERE id IN ({','.join('?' * len(chunk))})", chunk)
+                for r in cursor.fetchall():
+                    rows[table][r[0]] = dict(zip(data_columns(table), r[1:]))
+        location_uids = self._location_uids(cursor, rows)
+        records = []
+        for uid, table, row_id, hlc, origin, deleted in meta:
+            rec = {'uid': uid, 'table': table, 'hlc': hlc, 'origin': origin, 'deleted': bool(deleted)}
+            if not deleted:
+                data = rows[table].get(row_id)
+                if data is None:
+                    continue  # deleted after the last stamping; the tombstone goes next time
+                for column in SYNC_TABLES[table]:
+                    data[column] = location_uids.get(data[column])
+                rec['data'] = data
+                if table == 'receipts':
+                    rec['image_hash'] = self._image_hash(data['image_path'])
+            records.append(rec)
+        conn.rollback()
+        conn.close()
+        return records, watermark
+
+    def _location_uids(self, cursor, rows):
+        ids = {data[c] for table, by_id in rows.items() for data in by_id.values()
+               for c in SYNC_TABLES[table] if data[c] is not None}
+        uids = {}
+        ids = list(ids)
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            cursor.execute(f"SELECT row_id, uid FROM sync_rows WHERE table_name = 'locations' AND row_id IN ({','.join('?' * len(chunk))})", chunk)
+            uids.update(cursor.fetchall())
+        return uids
+
+    def _image_hash(self, image_path):
+        if not image_path:
+            return None
+        full = os.path.join(self.base_dir, image_path)
+        if not os.path.exists(full):
+            return None
+        h = file_hash(full)
+        self.blob_paths[h] = full
+        return h
+
+    def get_blob(self, h):
+        with open(self.blob_paths[h], 'rb') as f:
+            return f.read()
+
+    def has_blob(self, h, ext):
+        # Received images are stored content-addressed, so a hash maps to one path
+        path = blob_path(h, ext)
+        return path if os.path.exists(os.path.join(self.base_dir, path)) else None
+
+    def put_blob(self, h, ext, data):
+        path = blob_path(h, ext)
+        if hashlib.sha256(data).hexdigest() != h:
+            raise ValueError(f"image content does not match hash {h}")
+        os.makedirs(os.path.join(self.base_dir, UPLOAD_DIR), exist_ok=True)
+        with open(os.path.join(self.base_dir, path), 'wb') as f:
+            f.write(data)
+        return path
+
+    def apply(self, records, sender, watermark, image_paths):
+        node = self.node_id()
+        with self._db():
+            conn = db.get_read_connection()
+            years = _archive_years(conn.cursor(), [rec['uid'] for rec in records if rec['table'] == 'receipts'])
+            conn.close()
+            if not years:
+                return _apply_op(node, records, sender, watermark, image_paths)
+            # Receipts archived here are written in their archive files, which
+            # the writer thread cannot attach
+            with db.writing_receipt_archives(years) as cursor:
+                return _apply(cursor, node, records, sender, watermark, image_paths)
+
+class RemoteReplica:
+    """A database served by `python sync.py serve`, reached over TCP (JSON lines)."""
+    def __init__(self, address, token=None):
+        host, _, port = address.rpartition(':')
+        self.sock = socket.create_connection((host or 'localhost', int(port or DEFAULT_PORT)))
+        self.stream = self.sock.makefile('rwb')
+        self.token = token
+
+    def _call(self, method, *args):
+        request = {'method': method, 'args': _encode(list(args)), 'token': self.token}
+        self.stream.write(json.dumps(request, ensure_ascii=False).encode('utf-8') + b'\n')
+        self.stream.flush()
+        response = json.loads(self.stream.readline())
+        if 'error' in response:
+            raise RuntimeError(f"remote {method} failed: {response['error']}")
+        return _decode(response['result'])
+
+    def __getattr__(self, method):
+        if method not in RPC_METHODS:
+            raise AttributeError(method)
+        return lambda *args: self._call(method, *args)
+
+    def close(self):
+        self.stream.close()
+        self.sock.close()
+
+RPC_METHODS = {'node_id', 'refresh', 'received_seq', 'changes_for', 'get_blob', 'has_blob', 'put_blob', 'apply'}
+
+def _encode(value):
+    if isinstance(value, bytes):
+        return {'__b64__': base64.b64encode(value).decode('ascii')}
+    if isinstance(value, (list, tuple)):
+        return [_encode(v) for v in value]
+    return value
+
+def _decode(value):
+    if isinstance(value, dict) and '__b64__' in value:
+        return base64.b64decode(value['__b64__'])
+    if isinstance(value, list):
+        return [_decode(v) for v in value]
+    return value
+
+def is_loopback(host):
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, None)}
+    except socket.gaierror:
+        return False
+    return all(ipaddress.ip_address(address.split('%')[0]).is_loopback for address in addresses)
+
+def serve(path, host, port, token=None):
+    if not token and not is_loopback(host):
+        raise SystemExit(f"Refusing to serve on {host or 'all interfaces'} without a token; "
+                         "set MYCATALOG_SYNC_TOKEN on both ends.")
+    replica = LocalReplica(path)
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                request = json.loads(line)
+                try:
+                    if token and not hmac.compare_digest(str(request.get('token') or '').encode('utf-8'), token.encode('utf-8')):
+                        raise PermissionError("invalid sync token")
+                    if request['method'] not in RPC_METHODS:
+                        raise ValueError(f"unknown method {request['method']}")
+                    result = getattr(replica, request['method'])(*_decode(request['args']))
+                    response = {'result': _encode(result)}
+                except Exception as e:
+                    response = {'error': f"{type(e).__name__}: {e}"}
+                self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8') + b'\n')
+                self.wfile.flush()
+
+    with socketserver.TCPServer((host, port), Handler) as server:
+        print(f"Serving {path} for sync on {host}:{port} (node {replica.node_id()}).")
+        server.serve_forever()
+
+def _transfer_images(records, source, target):
+    """Copies images the target lacks. Returns ({hash: target path}, images sent)."""
+    paths, sent = {}, 0
+    for rec in records:
+        h = rec.get('image_hash')
+        if not h or h in paths:
+            continue
+        ext = os.path.splitext(rec['data']['image_path'])[1] or '.jpg'
+        path = target.has_blob(h, ext)
+        if path is None:
+            path = target.put_blob(h, ext, source.get_blob(h))
+            sent += 1
+        paths[h] = path
+    return paths, sent
+
+def sync(a, b):
+    """Two-way delta sync. Returns a summary dict per direction."""
+    a.refresh()
+    b.refresh()
+    node_a, node_b = a.node_id(), b.node_id()
+    if node_a == node_b:
+        raise SystemExit(f"Both databases are node {node_a} (a copied file?). "
+                         "Run 'python sync.py new-node --db COPY.db' on the copy first.")
+    to_b, watermark_a = a.changes_for(node_b, b.received_seq(node_a))
+    to_a, watermark_b = b.changes_for(node_a, a.received_seq(node_b))
+    paths_b, images_to_b = _transfer_images(to_b, a, b)
+    paths_a, images_to_a = _transfer_images(to_a, b, a)
+    applied_b, kept_b = b.apply(to_b, node_a, watermark_a, paths_b)
+    applied_a, kept_a = a.apply(to_a, node_b, watermark_b, paths_a)
+    return {
+        f"{node_a} -> {node_b}": {'sent': len(to_b), 'applied': applied_b, 'kept_local': kept_b, 'images': images_to_b},
+        f"{node_b} -> {node_a}": {'sent': len(to_a), 'applied': applied_a, 'kept_local': kept_a, 'images': images_to_a},
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="MyCatalog delta sync")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p_sync = sub.add_parser('sync', help="sync two databases")
+    p_sync.add_argument('db_a')
+    p_sync.add_argument('db_b', nargs='?')
+    p_sync.add_argument('--remote', help="HOST:PORT of a 'sync.py serve' process instead of db_b")
+    p_serve = sub.add_parser('serve', help="serve a database for remote sync")
+    p_serve.add_argument('--db', default=db.DB_PATH)
+    p_serve.add_argument('--host', default='127.0.0.1')
+    p_serve.add_argument('--port', type=int, default=DEFAULT_PORT)
+    p_node = sub.add_parser('new-node', help="give a copied database its own node id")
+    p_node.add_argument('--db', default=db.DB_PATH)
+    args = parser.parse_args()
+    token = os.environ.get('MYCATALOG_SYNC_TOKEN')
+
+    if args.command == 'serve':
+        serve(args.db, args.host, args.port, token)
+    elif args.command == 'new-node':
+        print(f"{args.db} is now node {LocalReplica(args.db).node_id(renew=True)}.")
+    else:
+        if bool(args.db_b) == bool(args.remote):
+            parser.error("give either a second database file or --remote")
+        peer = RemoteReplica(args.remote, token) if args.remote else LocalReplica(args.db_b)
+        start = time.perf_counter()
+        for direction, stats in sync(LocalReplica(args.db_a), peer).items():
+            print(f"{direction}: {stats['sent']} rows sent, {stats['applied']} applied, "
+                  f"{stats['kept_local']} kept (newer local edit), {stats['images']} images")
+        print(f"Synced in {time.perf_counter() - start:.2f}s.")